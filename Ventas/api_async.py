@@ -0,0 +1,307 @@
+# ========================================
+# API ASÍNCRONA - Carloszerpav
+# ========================================
+# Las APIs JSON que más se consultan desde otros programas (tableros,
+# hojas de cálculo que refrescan cada minuto) se sirven también desde un
+# proceso asyncio aparte. Con los workers de gunicorn cada petición ocupa
+# un hilo mientras espera a la base; aquí una espera no bloquea a nadie.
+#
+#   GET /api/estadisticas
+#   GET /api/ventas
+#   GET /api/estadisticas-periodo?fecha_inicio=...&fecha_fin=...
+#
+# - Mismos modelos y mismos cálculos que app.py (consulta_ventas,
+#   resumir_estadisticas, resumir_periodo); solo cambia el engine:
+#   aiosqlite en desarrollo, asyncpg con PostgreSQL.
+# - Pool acotado (API_ASYNC_POOL) y un límite de peticiones en la base a
+#   la vez; si la cola de espera se llena responde 503 en vez de acumular.
+# - La sesión es la misma cookie firmada de Flask: hace falta el mismo
+#   SECRET_KEY que en la app principal.
+#
+# Uso (desde la carpeta Ventas; requiere uvicorn, aiosqlite o asyncpg):
+#     uvicorn api_async:app --port 8001
+#
+# En Railway corre como un servicio aparte (railway.api.json) con su propio
+# dominio: los clientes usan ese dominio como URL base para estas rutas.
+
+import asyncio
+import logging
+import os
+import time
+import uuid
+from contextlib import asynccontextmanager
+from datetime import datetime
+from urllib.parse import parse_qs
+
+from itsdangerous import BadSignature
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import TimeoutError as TimeoutPool
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from werkzeug.http import parse_cookie
+
+from compresion import comprimir, elegir_codificacion
+
+import app as ventas
+
+log_api = logging.getLogger('ventas.api_async')
+log_peticiones = logging.getLogger('ventas.peticiones')
+
+# Controladores que reemplazan al de la URL síncrona
+CONTROLADORES_ASYNC = {
+    'sqlite': 'sqlite+aiosqlite',
+    'postgresql': 'postgresql+asyncpg',
+}
+
+
+def url_asincrona(url):
+    """
+    Convierte la URL de la app a su equivalente asyncio
+    Ej.: 'sqlite:///ventas.db' -> 'sqlite+aiosqlite:///ventas.db'
+         'postgresql://u:p@host/db?sslmode=require' -> 'postgresql+asyncpg://u:p@host/db?ssl=require'
+    """
+    url = make_url(url)
+    motor = url.get_backend_name()
+    if motor not in CONTROLADORES_ASYNC:
+        raise ValueError(f"La API asíncrona no soporta la base '{motor}'")
+    url = url.set(drivername=CONTROLADORES_ASYNC[motor])
+    if motor == 'postgresql' and 'sslmode' in url.query:
+        # asyncpg no entiende sslmode (parámetro de libpq); su equivalente es ssl
+        url = url.difference_update_query(['sslmode']).update_query_dict({'ssl': url.query['sslmode']})
+    return url
+
+
+class Saturado(Exception):
+    """La cola de espera de la API está llena"""
+
+
+class LimiteConcurrencia:
+    """
+    Deja pasar a la base hasta `maximo` peticiones a la vez; las demás esperan su turno
+    Args:
+        maximo (int): Peticiones consultando a la vez (no más que las conexiones del pool)
+        cola_maxima (int): Peticiones que pueden esperar; la siguiente recibe 503 enseguida
+    """
+
+    def __init__(self, maximo, cola_maxima):
+        self.maximo = maximo
+        self.cola_maxima = cola_maxima
+        self.en_curso = 0
+        self.esperando = 0
+        self.rechazadas = 0
+        self._semaforo = None
+
+    @asynccontextmanager
+    async def turno(self):
+        # El semáforo se crea dentro del loop de uvicorn (Python 3.9 lo ata al loop al crearlo)
+        if self._semaforo is None:
+            self._semaforo = asyncio.Semaphore(self.maximo)
+        if self._semaforo.locked() and self.esperando >= self.cola_maxima:
+            self.rechazadas += 1
+            raise Saturado()
+        self.esperando += 1
+        try:
+            await self._semaforo.acquire()
+        finally:
+            self.esperando -= 1
+        self.en_curso += 1
+        try:
+            yield
+        finally:
+            self.en_curso -= 1
+            self._semaforo.release()
+
+
+class ApiAsincrona:
+    """
+    Aplicación ASGI con las rutas JSON de solo lectura
+    Args:
+        url (str): URL de la base. Si es None, la de la app convertida con url_asincrona
+        tamano_pool (int): Conexiones abiertas como máximo
+        pool_extra (int): Conexiones extra en picos (se cierran al devolverse)
+        espera_pool (float): Segundos esperando una conexión antes de responder 503
+        concurrencia (int): Peticiones en la base a la vez. Si es None, tamano_pool + pool_extra
+        cola_maxima (int): Peticiones esperando turno antes de rechazar con 503
+    """
+
+    def __init__(self, url=None, tamano_pool=10, pool_extra=0, espera_pool=10.0,
+                 concurrencia=None, cola_maxima=100):
+        if ventas.particiones.activa:
+            # Cada inquilino tiene su base; esta API solo conoce la principal
+            raise RuntimeError("La API asíncrona no soporta PARTICIONES=1")
+        self.url = url_asincrona(url or ventas.app.config['SQLALCHEMY_DATABASE_URI'])
+        self.engine = create_async_engine(
+            self.url,
+            # aiosqlite usa NullPool por defecto (una conexión y un hilo por consulta): se acota igual
+            poolclass=AsyncAdaptedQueuePool,
+            pool_size=tamano_pool,
+            max_overflow=pool_extra,
+            pool_timeout=espera_pool,
+            pool_recycle=300,
+        )
+        self.sesiones = async_sessionmaker(self.engine, class_=AsyncSession, expire_on_commit=False)
+        self.limite = LimiteConcurrencia(concurrencia or tamano_pool + pool_extra, cola_maxima)
+
+        # Misma cookie de sesión que Flask
+        self.serializador = ventas.app.session_interface.get_signing_serializer(ventas.app)
+        self.nombre_cookie = ventas.app.config['SESSION_COOKIE_NAME']
+        self.duracion_sesion = int(ventas.app.permanent_session_lifetime.total_seconds())
+        if not os.environ.get('SECRET_KEY'):
+            log_api.warning("Sin SECRET_KEY: las sesiones de la app principal no serán válidas aquí",
+                            extra={'evento': 'api_async_sin_secret_key'})
+
+        self.compresion = os.environ.get('COMPRESION', '1') != '0'
+        self.compresion_minimo = int(os.environ.get('COMPRESION_MINIMO', 500))
+
+        self.rutas = {
+            '/api/estadisticas': self.estadisticas,
+            '/api/ventas': self.lista_ventas,
+            '/api/estadisticas-periodo': self.estadisticas_periodo,
+        }
+
+    # ----- Rutas -----
+
+    async def estadisticas(self, sesion, usuario_email, parametros):
+        """Igual que /api/estadisticas de app.py (obtener_estadisticas)"""
+        ventas_db = (await sesion.execute(ventas.consulta_ventas(ventas.Venta, usuario_email))).scalars().all()
+        total_archivadas = (await sesion.execute(ventas.consulta_total_archivadas(usuario_email))).scalar()
+        return 200, ventas.resumir_estadisticas([v.to_dict() for v in ventas_db], total_archivadas)
+
+    async def lista_ventas(self, sesion, usuario_email, parametros):
+        """Igual que /api/ventas de app.py: activas y cerradas más las archivadas"""
+        ventas_db = (await sesion.execute(ventas.consulta_ventas(ventas.Venta, usuario_email))).scalars().all()
+        archivadas = (await sesion.execute(
+            ventas.consulta_ventas(ventas.VentaArchivada, usuario_email))).scalars().all()
+        return 200, [v.to_dict() for v in ventas_db] + [v.to_dict() for v in archivadas]
+
+    async def estadisticas_periodo(self, sesion, usuario_email, parametros):
+        """Igual que /api/estadisticas-periodo de app.py (obtener_estadisticas_por_periodo)"""
+        fecha_inicio = parametros.get('fecha_inicio', [''])[0]
+        fecha_fin = parametros.get('fecha_fin', [''])[0]
+        try:
+            datetime.strptime(fecha_inicio, "%Y-%m-%d")
+            datetime.strptime(fecha_fin, "%Y-%m-%d")
+        except ValueError:
+            return 400, {'error': 'Fechas requeridas'}
+        todas_ventas = (await sesion.execute(ventas.consulta_ventas(ventas.Venta, usuario_email))).scalars().all()
+        todas_ventas += (await sesion.execute(
+            ventas.consulta_archivadas_periodo(usuario_email, fecha_inicio, fecha_fin))).scalars().all()
+        return 200, ventas.resumir_periodo(todas_ventas, fecha_inicio, fecha_fin)
+
+    # ----- ASGI -----
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._ciclo_de_vida(receive, send)
+            return
+        if scope['type'] != 'http':
+            return
+
+        inicio = time.perf_counter()
+        encabezados = {nombre.decode('latin-1').lower(): valor.decode('latin-1')
+                       for nombre, valor in scope.get('headers', [])}
+        id_peticion = encabezados.get('x-request-id') or uuid.uuid4().hex[:16]
+        ruta = scope['path']
+        usuario_email = None
+
+        manejador = self.rutas.get(ruta)
+        if manejador is None:
+            estado, cuerpo = 404, {'error': 'Ruta no encontrada'}
+        elif scope['method'] not in ('GET', 'HEAD'):
+            estado, cuerpo = 405, {'error': 'Método no permitido'}
+        else:
+            usuario_email = self.usuario_de_cookies(encabezados.get('cookie', ''))
+            if usuario_email is None:
+                estado, cuerpo = 401, {'error': 'Sesión no iniciada'}
+            else:
+                parametros = parse_qs(scope.get('query_string', b'').decode('latin-1'))
+                estado, cuerpo = await self._atender(manejador, usuario_email, parametros)
+
+        await self._responder(send, scope['method'], estado, cuerpo, encabezados, id_peticion)
+
+        nivel = logging.WARNING if estado >= 500 else logging.INFO
+        log_peticiones.log(nivel, "Petición atendida", extra={
+            'evento': 'peticion',
+            'api': 'async',
+            'estado': estado,
+            'id_peticion': id_peticion,
+            'ruta': ruta,
+            'metodo': scope['method'],
+            'usuario': usuario_email,
+            'duracion_ms': round((time.perf_counter() - inicio) * 1000, 2),
+            'en_espera': self.limite.esperando
+        })
+
+    async def _atender(self, manejador, usuario_email, parametros):
+        try:
+            async with self.limite.turno():
+                async with self.sesiones() as sesion:
+                    return await manejador(sesion, usuario_email, parametros)
+        except (Saturado, TimeoutPool):
+            return 503, {'error': 'Servidor ocupado, reintenta en unos segundos'}
+        except Exception:
+            log_api.exception("Error en la API asíncrona", extra={'evento': 'api_async_error'})
+            return 500, {'error': 'Error interno'}
+
+    def usuario_de_cookies(self, encabezado_cookie):
+        """
+        Email del usuario de la cookie de sesión de Flask
+        Returns:
+            str: Email o None si no hay sesión válida (como login_required)
+        """
+        valor = parse_cookie(encabezado_cookie).get(self.nombre_cookie)
+        if not valor:
+            return None
+        try:
+            datos = self.serializador.loads(valor, max_age=self.duracion_sesion)
+        except BadSignature:
+            return None
+        # Flask-Login marca la sesión con _user_id; load_user lee los datos de 'user'
+        if not datos.get('_user_id'):
+            return None
+        return (datos.get('user') or {}).get('email')
+
+    async def _responder(self, send, metodo, estado, cuerpo, encabezados, id_peticion):
+        # Mismo JSON que jsonify (claves ordenadas, compacto, salto de línea final)
+        datos = (ventas.app.json.dumps(cuerpo, separators=(',', ':')) + '\n').encode('utf-8')
+        respuesta = [
+            (b'content-type', b'application/json'),
+            (b'x-request-id', id_peticion.encode('latin-1')),
+        ]
+        if estado == 503:
+            respuesta.append((b'retry-after', b'1'))
+        if self.compresion and len(datos) >= self.compresion_minimo:
+            codificacion = elegir_codificacion(encabezados.get('accept-encoding', ''))
+            if codificacion:
+                datos = comprimir(datos, codificacion)
+                respuesta += [(b'content-encoding', codificacion.encode()), (b'vary', b'Accept-Encoding')]
+        respuesta.append((b'content-length', str(len(datos)).encode()))
+        await send({'type': 'http.response.start', 'status': estado, 'headers': respuesta})
+        await send({'type': 'http.response.body', 'body': b'' if metodo == 'HEAD' else datos})
+
+    async def _ciclo_de_vida(self, receive, send):
+        while True:
+            mensaje = await receive()
+            if mensaje['type'] == 'lifespan.startup':
+                log_api.info("API asíncrona lista", extra={
+                    'evento': 'api_async_inicio',
+                    'base': self.url.render_as_string(hide_password=True),
+                    'pool': self.engine.pool.size(),
+                    'concurrencia': self.limite.maximo
+                })
+                await send({'type': 'lifespan.startup.complete'})
+            elif mensaje['type'] == 'lifespan.shutdown':
+                await self.engine.dispose()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+
+# Instancia que arranca uvicorn; se configura por variables de entorno
+app = ApiAsincrona(
+    url=os.environ.get('API_ASYNC_DATABASE_URL') or None,
+    tamano_pool=int(os.environ.get('API_ASYNC_POOL', 10)),
+    pool_extra=int(os.environ.get('API_ASYNC_POOL_EXTRA', 0)),
+    espera_pool=float(os.environ.get('API_ASYNC_POOL_ESPERA', 10)),
+    concurrencia=int(os.environ.get('API_ASYNC_CONCURRENCIA', 0)) or None,
+    cola_maxima=int(os.environ.get('API_ASYNC_COLA', 100))
+)
@@ -1,16 +1,56 @@
-from flask import Flask, request, redirect, url_for, render_template, jsonify, session
+from flask import Flask, Response, request, redirect, url_for, render_template, jsonify, session, g, abort, send_file
 from flask_login import LoginManager, UserMixin, login_user, login_required, logout_user, current_user
 from authlib.integrations.flask_client import OAuth
 from flask_sqlalchemy import SQLAlchemy
-from datetime import datetime
+import click
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
 import json
+import logging
 import os
+import re
 import secrets
+import tempfile
+import threading
+import time
+import unicodedata
+import uuid
+
+from markupsafe import Markup
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.schema import CreateIndex, CreateTable
+
+from cache_fragmentos import CacheFragmentos
+from compresion import CompresionMiddleware
+from contexto_datos import contexto_datos
+from eventos import BusEventos, flujo_sse
+from perfilador import Perfilador
+from registro import configurar_registro
+from replicas import SesionEnrutada, enrutador, marcar_escritura, solo_lectura
+from particiones import particiones, url_sqlite_por_defecto
 
 app = Flask(__name__)
 # Clave secreta: usar variable de entorno en producción, generar aleatoria en desarrollo
 app.secret_key = os.environ.get('SECRET_KEY', secrets.token_hex(16))
 
+# Logs en JSON a través de una cola: las peticiones nunca esperan a stdout
+# Niveles por módulo: LOG_NIVELES="ventas.auth=DEBUG,ventas.peticiones=WARNING"
+# Muestreo de eventos de mucho volumen: LOG_MUESTREO="ventas.peticiones=0.1"
+configurar_registro(
+    nivel=os.environ.get('LOG_NIVEL', 'INFO'),
+    niveles_modulo=os.environ.get('LOG_NIVELES', ''),
+    muestreo=os.environ.get('LOG_MUESTREO', 'ventas.peticiones=0.1')
+)
+log_ventas = logging.getLogger('ventas.ventas')
+log_pagos = logging.getLogger('ventas.pagos')
+log_cierre = logging.getLogger('ventas.cierre')
+log_auth = logging.getLogger('ventas.auth')
+log_peticiones = logging.getLogger('ventas.peticiones')
+log_eventos = logging.getLogger('ventas.eventos')
+log_trabajos = logging.getLogger('ventas.trabajos')
+log_datos = logging.getLogger('ventas.datos')
+log_perfil = logging.getLogger('ventas.perfil')
+
 # Configurar HTTPS en producción (Railway)
 # Railway pasa el tráfico a través de un proxy que maneja HTTPS
 # Si está en producción (no localhost), usar HTTPS
@@ -21,6 +61,19 @@ if os.environ.get('RAILWAY_ENVIRONMENT') or os.environ.get('RAILWAY_ENVIRONMENT_
     from werkzeug.middleware.proxy_fix import ProxyFix
     app.wsgi_app = ProxyFix(app.wsgi_app, x_proto=1, x_host=1)
 
+# Comprimir HTML y JSON (gzip/brotli/zstd según lo que acepte el navegador)
+# Se puede desactivar con COMPRESION=0, por ejemplo si el proxy ya comprime
+if os.environ.get('COMPRESION', '1') != '0':
+    app.wsgi_app = CompresionMiddleware(
+        app.wsgi_app,
+        tamano_minimo=int(os.environ.get('COMPRESION_MINIMO', 500)),
+        niveles={
+            'gzip': int(os.environ.get('COMPRESION_NIVEL_GZIP', 6)),
+            'br': int(os.environ.get('COMPRESION_NIVEL_BR', 5)),
+            'zstd': int(os.environ.get('COMPRESION_NIVEL_ZSTD', 3)),
+        }
+    )
+
 # ========================================
 # CONFIGURACIÓN DE BASE DE DATOS
 # ========================================
@@ -34,8 +87,31 @@ if DATABASE_URL.startswith('postgres://'):
 app.config['SQLALCHEMY_DATABASE_URI'] = DATABASE_URL
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 
+# Réplicas de solo lectura (opcional): DATABASE_REPLICA_URLS="postgresql://...,postgresql://..."
+# Las rutas @solo_lectura mandan sus SELECT a una réplica; las escrituras siempre van a la principal
+REPLICAS = {}
+# Segundos máximos para conectar a una réplica: una caída no debe colgar la petición
+REPLICA_TIEMPO_CONEXION = int(os.environ.get('REPLICA_TIEMPO_CONEXION', 2))
+for i, url in enumerate(u.strip() for u in os.environ.get('DATABASE_REPLICA_URLS', '').split(',')):
+    if url:
+        if url.startswith('postgres://'):
+            url = url.replace('postgres://', 'postgresql://', 1)
+        opciones = {'url': url, 'pool_timeout': REPLICA_TIEMPO_CONEXION}
+        if url.startswith('postgresql'):
+            opciones['connect_args'] = {'connect_timeout': REPLICA_TIEMPO_CONEXION}
+        REPLICAS[f'replica_{i}'] = opciones
+app.config['SQLALCHEMY_BINDS'] = REPLICAS
+
 # Inicializar SQLAlchemy
-db = SQLAlchemy(app)
+db = SQLAlchemy(app, session_options={'class_': SesionEnrutada})
+enrutador.configurar(
+    list(REPLICAS),
+    # Segundos que un usuario lee de la principal después de escribir (leer lo propio)
+    ventana_escritura=float(os.environ.get('REPLICA_VENTANA_ESCRITURA', 5)),
+    intervalo_salud=float(os.environ.get('REPLICA_INTERVALO_SALUD', 10)),
+    consulta_salud='SELECT 1 FROM version_datos LIMIT 1',
+    tiempo_maximo_salud=REPLICA_TIEMPO_CONEXION
+)
 
 # Configuración de Flask-Login
 login_manager = LoginManager()
@@ -53,7 +129,8 @@ GOOGLE_CLIENT_ID = os.environ.get('GOOGLE_CLIENT_ID', '')
 GOOGLE_CLIENT_SECRET = os.environ.get('GOOGLE_CLIENT_SECRET', '')
 
 if not GOOGLE_CLIENT_ID or not GOOGLE_CLIENT_SECRET:
-    print("⚠️ ADVERTENCIA: GOOGLE_CLIENT_ID y GOOGLE_CLIENT_SECRET deben estar configuradas como variables de entorno")
+    log_auth.warning("GOOGLE_CLIENT_ID y GOOGLE_CLIENT_SECRET deben estar configuradas como variables de entorno",
+                     extra={'evento': 'oauth_sin_configurar'})
 
 google = oauth.register(
     name='google',
@@ -87,10 +164,69 @@ def load_user(user_id):
         )
     return None
 
+# ========================================
+# REGISTRO DE PETICIONES
+# ========================================
+# Cada petición recibe un id (o reutiliza el X-Request-ID del proxy) que
+# aparece en todos sus logs y vuelve en la respuesta.
+
+@app.before_request
+def iniciar_registro_peticion():
+    g.id_peticion = request.headers.get('X-Request-ID') or uuid.uuid4().hex[:16]
+    g.inicio_peticion = time.perf_counter()
+
+@app.after_request
+def registrar_peticion(respuesta):
+    if g.get('hubo_escritura'):
+        # Sus próximas lecturas irán a la principal durante la ventana de escritura
+        marcar_escritura()
+    if 'id_peticion' in g:
+        respuesta.headers['X-Request-ID'] = g.id_peticion
+    nivel = logging.WARNING if respuesta.status_code >= 500 else logging.INFO
+    extra = {'evento': 'peticion', 'estado': respuesta.status_code}
+    memoria = contexto_datos.resumen_peticion()
+    if memoria:
+        # Cargas que se reutilizaron en la misma petición (ver contexto_datos.py)
+        extra.update(memo_aciertos=memoria['aciertos'], memo_fallos=memoria['fallos'])
+    log_peticiones.log(nivel, "Petición atendida", extra=extra)
+    return respuesta
+
 # ========================================
 # MODELOS DE BASE DE DATOS
 # ========================================
 
+class Cliente(db.Model):
+    """Cliente de un usuario con sus totales acumulados (se mantienen en cada venta, pago y eliminación)"""
+    __tablename__ = 'cliente'
+
+    id = db.Column(db.Integer, primary_key=True)
+    usuario_email = db.Column(db.String(255), nullable=False)
+    nombre = db.Column(db.String(255), nullable=False)  # Como se escribió la primera vez
+    clave = db.Column(db.String(255), nullable=False)  # Nombre normalizado (ver normalizar_cliente)
+    cantidad_ventas = db.Column(db.Integer, nullable=False, default=0)
+    total_vendido = db.Column(db.Numeric(12, 2), nullable=False, default=0)
+    total_pagado = db.Column(db.Numeric(12, 2), nullable=False, default=0)
+    saldo_pendiente = db.Column(db.Numeric(12, 2), nullable=False, default=0)
+    creado_en = db.Column(db.String(19), nullable=False)  # YYYY-MM-DD HH:MM
+
+    # Un cliente por nombre normalizado y usuario; el segundo índice sirve el top de deudores
+    __table_args__ = (
+        db.UniqueConstraint('usuario_email', 'clave', name='unique_cliente_clave'),
+        db.Index('ix_cliente_usuario_saldo', 'usuario_email', 'saldo_pendiente'),
+    )
+
+    def to_dict(self):
+        """Convierte el cliente a diccionario"""
+        return {
+            'id': self.id,
+            'nombre': self.nombre,
+            'cantidad_ventas': self.cantidad_ventas,
+            'total_vendido': float(self.total_vendido),
+            'total_pagado': float(self.total_pagado),
+            'saldo_pendiente': float(self.saldo_pendiente),
+            'creado_en': self.creado_en
+        }
+
 class Venta(db.Model):
     """Modelo de Venta en la base de datos"""
     __tablename__ = 'venta'
@@ -98,6 +234,7 @@ class Venta(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     usuario_email = db.Column(db.String(255), nullable=False, index=True)
     cliente = db.Column(db.String(255), nullable=False)
+    cliente_id = db.Column(db.Integer, db.ForeignKey('cliente.id'), nullable=True, index=True)
     valor_total = db.Column(db.Numeric(10, 2), nullable=False)
     abono = db.Column(db.Numeric(10, 2), nullable=False, default=0)
     saldo_pendiente = db.Column(db.Numeric(10, 2), nullable=False)
@@ -106,16 +243,28 @@ class Venta(db.Model):
     estado = db.Column(db.String(20), nullable=False, default='Activa')
     incluida_en_estadisticas = db.Column(db.Boolean, nullable=False, default=True)
     mes_cierre = db.Column(db.String(7), nullable=True)  # YYYY-MM
+    cambio = db.Column(db.Integer, nullable=True)  # Versión de datos del usuario en la última modificación
     
     # Relaciones
     pagos = db.relationship('Pago', backref='venta', lazy=True, cascade='all, delete-orphan')
     rubros = db.relationship('VentaRubro', backref='venta', lazy=True, cascade='all, delete-orphan')
     
+    # Índices para las consultas del día a día (ventas activas / cerradas) y la sincronización delta
+    __table_args__ = (
+        db.Index('ix_venta_usuario_estado', 'usuario_email', 'estado'),
+        db.Index('ix_venta_usuario_cambio', 'usuario_email', 'cambio'),
+        # Cubre el reporte de antigüedad de saldos sin leer la tabla
+        db.Index('ix_venta_antiguedad', 'usuario_email', 'estado', 'fecha', 'saldo_pendiente'),
+        # SQLite no reutiliza IDs ya entregados (las ventas archivadas conservan el suyo)
+        {'sqlite_autoincrement': True},
+    )
+    
     def to_dict(self):
         """Convierte la venta a diccionario para compatibilidad con código existente"""
         return {
             'id': self.id,
             'cliente': self.cliente,
+            'cliente_id': self.cliente_id,
             'valor_total': float(self.valor_total),
             'abono': float(self.abono),
             'saldo_pendiente': float(self.saldo_pendiente),
@@ -134,10 +283,14 @@ class Pago(db.Model):
     __tablename__ = 'pago'
     
     id = db.Column(db.Integer, primary_key=True)
-    venta_id = db.Column(db.Integer, db.ForeignKey('venta.id', ondelete='CASCADE'), nullable=False)
+    venta_id = db.Column(db.Integer, db.ForeignKey('venta.id', ondelete='CASCADE'), nullable=False, index=True)
     monto = db.Column(db.Numeric(10, 2), nullable=False)
     fecha = db.Column(db.String(19), nullable=False)  # YYYY-MM-DD HH:MM
     tipo = db.Column(db.String(50), nullable=False, default='Abono')
+    cambio = db.Column(db.Integer, nullable=True)  # Versión de datos del usuario al registrarse
+    
+    # Último pago de cada venta (antigüedad de saldos) directo desde el índice
+    __table_args__ = (db.Index('ix_pago_venta_fecha', 'venta_id', 'fecha'), {'sqlite_autoincrement': True})
     
     def to_dict(self):
         """Convierte el pago a diccionario"""
@@ -157,7 +310,145 @@ class VentaRubro(db.Model):
     rubro = db.Column(db.String(50), nullable=False)
     
     # Índice único para evitar duplicados
-    __table_args__ = (db.UniqueConstraint('venta_id', 'rubro', name='unique_venta_rubro'),)
+    __table_args__ = (db.UniqueConstraint('venta_id', 'rubro', name='unique_venta_rubro'), {'sqlite_autoincrement': True})
+
+class VersionDatos(db.Model):
+    """Contador que sube cada vez que cambian los datos de un usuario (invalida la caché de fragmentos)"""
+    __tablename__ = 'version_datos'
+
+    usuario_email = db.Column(db.String(255), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+
+class VentaEliminada(db.Model):
+    """Lápida de una venta eliminada, para que la sincronización delta la propague"""
+    __tablename__ = 'venta_eliminada'
+
+    id = db.Column(db.Integer, primary_key=True)
+    usuario_email = db.Column(db.String(255), nullable=False)
+    venta_id = db.Column(db.Integer, nullable=False)
+    cambio = db.Column(db.Integer, nullable=False)
+    eliminada_en = db.Column(db.String(19), nullable=False)  # YYYY-MM-DD HH:MM
+
+    __table_args__ = (db.Index('ix_venta_eliminada_usuario_cambio', 'usuario_email', 'cambio'),)
+
+class OperacionSincronizada(db.Model):
+    """Operación hecha sin conexión que ya se aplicó; su clave evita aplicarla dos veces"""
+    __tablename__ = 'operacion_sincronizada'
+
+    id = db.Column(db.Integer, primary_key=True)
+    usuario_email = db.Column(db.String(255), nullable=False)
+    clave = db.Column(db.String(100), nullable=False)  # Generada en el navegador al encolarla
+    tipo = db.Column(db.String(20), nullable=False)  # agregar, pago
+    resultado = db.Column(db.Text, nullable=True)  # JSON con lo que se respondió la primera vez
+    creado_en = db.Column(db.String(19), nullable=False)  # YYYY-MM-DD HH:MM:SS
+
+    __table_args__ = (db.UniqueConstraint('usuario_email', 'clave', name='unique_operacion_clave'),)
+
+class Evento(db.Model):
+    """Evento de cambio para las pestañas conectadas por SSE (se borra pasada la retención)"""
+    __tablename__ = 'evento'
+
+    id = db.Column(db.Integer, primary_key=True)
+    usuario_email = db.Column(db.String(255), nullable=False)
+    tipo = db.Column(db.String(50), nullable=False)
+    datos = db.Column(db.Text, nullable=False)  # JSON
+    creado_en = db.Column(db.String(19), nullable=False)  # YYYY-MM-DD HH:MM:SS
+
+    __table_args__ = (db.Index('ix_evento_usuario_id', 'usuario_email', 'id'),)
+
+# ========================================
+# TABLAS DE ARCHIVO (ventas frías)
+# ========================================
+# Las ventas cerradas y excluidas con más antigüedad que la retención se
+# mueven aquí desde venta/pago/venta_rubro. Conservan su ID original, así
+# que los listados y el historial siguen funcionando igual.
+
+class VentaArchivada(db.Model):
+    """Venta cerrada y excluida que ya salió de la tabla principal"""
+    __tablename__ = 'venta_archivada'
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    usuario_email = db.Column(db.String(255), nullable=False, index=True)
+    cliente = db.Column(db.String(255), nullable=False)
+    cliente_id = db.Column(db.Integer, nullable=True, index=True)
+    valor_total = db.Column(db.Numeric(10, 2), nullable=False)
+    abono = db.Column(db.Numeric(10, 2), nullable=False, default=0)
+    saldo_pendiente = db.Column(db.Numeric(10, 2), nullable=False)
+    fecha = db.Column(db.String(10), nullable=False)  # YYYY-MM-DD
+    fecha_registro = db.Column(db.String(19), nullable=False)  # YYYY-MM-DD HH:MM
+    estado = db.Column(db.String(20), nullable=False, default='Cerrada')
+    incluida_en_estadisticas = db.Column(db.Boolean, nullable=False, default=False)
+    mes_cierre = db.Column(db.String(7), nullable=True)  # YYYY-MM
+    archivada_en = db.Column(db.String(19), nullable=False)  # YYYY-MM-DD HH:MM
+
+    # Mismos nombres que en Venta para reutilizar to_dict
+    pagos = db.relationship('PagoArchivado', backref='venta', lazy=True, cascade='all, delete-orphan')
+    rubros = db.relationship('VentaRubroArchivado', backref='venta', lazy=True, cascade='all, delete-orphan')
+
+    to_dict = Venta.to_dict
+
+class PagoArchivado(db.Model):
+    """Pago de una venta archivada"""
+    __tablename__ = 'pago_archivado'
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    venta_id = db.Column(db.Integer, db.ForeignKey('venta_archivada.id', ondelete='CASCADE'), nullable=False, index=True)
+    monto = db.Column(db.Numeric(10, 2), nullable=False)
+    fecha = db.Column(db.String(19), nullable=False)  # YYYY-MM-DD HH:MM
+    tipo = db.Column(db.String(50), nullable=False, default='Abono')
+
+    to_dict = Pago.to_dict
+
+class VentaRubroArchivado(db.Model):
+    """Rubro de una venta archivada"""
+    __tablename__ = 'venta_rubro_archivado'
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    venta_id = db.Column(db.Integer, db.ForeignKey('venta_archivada.id', ondelete='CASCADE'), nullable=False, index=True)
+    rubro = db.Column(db.String(50), nullable=False)
+
+class Trabajo(db.Model):
+    """Trabajo en segundo plano (cierre mensual, archivo, etc.)"""
+    __tablename__ = 'trabajo'
+
+    id = db.Column(db.Integer, primary_key=True)
+    usuario_email = db.Column(db.String(255), nullable=False, index=True)
+    tipo = db.Column(db.String(50), nullable=False)
+    parametros = db.Column(db.Text, nullable=False, default='{}')  # JSON
+    clave_idempotencia = db.Column(db.String(100), nullable=False)
+    estado = db.Column(db.String(20), nullable=False, default='Pendiente', index=True)  # Pendiente, En curso, Completado, Error
+    progreso = db.Column(db.Integer, nullable=False, default=0)  # 0-100
+    resultado = db.Column(db.Text, nullable=True)  # JSON
+    error = db.Column(db.Text, nullable=True)
+    creado_en = db.Column(db.String(19), nullable=False)  # YYYY-MM-DD HH:MM:SS
+    iniciado_en = db.Column(db.String(19), nullable=True)
+    terminado_en = db.Column(db.String(19), nullable=True)
+    latido = db.Column(db.String(19), nullable=True)  # Última señal de vida del hilo que lo ejecuta
+
+    # Un doble clic envía la misma clave: el segundo envío devuelve el mismo trabajo
+    __table_args__ = (db.UniqueConstraint('usuario_email', 'clave_idempotencia', name='unique_trabajo_clave'),)
+
+    def to_dict(self):
+        """Convierte el trabajo a diccionario"""
+        return {
+            'id': self.id,
+            'tipo': self.tipo,
+            'parametros': json.loads(self.parametros or '{}'),
+            'estado': self.estado,
+            'progreso': self.progreso,
+            'resultado': json.loads(self.resultado) if self.resultado else None,
+            'error': self.error,
+            'creado_en': self.creado_en,
+            'iniciado_en': self.iniciado_en,
+            'terminado_en': self.terminado_en
+        }
+
+class Inquilino(db.Model):
+    """Usuario con base de datos propia (modo PARTICIONES=1); vive en la base principal"""
+    __tablename__ = 'inquilino'
+
+    usuario_email = db.Column(db.String(255), primary_key=True)
+    creado_en = db.Column(db.String(19), nullable=False)  # YYYY-MM-DD HH:MM:SS
 
 # ========================================
 # SISTEMA DE VENTAS - Carloszerpav
@@ -169,6 +460,383 @@ class VentaRubro(db.Model):
 # Mis rubros de trabajo - Carloszerpav
 RUBROS = ['Maquillaje', 'Renacer', 'Tendencia', 'Accesorios', 'Zapatos']
 
+# Caché de fragmentos HTML del dashboard (se desactiva con CACHE_FRAGMENTOS=0)
+cache_fragmentos = CacheFragmentos()
+cache_fragmentos.activa = os.environ.get('CACHE_FRAGMENTOS', '1') != '0'
+
+def incrementar_version_datos(usuario_email):
+    """
+    Sube la versión de datos del usuario dentro de la transacción en curso
+    Debe llamarse en cada escritura antes del commit
+    La versión también sirve como número de cambio para la sincronización delta
+    Args:
+        usuario_email (str): Email del usuario cuyos datos cambiaron
+    Returns:
+        int: La nueva versión
+    """
+    # Lo que la petición ya cargó deja de valer
+    contexto_datos.invalidar()
+    actualizadas = VersionDatos.query.filter_by(usuario_email=usuario_email).update(
+        {VersionDatos.version: VersionDatos.version + 1},
+        synchronize_session=False
+    )
+    if not actualizadas:
+        try:
+            # Primera escritura del usuario: crear el contador (savepoint por si otro worker se adelanta)
+            with db.session.begin_nested():
+                db.session.add(VersionDatos(usuario_email=usuario_email, version=1))
+        except IntegrityError:
+            VersionDatos.query.filter_by(usuario_email=usuario_email).update(
+                {VersionDatos.version: VersionDatos.version + 1},
+                synchronize_session=False
+            )
+    # La fila quedó bloqueada por el UPDATE: leemos nuestro propio valor
+    return db.session.query(VersionDatos.version).filter_by(usuario_email=usuario_email).scalar()
+
+def obtener_version_datos(usuario_email):
+    """
+    Obtiene la versión actual de los datos del usuario
+    Args:
+        usuario_email (str): Email del usuario
+    Returns:
+        int: Versión actual (0 si el usuario nunca ha escrito)
+    """
+    version = db.session.query(VersionDatos.version).filter_by(usuario_email=usuario_email).scalar()
+    return version or 0
+
+# ========================================
+# EVENTOS EN VIVO
+# ========================================
+# Minutos que se conservan los eventos (para reconexiones con Last-Event-ID)
+EVENTOS_RETENCION_MINUTOS = int(os.environ.get('EVENTOS_RETENCION_MINUTOS', 60))
+# Segundos que dura una conexión SSE antes de que el navegador reconecte
+EVENTOS_DURACION_MAXIMA = int(os.environ.get('EVENTOS_DURACION_MAXIMA', 300))
+# Flujos SSE abiertos a la vez por worker: cada uno ocupa un hilo de gunicorn,
+# así que debe quedar por debajo de --threads para no dejar sin hilos al resto
+EVENTOS_MAX_FLUJOS = int(os.environ.get('EVENTOS_MAX_FLUJOS', 8))
+# Segundos que espera el navegador antes de reintentar si el worker está lleno
+EVENTOS_REINTENTO = int(os.environ.get('EVENTOS_REINTENTO', 15))
+# IDs por debajo del último que se vuelven a leer: en PostgreSQL un ID menor
+# puede confirmarse después de uno mayor
+EVENTOS_VENTANA_IDS = int(os.environ.get('EVENTOS_VENTANA_IDS', 200))
+
+def emitir_evento(usuario_email, tipo, datos):
+    """
+    Agrega un evento a la transacción en curso; se publica al hacer commit
+    Con particiones, el evento (base principal) se inserta solo después de que
+    la base del inquilino confirmó la escritura (ver insertar_eventos_pendientes)
+    Args:
+        usuario_email (str): Dueño del evento
+        tipo (str): venta_agregada, pago_registrado, venta_cerrada, venta_eliminada o mes_cerrado
+        datos (dict): Carga compacta del evento
+    """
+    evento = {
+        'usuario_email': usuario_email,
+        'tipo': tipo,
+        'datos': json.dumps(datos, default=str),
+        'creado_en': datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    }
+    if particiones.activa:
+        db.session.info.setdefault('eventos_pendientes', []).append(evento)
+    else:
+        db.session.add(Evento(**evento))
+
+@db.event.listens_for(SesionEnrutada, 'after_commit')
+def insertar_eventos_pendientes(sesion):
+    """
+    Inserta en la principal los eventos de una escritura ya confirmada en el inquilino
+    Si falla, el evento se pierde (nunca se publica uno de una escritura revertida)
+    """
+    eventos = sesion.info.pop('eventos_pendientes', None)
+    if not eventos:
+        return
+    try:
+        with db.engine.begin() as conexion:
+            conexion.execute(db.insert(Evento), eventos)
+    except Exception:
+        log_eventos.exception("No se pudieron guardar los eventos en vivo", extra={
+            'evento': 'eventos_perdidos',
+            'tipos': [e['tipo'] for e in eventos]
+        })
+
+@db.event.listens_for(SesionEnrutada, 'after_rollback')
+def descartar_eventos_pendientes(sesion):
+    sesion.info.pop('eventos_pendientes', None)
+
+def _leer_eventos_desde(ultimo_id, usuario_email=None):
+    """Eventos posteriores a un ID, como tuplas (id, usuario_email, tipo, datos)"""
+    with app.app_context():
+        consulta = db.session.query(Evento).filter(Evento.id > ultimo_id)
+        if usuario_email:
+            consulta = consulta.filter(Evento.usuario_email == usuario_email)
+        return [(e.id, e.usuario_email, e.tipo, json.loads(e.datos)) for e in consulta.order_by(Evento.id).limit(500).all()]
+
+def _ids_eventos_recientes(cantidad):
+    """IDs de los últimos eventos, del más reciente al más antiguo"""
+    with app.app_context():
+        return [fila.id for fila in db.session.query(Evento.id).order_by(Evento.id.desc()).limit(cantidad).all()]
+
+def _limpiar_eventos():
+    limite = (datetime.now() - timedelta(minutes=EVENTOS_RETENCION_MINUTOS)).strftime("%Y-%m-%d %H:%M:%S")
+    with app.app_context():
+        Evento.query.filter(Evento.creado_en < limite).delete(synchronize_session=False)
+        db.session.commit()
+
+bus_eventos = BusEventos(_leer_eventos_desde, _ids_eventos_recientes, limpiar=_limpiar_eventos,
+                         ventana=EVENTOS_VENTANA_IDS)
+
+def con_detalle(modelo):
+    """
+    Opciones de consulta que traen rubros y pagos de todas las ventas en dos consultas
+    Sin esto, cada to_dict() dispara dos consultas más por venta
+    Args:
+        modelo: Venta o VentaArchivada
+    Returns:
+        tuple: Opciones para pasar a .options(...)
+    """
+    return (db.selectinload(modelo.rubros), db.selectinload(modelo.pagos))
+
+def consulta_ventas(modelo, usuario_email):
+    """
+    SELECT de las ventas del usuario con rubros y pagos
+    Lo comparten las rutas de Flask y la API asíncrona (api_async.py)
+    Args:
+        modelo: Venta o VentaArchivada
+        usuario_email (str): Email del usuario
+    """
+    return db.select(modelo).options(*con_detalle(modelo)).filter_by(usuario_email=usuario_email)
+
+def consulta_total_archivadas(usuario_email):
+    """SELECT count(*) de las ventas archivadas del usuario"""
+    return db.select(db.func.count(VentaArchivada.id)).filter_by(usuario_email=usuario_email)
+
+@contexto_datos.memorizar
+def ventas_usuario(usuario_email):
+    """
+    Todas las ventas del usuario (sin las archivadas) en formato diccionario
+    Se carga una vez por petición y la comparten estadísticas, listados y búsqueda
+    Returns:
+        list: Ventas con rubros e historial de pagos
+    """
+    ventas_db = db.session.execute(consulta_ventas(Venta, usuario_email)).scalars().all()
+    return [v.to_dict() for v in ventas_db]
+
+@contexto_datos.memorizar
+def ventas_archivadas_usuario(usuario_email):
+    """Ventas del usuario que ya están en el archivo, en formato diccionario (una carga por petición)"""
+    ventas_db = db.session.execute(consulta_ventas(VentaArchivada, usuario_email)).scalars().all()
+    return [v.to_dict() for v in ventas_db]
+
+@contexto_datos.memorizar
+def venta_usuario(usuario_email, venta_id):
+    """
+    Objeto Venta del usuario (None si no existe o es de otro usuario)
+    obtener_venta y registrar_pago lo comparten dentro de la misma petición
+    """
+    return Venta.query.filter_by(id=venta_id, usuario_email=usuario_email).first()
+
+# ========================================
+# CLIENTES
+# ========================================
+
+def normalizar_cliente(nombre):
+    """
+    Clave para reconocer al mismo cliente aunque se escriba distinto
+    Ej.: '  María  PÉREZ.' y 'maria perez' -> 'maria perez'
+    Solo se quitan las tildes y demás marcas: las letras de otros alfabetos se
+    conservan ('Иван' y 'Пётр' no pueden acabar siendo el mismo cliente)
+    """
+    descompuesto = unicodedata.normalize('NFKD', str(nombre or ''))
+    sin_tildes = ''.join(c for c in descompuesto if not unicodedata.combining(c))
+    return re.sub(r'[\W_]+', ' ', sin_tildes.casefold()).strip()
+
+def clave_cliente(nombre):
+    """Clave con la que se guarda el cliente; si el nombre no tiene letras ni números, el nombre tal cual"""
+    return normalizar_cliente(nombre) or str(nombre or '').strip().casefold()
+
+def obtener_o_crear_cliente(usuario_email, nombre):
+    """
+    Busca el cliente por su nombre normalizado o lo crea dentro de la transacción en curso
+    Args:
+        usuario_email (str): Email del usuario
+        nombre (str): Nombre del cliente como lo escribió el usuario
+    Returns:
+        Cliente: El cliente (ya con ID)
+    """
+    clave = clave_cliente(nombre)
+    cliente = Cliente.query.filter_by(usuario_email=usuario_email, clave=clave).first()
+    if cliente:
+        return cliente
+    try:
+        # Savepoint por si otra petición crea el mismo cliente al mismo tiempo
+        with db.session.begin_nested():
+            cliente = Cliente(
+                usuario_email=usuario_email,
+                nombre=nombre.strip(),
+                clave=clave,
+                cantidad_ventas=0,
+                total_vendido=0,
+                total_pagado=0,
+                saldo_pendiente=0,
+                creado_en=datetime.now().strftime("%Y-%m-%d %H:%M")
+            )
+            db.session.add(cliente)
+        return cliente
+    except IntegrityError:
+        return Cliente.query.filter_by(usuario_email=usuario_email, clave=clave).first()
+
+def acumular_cliente(cliente_id, ventas=0, vendido=0, pagado=0, saldo=0):
+    """
+    Suma (o resta) a los totales del cliente con un UPDATE atómico en la transacción en curso
+    Args:
+        cliente_id (int): ID del cliente. Si es None no hace nada
+        ventas (int): Cambio en la cantidad de ventas
+        vendido, pagado, saldo (float): Cambio en cada total
+    """
+    if cliente_id is None:
+        return
+    Cliente.query.filter_by(id=cliente_id).update({
+        Cliente.cantidad_ventas: Cliente.cantidad_ventas + ventas,
+        Cliente.total_vendido: Cliente.total_vendido + vendido,
+        Cliente.total_pagado: Cliente.total_pagado + pagado,
+        Cliente.saldo_pendiente: Cliente.saldo_pendiente + saldo
+    }, synchronize_session=False)
+
+def reconstruir_clientes(usuario_email=None):
+    """
+    Vincula las ventas sin cliente (anteriores a la tabla cliente) y recalcula los totales
+    desde las ventas, incluidas las archivadas. Se puede repetir sin duplicar nada
+    También pone al día las claves guardadas con una versión anterior de normalizar_cliente
+    y revincula las ventas que esa versión juntó con un cliente que no era el suyo
+    Args:
+        usuario_email (str): Limitar a un usuario. Si es None, todos
+    Returns:
+        int: Número de clientes recalculados
+    """
+    if usuario_email is None and particiones.activa and particiones.actual() is None:
+        total = 0
+        for email in listar_inquilinos():
+            with particiones.inquilino(email):
+                total += reconstruir_clientes(email)
+            db.session.remove()
+        return total
+
+    try:
+        # Un solo número de cambio por usuario afectado, para la caché y la sincronización delta
+        versiones = {}
+
+        # Claves viejas: se cambian solo a una clave libre (las ocupadas se resuelven
+        # abajo, al revincular sus ventas) y sin liberar la anterior en este mismo commit
+        existentes = Cliente.query
+        if usuario_email:
+            existentes = existentes.filter_by(usuario_email=usuario_email)
+        existentes = existentes.order_by(Cliente.id).all()
+        ocupadas = {(cliente.usuario_email, cliente.clave) for cliente in existentes}
+        for cliente in existentes:
+            clave = clave_cliente(cliente.nombre)
+            if clave != cliente.clave and (cliente.usuario_email, clave) not in ocupadas:
+                cliente.clave = clave
+                ocupadas.add((cliente.usuario_email, clave))
+        db.session.flush()
+
+        for modelo in (Venta, VentaArchivada):
+            vinculos = db.session.query(
+                modelo.usuario_email, modelo.cliente, modelo.cliente_id, Cliente.clave
+            ).outerjoin(Cliente, Cliente.id == modelo.cliente_id)
+            if usuario_email:
+                vinculos = vinculos.filter(modelo.usuario_email == usuario_email)
+            for email, nombre, cliente_id, clave in vinculos.distinct().all():
+                if cliente_id is not None and clave == clave_cliente(nombre):
+                    continue
+                cliente = obtener_o_crear_cliente(email, nombre)
+                if cliente.id == cliente_id:
+                    continue
+                if email not in versiones:
+                    versiones[email] = incrementar_version_datos(email)
+                valores = {modelo.cliente_id: cliente.id}
+                if modelo is Venta:
+                    # La venta cambia (otro cliente_id): que la sincronización delta la reenvíe
+                    valores[Venta.cambio] = versiones[email]
+                db.session.query(modelo).filter(
+                    modelo.usuario_email == email,
+                    modelo.cliente == nombre,
+                    modelo.cliente_id.is_(None) if cliente_id is None else modelo.cliente_id == cliente_id
+                ).update(valores, synchronize_session=False)
+
+        # Totales desde cero: activas, cerradas y archivadas
+        ventas = db.union_all(*[
+            db.select(
+                modelo.cliente_id.label('cliente_id'),
+                modelo.valor_total.label('valor_total'),
+                modelo.abono.label('abono'),
+                modelo.saldo_pendiente.label('saldo_pendiente')
+            ).where(modelo.cliente_id.isnot(None), *([modelo.usuario_email == usuario_email] if usuario_email else []))
+            for modelo in (Venta, VentaArchivada)
+        ]).subquery()
+        totales = {
+            fila.cliente_id: fila
+            for fila in db.session.execute(db.select(
+                ventas.c.cliente_id,
+                db.func.count().label('cantidad'),
+                db.func.sum(ventas.c.valor_total).label('vendido'),
+                db.func.sum(ventas.c.abono).label('pagado'),
+                db.func.sum(ventas.c.saldo_pendiente).label('saldo')
+            ).group_by(ventas.c.cliente_id))
+        }
+        clientes = Cliente.query
+        if usuario_email:
+            clientes = clientes.filter_by(usuario_email=usuario_email)
+        recalculados = 0
+        for cliente in clientes.all():
+            antes = (cliente.cantidad_ventas, cliente.total_vendido, cliente.total_pagado, cliente.saldo_pendiente)
+            fila = totales.get(cliente.id)
+            if fila is None:
+                # Todas sus ventas se eliminaron
+                cliente.cantidad_ventas, cliente.total_vendido, cliente.total_pagado, cliente.saldo_pendiente = 0, 0, 0, 0
+            else:
+                cliente.cantidad_ventas = fila.cantidad
+                cliente.total_vendido = fila.vendido or 0
+                cliente.total_pagado = fila.pagado or 0
+                cliente.saldo_pendiente = fila.saldo or 0
+            despues = (cliente.cantidad_ventas, cliente.total_vendido, cliente.total_pagado, cliente.saldo_pendiente)
+            if despues != antes and cliente.usuario_email not in versiones:
+                versiones[cliente.usuario_email] = incrementar_version_datos(cliente.usuario_email)
+            recalculados += 1
+        db.session.commit()
+        return recalculados
+    except Exception as e:
+        db.session.rollback()
+        log_datos.exception("Error al reconstruir clientes", extra={'evento': 'clientes_error'})
+        raise e
+
+def vincular_clientes_pendientes():
+    """
+    Al arrancar: reconstruye los clientes solo en las bases que tienen ventas sin cliente
+    Con particiones se revisa la base de cada inquilino (las ventas ya no están en la principal)
+    Returns:
+        int: Número de clientes recalculados
+    """
+    if not particiones.activa:
+        if db.session.query(Venta.id).filter(Venta.cliente_id.is_(None)).first():
+            return reconstruir_clientes()
+        return 0
+
+    total = 0
+    for email in listar_inquilinos():
+        with particiones.inquilino(email):
+            try:
+                if db.session.query(Venta.id).filter(Venta.cliente_id.is_(None)).first():
+                    total += reconstruir_clientes(email)
+            finally:
+                db.session.remove()
+    return total
+
+@app.cli.command('reconstruir-clientes')
+def reconstruir_clientes_comando():
+    """Vincula las ventas antiguas con su cliente y recalcula los totales de todos los clientes"""
+    total = reconstruir_clientes()
+    click.echo(f"✅ {total} clientes recalculados")
+
 def agregar_venta(usuario_email, cliente, valor_total, abono, rubros, fecha=None):
     """
     Función para agregar una nueva venta - Carloszerpav
@@ -204,10 +872,18 @@ def agregar_venta(usuario_email, cliente, valor_total, abono, rubros, fecha=None
         saldo_pendiente = valor_total - abono
         estado = 'Activa' if saldo_pendiente > 0 else 'Cerrada'
         
+        # Número de cambio para la sincronización delta
+        cambio = incrementar_version_datos(usuario_email)
+        
+        # Cliente normalizado con sus totales acumulados
+        cliente_db = obtener_o_crear_cliente(usuario_email, cliente)
+        acumular_cliente(cliente_db.id, ventas=1, vendido=valor_total, pagado=abono, saldo=saldo_pendiente)
+        
         # Crear la venta en la base de datos
         nueva_venta = Venta(
             usuario_email=usuario_email,
             cliente=cliente,
+            cliente_id=cliente_db.id,
             valor_total=valor_total,
             abono=abono,
             saldo_pendiente=saldo_pendiente,
@@ -215,7 +891,8 @@ def agregar_venta(usuario_email, cliente, valor_total, abono, rubros, fecha=None
             fecha_registro=fecha_registro,
             estado=estado,
             incluida_en_estadisticas=True,
-            mes_cierre=None
+            mes_cierre=None,
+            cambio=cambio
         )
         
         db.session.add(nueva_venta)
@@ -232,10 +909,12 @@ def agregar_venta(usuario_email, cliente, valor_total, abono, rubros, fecha=None
                 venta_id=nueva_venta.id,
                 monto=abono,
                 fecha=fecha_registro,
-                tipo='Pago inicial'
+                tipo='Pago inicial',
+                cambio=cambio
             )
             db.session.add(pago_inicial)
-        
+
+        emitir_evento(usuario_email, 'venta_agregada', {'cambio': cambio, 'venta': venta_resumen(nueva_venta)})
         db.session.commit()
         
         # Retornar como diccionario para compatibilidad
@@ -243,7 +922,7 @@ def agregar_venta(usuario_email, cliente, valor_total, abono, rubros, fecha=None
         
     except Exception as e:
         db.session.rollback()
-        print(f"❌ Error en agregar_venta: {e}")
+        log_ventas.exception("Error en agregar_venta", extra={'evento': 'venta_error', 'usuario': usuario_email})
         raise e
 
 def eliminar_venta(usuario_email, venta_id):
@@ -257,7 +936,18 @@ def eliminar_venta(usuario_email, venta_id):
     """
     venta = Venta.query.filter_by(id=venta_id, usuario_email=usuario_email).first()
     if venta:
+        acumular_cliente(venta.cliente_id, ventas=-1, vendido=-venta.valor_total,
+                         pagado=-venta.abono, saldo=-venta.saldo_pendiente)
         db.session.delete(venta)
+        cambio = incrementar_version_datos(usuario_email)
+        # Lápida para que los clientes sincronizados también la borren
+        db.session.add(VentaEliminada(
+            usuario_email=usuario_email,
+            venta_id=venta_id,
+            cambio=cambio,
+            eliminada_en=datetime.now().strftime("%Y-%m-%d %H:%M")
+        ))
+        emitir_evento(usuario_email, 'venta_eliminada', {'cambio': cambio, 'venta_id': venta_id})
         db.session.commit()
         return True
     return False
@@ -271,7 +961,10 @@ def obtener_venta(usuario_email, venta_id):
     Returns:
         dict: La venta encontrada o None si no existe o no pertenece al usuario
     """
-    venta = Venta.query.filter_by(id=venta_id, usuario_email=usuario_email).first()
+    venta = venta_usuario(usuario_email, venta_id)
+    if venta is None:
+        # Puede ser una venta antigua ya movida al archivo
+        venta = VentaArchivada.query.filter_by(id=venta_id, usuario_email=usuario_email).first()
     if venta:
         return venta.to_dict()
     return None
@@ -287,7 +980,8 @@ def registrar_pago(usuario_email, venta_id, monto_pago, tipo_pago="Abono"):
     Returns:
         dict: La venta actualizada o None si no se encuentra
     """
-    venta = Venta.query.filter_by(id=venta_id, usuario_email=usuario_email).first()
+    # Si la petición ya buscó la venta (gestionar_pago), se reutiliza
+    venta = venta_usuario(usuario_email, venta_id)
     if not venta:
         return None
     
@@ -303,11 +997,13 @@ def registrar_pago(usuario_email, venta_id, monto_pago, tipo_pago="Abono"):
     try:
         # Crear nuevo pago en la base de datos
         fecha_pago = datetime.now().strftime("%Y-%m-%d %H:%M")
+        cambio = incrementar_version_datos(usuario_email)
         nuevo_pago = Pago(
             venta_id=venta_id,
             monto=monto_pago,
             fecha=fecha_pago,
-            tipo=tipo_pago
+            tipo=tipo_pago,
+            cambio=cambio
         )
         
         db.session.add(nuevo_pago)
@@ -329,6 +1025,17 @@ def registrar_pago(usuario_email, venta_id, monto_pago, tipo_pago="Abono"):
             venta.estado = 'Cerrada'
             venta.saldo_pendiente = Decimal('0.00')
         
+        venta.cambio = cambio
+        acumular_cliente(venta.cliente_id, pagado=monto_pago,
+                         saldo=venta.saldo_pendiente - Decimal(str(saldo_actual)).quantize(Decimal('0.01')))
+        db.session.flush()  # Para obtener el ID del pago
+        emitir_evento(usuario_email, 'pago_registrado', {
+            'cambio': cambio,
+            'venta': venta_resumen(venta),
+            'pago': dict(nuevo_pago.to_dict(), venta_id=venta.id)
+        })
+        if venta.estado == 'Cerrada':
+            emitir_evento(usuario_email, 'venta_cerrada', {'cambio': cambio, 'venta_id': venta.id})
         db.session.commit()
         
         # Retornar como diccionario
@@ -336,7 +1043,7 @@ def registrar_pago(usuario_email, venta_id, monto_pago, tipo_pago="Abono"):
         
     except Exception as e:
         db.session.rollback()
-        print(f"❌ Error en registrar_pago: {e}")
+        log_pagos.exception("Error en registrar_pago", extra={'evento': 'pago_error', 'venta_id': venta_id})
         raise e
 
 def obtener_estadisticas(usuario_email):
@@ -344,12 +1051,21 @@ def obtener_estadisticas(usuario_email):
     Función para obtener estadísticas - Carloszerpav
     Ahora filtra por usuario y usa base de datos
     """
-    # Obtener todas las ventas del usuario desde BD
-    todas_ventas = Venta.query.filter_by(usuario_email=usuario_email).all()
-    
-    # Convertir a diccionarios para compatibilidad
-    ventas_dict = [v.to_dict() for v in todas_ventas]
-    
+    # Todas las ventas del usuario (compartidas con el resto de la petición)
+    ventas_dict = ventas_usuario(usuario_email)
+    # Las ventas archivadas siguen contando como excluidas
+    total_archivadas = db.session.execute(consulta_total_archivadas(usuario_email)).scalar()
+    return resumir_estadisticas(ventas_dict, total_archivadas)
+
+def resumir_estadisticas(ventas_dict, total_archivadas):
+    """
+    Calcula los totales generales y por rubro a partir de las ventas ya cargadas
+    Args:
+        ventas_dict (list): Ventas del usuario (sin archivadas) en formato diccionario
+        total_archivadas (int): Cantidad de ventas archivadas
+    Returns:
+        dict: Estadísticas del dashboard y de /api/estadisticas
+    """
     # Ventas incluidas en estadísticas
     ventas_en_estadisticas = [v for v in ventas_dict if v.get('incluida_en_estadisticas', True)]
     ventas_activas = [v for v in ventas_en_estadisticas if v['estado'] == 'Activa']
@@ -375,8 +1091,8 @@ def obtener_estadisticas(usuario_email):
     return {
         'total_ventas_activas': total_ventas_activas,
         'total_ventas_cerradas': len(ventas_cerradas),
-        'total_ventas_excluidas': len(ventas_excluidas),
-        'total_ventas': len(todas_ventas),
+        'total_ventas_excluidas': len(ventas_excluidas) + total_archivadas,
+        'total_ventas': len(ventas_dict) + total_archivadas,
         'total_valor': total_valor_activas,
         'total_abonado': total_abonado_activas,
         'total_pendiente': total_pendiente_activas,
@@ -404,6 +1120,82 @@ def formatear_moneda(valor):
     """
     return f"${valor:,.2f}"
 
+def preparar_ventas_vista(ventas):
+    """
+    Agrega a cada venta sus textos ya formateados (moneda y fecha)
+    Así la plantilla no llama formatear_moneda/formatear_fecha por cada celda
+    Args:
+        ventas (list): Ventas en formato diccionario
+    Returns:
+        list: Copias de las ventas con campos *_fmt (las originales pueden ser las
+              memorizadas de la petición y no se tocan)
+    """
+    return [
+        dict(
+            venta,
+            valor_total_fmt=formatear_moneda(venta['valor_total']),
+            abono_fmt=formatear_moneda(venta['abono']),
+            saldo_pendiente_fmt=formatear_moneda(venta['saldo_pendiente']),
+            fecha_fmt=formatear_fecha(venta['fecha'])
+        )
+        for venta in ventas
+    ]
+
+def preparar_estadisticas_vista(estadisticas):
+    """
+    Agrega a las estadísticas sus montos ya formateados
+    Args:
+        estadisticas (dict): Resultado de obtener_estadisticas
+    Returns:
+        dict: Las mismas estadísticas con campos *_fmt
+    """
+    estadisticas['total_valor_fmt'] = formatear_moneda(estadisticas['total_valor'])
+    estadisticas['total_pendiente_fmt'] = formatear_moneda(estadisticas['total_pendiente'])
+    for stats in estadisticas['por_rubro'].values():
+        stats['valor_total_fmt'] = formatear_moneda(stats['valor_total'])
+        stats['abonado_fmt'] = formatear_moneda(stats['abonado'])
+        stats['pendiente_fmt'] = formatear_moneda(stats['pendiente'])
+    return estadisticas
+
+def renderizar_fragmentos_index(usuario_email, ventas=None):
+    """
+    Devuelve los bloques pesados del dashboard, usando la caché si los datos no cambiaron
+    Args:
+        usuario_email (str): Email del usuario
+        ventas (list): Ventas ya filtradas (búsqueda). Si es None, se usan las activas
+                       y la tabla también se guarda en caché
+    Returns:
+        dict: HTML de 'estadisticas', 'tabla' y 'rubros'
+    """
+    version = obtener_version_datos(usuario_email)
+    fragmentos = {
+        'estadisticas': cache_fragmentos.obtener(usuario_email, version, 'estadisticas'),
+        'rubros': cache_fragmentos.obtener(usuario_email, version, 'rubros'),
+        'tabla': None
+    }
+    if ventas is None:
+        fragmentos['tabla'] = cache_fragmentos.obtener(usuario_email, version, 'tabla')
+
+    if fragmentos['estadisticas'] is None or fragmentos['rubros'] is None:
+        estadisticas = preparar_estadisticas_vista(obtener_estadisticas(usuario_email))
+        fragmentos['estadisticas'] = render_template('parciales/estadisticas.html', estadisticas=estadisticas)
+        fragmentos['rubros'] = render_template('parciales/rubros.html', estadisticas=estadisticas)
+        cache_fragmentos.guardar(usuario_email, version, 'estadisticas', fragmentos['estadisticas'])
+        cache_fragmentos.guardar(usuario_email, version, 'rubros', fragmentos['rubros'])
+
+    if ventas is not None:
+        fragmentos['tabla'] = render_template('parciales/tabla_ventas.html', ventas=preparar_ventas_vista(ventas))
+    elif fragmentos['tabla'] is None:
+        ventas_activas = sorted(
+            (v for v in ventas_usuario(usuario_email) if v['estado'] == 'Activa'),
+            key=lambda v: v['fecha'], reverse=True
+        )
+        ventas_activas = preparar_ventas_vista(ventas_activas)
+        fragmentos['tabla'] = render_template('parciales/tabla_ventas.html', ventas=ventas_activas)
+        cache_fragmentos.guardar(usuario_email, version, 'tabla', fragmentos['tabla'])
+
+    return {nombre: Markup(html) for nombre, html in fragmentos.items()}
+
 def cerrar_mes_estadisticas(usuario_email, mes=None, año=None):
     """
     Cierra las estadísticas del mes especificado, excluyendo las ventas cerradas
@@ -433,10 +1225,18 @@ def cerrar_mes_estadisticas(usuario_email, mes=None, año=None):
     
     # Marcar ventas como excluidas de estadísticas
     mes_cierre_str = f"{año}-{mes:02d}"
+    cambio = incrementar_version_datos(usuario_email)
     for venta in ventas_a_excluir:
         venta.incluida_en_estadisticas = False
         venta.mes_cierre = mes_cierre_str
-    
+        venta.cambio = cambio
+
+    emitir_evento(usuario_email, 'mes_cerrado', {
+        'cambio': cambio,
+        'mes': mes,
+        'año': año,
+        'ventas_excluidas': [v.id for v in ventas_a_excluir]
+    })
     db.session.commit()
     
     resumen = {
@@ -448,7 +1248,20 @@ def cerrar_mes_estadisticas(usuario_email, mes=None, año=None):
         'fecha_cierre': datetime.now().strftime("%Y-%m-%d %H:%M")
     }
     
-    print(f"✅ Cierre mensual {mes}/{año}: {total_excluidas} ventas excluidas")
+    log_cierre.info("Cierre mensual realizado", extra={
+        'evento': 'mes_cerrado',
+        'usuario': usuario_email,
+        'mes_cierre': mes_cierre_str,
+        'ventas_excluidas': total_excluidas,
+        'valor_total_excluido': valor_total_excluido
+    })
+
+    # Aprovechar el cierre para mover al archivo las ventas que ya pasaron la retención
+    try:
+        archivar_ventas(usuario_email)
+    except Exception:
+        log_cierre.exception("Error al archivar ventas tras el cierre", extra={'evento': 'archivo_error', 'usuario': usuario_email})
+
     return resumen
 
 def obtener_ventas_cerradas_pendientes(usuario_email):
@@ -459,96 +1272,888 @@ def obtener_ventas_cerradas_pendientes(usuario_email):
     Returns:
         list: Lista de ventas cerradas pendientes de cierre mensual
     """
-    ventas_db = Venta.query.filter_by(
-        usuario_email=usuario_email,
-        estado='Cerrada',
-        incluida_en_estadisticas=True
-    ).all()
-    
-    return [venta.to_dict() for venta in ventas_db]
+    return [
+        venta for venta in ventas_usuario(usuario_email)
+        if venta['estado'] == 'Cerrada' and venta['incluida_en_estadisticas']
+    ]
 
-def obtener_estadisticas_por_periodo(usuario_email, fecha_inicio, fecha_fin):
+# ========================================
+# SINCRONIZACIÓN DELTA
+# ========================================
+# Cada escritura guarda en la fila el número de cambio (la versión de
+# datos del usuario). Un cliente guarda el último token recibido y pide
+# solo lo que cambió desde entonces.
+
+def venta_resumen(venta):
     """
-    Obtiene estadísticas de ventas en un período específico
+    Versión compacta de una venta para la sincronización (sin historial de pagos)
     Args:
-        usuario_email (str): Email del usuario
-        fecha_inicio (str): Fecha de inicio en formato YYYY-MM-DD
-        fecha_fin (str): Fecha de fin en formato YYYY-MM-DD
+        venta (Venta): Venta con rubros y pagos ya cargados
     Returns:
-        dict: Estadísticas del período
+        dict: Campos de la venta más su número de cambio
     """
-    try:
-        # Convertir fechas a objetos datetime para comparación
-        inicio = datetime.strptime(fecha_inicio, "%Y-%m-%d")
-        fin = datetime.strptime(fecha_fin, "%Y-%m-%d")
-        
-        # Obtener todas las ventas del usuario en el período
-        todas_ventas = Venta.query.filter_by(usuario_email=usuario_email).all()
-        
-        # Filtrar ventas en el período
-        ventas_periodo = []
-        for venta in todas_ventas:
-            fecha_venta = datetime.strptime(venta.fecha, "%Y-%m-%d")
-            if inicio <= fecha_venta <= fin:
-                ventas_periodo.append(venta.to_dict())
-        
-        # Calcular estadísticas
-        total_ventas = len(ventas_periodo)
-        total_valor = sum(v['valor_total'] for v in ventas_periodo)
-        total_abonado = sum(v['abono'] for v in ventas_periodo)
-        total_pendiente = sum(v['saldo_pendiente'] for v in ventas_periodo)
-        
-        # Ventas por estado
-        ventas_activas = [v for v in ventas_periodo if v['estado'] == 'Activa']
-        ventas_cerradas = [v for v in ventas_periodo if v['estado'] == 'Cerrada']
-        
-        # Estadísticas por rubro
-        estadisticas_rubros = {}
-        for rubro in RUBROS:
-            ventas_rubro = [v for v in ventas_periodo if rubro in v['rubros']]
-            estadisticas_rubros[rubro] = {
-                'cantidad': len(ventas_rubro),
-                'valor_total': sum(v['valor_total'] for v in ventas_rubro),
-                'abonado': sum(v['abono'] for v in ventas_rubro),
-                'pendiente': sum(v['saldo_pendiente'] for v in ventas_rubro)
-            }
-        
-        # Ventas por día (para gráfica)
-        ventas_por_dia = {}
-        for venta in ventas_periodo:
-            dia = venta['fecha']
-            if dia not in ventas_por_dia:
-                ventas_por_dia[dia] = {
-                    'cantidad': 0,
-                    'valor_total': 0,
-                    'abonado': 0
-                }
-            ventas_por_dia[dia]['cantidad'] += 1
-            ventas_por_dia[dia]['valor_total'] += venta['valor_total']
-            ventas_por_dia[dia]['abonado'] += venta['abono']
-        
-        # Ordenar por fecha
-        ventas_por_dia_ordenado = dict(sorted(ventas_por_dia.items()))
-        
-        return {
-            'fecha_inicio': fecha_inicio,
-            'fecha_fin': fecha_fin,
-            'total_ventas': total_ventas,
-            'total_valor': total_valor,
-            'total_abonado': total_abonado,
-            'total_pendiente': total_pendiente,
-            'ventas_activas': len(ventas_activas),
-            'ventas_cerradas': len(ventas_cerradas),
-            'por_rubro': estadisticas_rubros,
-            'por_dia': ventas_por_dia_ordenado,
-            'ventas_detalle': ventas_periodo
-        }
-        
-    except Exception as e:
-        print(f"❌ Error en estadísticas por período: {e}")
-        return None
+    return {
+        'id': venta.id,
+        'cliente': venta.cliente,
+        'cliente_id': venta.cliente_id,
+        'valor_total': float(venta.valor_total),
+        'abono': float(venta.abono),
+        'saldo_pendiente': float(venta.saldo_pendiente),
+        'rubros': [vr.rubro for vr in venta.rubros],
+        'fecha': venta.fecha,
+        'fecha_registro': venta.fecha_registro,
+        'estado': venta.estado,
+        'total_pagos': len(venta.pagos),
+        'incluida_en_estadisticas': venta.incluida_en_estadisticas,
+        'mes_cierre': venta.mes_cierre,
+        'cambio': venta.cambio
+    }
 
-# ========================================
+def obtener_cambios(usuario_email, desde=0):
+    """
+    Obtiene las ventas, pagos y eliminaciones posteriores a un token
+    Args:
+        usuario_email (str): Email del usuario
+        desde (int): Último token que tiene el cliente (0 = sincronización completa)
+    Returns:
+        dict: token nuevo, ventas y pagos cambiados, IDs eliminados
+    """
+    # Leer el token antes que las filas: lo que se escriba entretanto llegará (otra vez) en la próxima sincronización
+    token = obtener_version_datos(usuario_email)
+    completo = desde <= 0
+
+    ventas_query = Venta.query.options(*con_detalle(Venta)).filter(Venta.usuario_email == usuario_email)
+    pagos_query = db.session.query(Pago).join(Venta).filter(Venta.usuario_email == usuario_email)
+    if not completo:
+        ventas_query = ventas_query.filter(Venta.cambio > desde)
+        pagos_query = pagos_query.filter(Pago.cambio > desde)
+
+    pagos = []
+    for pago in pagos_query.order_by(Pago.id).all():
+        datos_pago = pago.to_dict()
+        datos_pago['venta_id'] = pago.venta_id
+        pagos.append(datos_pago)
+
+    ventas = [venta_resumen(v) for v in ventas_query.order_by(Venta.id).all()]
+
+    eliminadas = []
+    if not completo:
+        eliminadas = [fila.venta_id for fila in db.session.query(VentaEliminada.venta_id).filter(
+            VentaEliminada.usuario_email == usuario_email,
+            VentaEliminada.cambio > desde
+        ).order_by(VentaEliminada.venta_id).all()]
+
+    return {
+        'token': token,
+        'completo': completo,
+        'ventas': ventas,
+        'pagos': pagos,
+        'eliminadas': eliminadas
+    }
+
+# Operaciones que acepta /api/sincronizar en un solo envío
+SINCRONIZACION_MAX_LOTE = int(os.environ.get('SINCRONIZACION_MAX_LOTE', 100))
+
+def _ejecutar_operacion(usuario_email, tipo, datos):
+    """
+    Aplica una venta o un pago con las mismas validaciones que los formularios
+    Returns:
+        dict: La venta resultante
+    """
+    if tipo == 'agregar':
+        cliente = str(datos.get('cliente') or '').strip()
+        rubros = datos.get('rubros') or []
+        if isinstance(rubros, str):
+            rubros = [rubros]
+        valor_total = float(datos.get('valor_total') or 0)
+        abono = float(datos.get('abono') or 0)
+        if not cliente:
+            raise ValueError("El nombre del cliente es requerido")
+        if not rubros:
+            raise ValueError("Debe seleccionar al menos un rubro")
+        if valor_total < 0 or abono < 0:
+            raise ValueError("Valores negativos no permitidos")
+        return agregar_venta(usuario_email, cliente, valor_total, abono, rubros, datos.get('fecha') or None)
+    if tipo == 'pago':
+        venta = registrar_pago(usuario_email, int(datos.get('venta_id') or 0),
+                               float(datos.get('monto_pago') or 0), datos.get('tipo_pago') or 'Abono')
+        if venta is None:
+            raise ValueError("Venta no encontrada")
+        return venta
+    raise ValueError(f"Tipo de operación no válido: {tipo}")
+
+def aplicar_operacion(usuario_email, operacion):
+    """
+    Aplica una operación encolada sin conexión, una sola vez por clave
+    Args:
+        usuario_email (str): Email del usuario
+        operacion (dict): {'clave': str, 'tipo': 'agregar' | 'pago', 'datos': {...}}
+    Returns:
+        dict: clave, estado ('aplicada' o 'rechazada'), repetida y venta o error
+    """
+    clave = str(operacion.get('clave') or '').strip()[:100]
+    tipo = operacion.get('tipo')
+    if not clave:
+        return {'clave': None, 'estado': 'rechazada', 'repetida': False, 'error': 'Falta la clave de idempotencia'}
+
+    def respuesta_previa():
+        previa = OperacionSincronizada.query.filter_by(usuario_email=usuario_email, clave=clave).first()
+        if previa is None:
+            return None
+        return dict(json.loads(previa.resultado or '{"estado": "aplicada"}'), clave=clave, repetida=True)
+
+    previa = respuesta_previa()
+    if previa:
+        return previa
+
+    ahora = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    try:
+        registro = OperacionSincronizada(usuario_email=usuario_email, clave=clave, tipo=str(tipo)[:20], creado_en=ahora)
+        # Queda pendiente en la sesión: se confirma en el mismo commit que la venta o el pago
+        db.session.add(registro)
+        datos = operacion.get('datos') or {}
+        if not isinstance(datos, dict):
+            raise ValueError("Los datos de la operación deben ser un objeto")
+        venta = _ejecutar_operacion(usuario_email, tipo, datos)
+        resultado = {'estado': 'aplicada', 'venta': {
+            'id': venta['id'],
+            'cliente': venta['cliente'],
+            'estado': venta['estado'],
+            'saldo_pendiente': venta['saldo_pendiente']
+        }}
+    except IntegrityError:
+        # Otro envío con la misma clave se aplicó al mismo tiempo
+        db.session.rollback()
+        return respuesta_previa() or {'clave': clave, 'estado': 'rechazada', 'repetida': False, 'error': 'Conflicto al guardar'}
+    except (ValueError, TypeError) as e:
+        # Un rechazo también se recuerda: reintentar la misma operación daría el mismo error
+        db.session.rollback()
+        resultado = {'estado': 'rechazada', 'error': str(e)}
+        registro = OperacionSincronizada(usuario_email=usuario_email, clave=clave, tipo=str(tipo)[:20], creado_en=ahora)
+        db.session.add(registro)
+
+    registro.resultado = json.dumps(resultado)
+    try:
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        return respuesta_previa() or dict(resultado, clave=clave, repetida=False)
+    return dict(resultado, clave=clave, repetida=False)
+
+# ========================================
+# ARCHIVO DE VENTAS ANTIGUAS
+# ========================================
+# Meses que una venta cerrada y excluida permanece en la tabla principal
+ARCHIVO_MESES_RETENCION = int(os.environ.get('ARCHIVO_MESES_RETENCION', 3))
+# Ventas que se mueven por transacción
+ARCHIVO_TAMANO_LOTE = int(os.environ.get('ARCHIVO_TAMANO_LOTE', 500))
+
+def mes_limite_archivo(meses_retencion, hoy=None):
+    """
+    Calcula el primer mes que todavía se conserva en la tabla principal
+    Args:
+        meses_retencion (int): Meses de retención
+        hoy (datetime): Fecha de referencia. Si es None, usa la fecha actual
+    Returns:
+        str: Mes en formato YYYY-MM; se archivan los cierres anteriores a este
+    """
+    if hoy is None:
+        hoy = datetime.now()
+    indice = hoy.year * 12 + (hoy.month - 1) - meses_retencion
+    return f"{indice // 12}-{indice % 12 + 1:02d}"
+
+def condiciones_archivo(usuario_email=None, meses_retencion=None):
+    """
+    Filtro de las ventas que archivar_ventas mueve al archivo
+    Args:
+        usuario_email (str): Limitar a un usuario. Si es None, todas
+        meses_retencion (int): Meses a conservar. Si es None, usa ARCHIVO_MESES_RETENCION
+    Returns:
+        list: Condiciones para Venta.query.filter(*condiciones)
+    """
+    if meses_retencion is None:
+        meses_retencion = ARCHIVO_MESES_RETENCION
+    condiciones = [
+        Venta.estado == 'Cerrada',
+        Venta.incluida_en_estadisticas == False,  # noqa: E712
+        Venta.mes_cierre < mes_limite_archivo(meses_retencion)
+    ]
+    if usuario_email:
+        condiciones.append(Venta.usuario_email == usuario_email)
+    return condiciones
+
+def archivar_ventas(usuario_email=None, meses_retencion=None, tamano_lote=None, al_avanzar=None):
+    """
+    Mueve a las tablas de archivo las ventas cerradas y excluidas más antiguas que la retención,
+    junto con sus pagos y rubros. Trabaja por lotes, un commit por lote.
+    Args:
+        usuario_email (str): Limitar a un usuario. Si es None, archiva para todos
+        meses_retencion (int): Meses a conservar. Si es None, usa ARCHIVO_MESES_RETENCION
+        tamano_lote (int): Ventas por lote. Si es None, usa ARCHIVO_TAMANO_LOTE
+        al_avanzar (callable): Se llama con el total archivado después de cada lote
+    Returns:
+        int: Número de ventas archivadas
+    """
+    if usuario_email is None and particiones.activa and particiones.actual() is None:
+        # Cada inquilino tiene su propia base: recorrerlos uno por uno
+        total = 0
+        for email in listar_inquilinos():
+            with particiones.inquilino(email):
+                total += archivar_ventas(email, meses_retencion, tamano_lote)
+            db.session.remove()
+            if al_avanzar:
+                al_avanzar(total)
+        return total
+
+    if meses_retencion is None:
+        meses_retencion = ARCHIVO_MESES_RETENCION
+    if tamano_lote is None:
+        tamano_lote = ARCHIVO_TAMANO_LOTE
+
+    mes_limite = mes_limite_archivo(meses_retencion)
+    condiciones = condiciones_archivo(usuario_email, meses_retencion)
+
+    total_archivadas = 0
+    while True:
+        lote = db.session.query(Venta.id, Venta.usuario_email).filter(*condiciones).order_by(Venta.id).limit(tamano_lote).all()
+        if not lote:
+            break
+        ids = [fila.id for fila in lote]
+        archivada_en = datetime.now().strftime("%Y-%m-%d %H:%M")
+
+        try:
+            # Copiar en bloque (INSERT ... SELECT), sin cargar objetos en memoria
+            db.session.execute(db.insert(VentaArchivada).from_select(
+                ['id', 'usuario_email', 'cliente', 'cliente_id', 'valor_total', 'abono', 'saldo_pendiente', 'fecha',
+                 'fecha_registro', 'estado', 'incluida_en_estadisticas', 'mes_cierre', 'archivada_en'],
+                db.select(Venta.id, Venta.usuario_email, Venta.cliente, Venta.cliente_id, Venta.valor_total, Venta.abono,
+                          Venta.saldo_pendiente, Venta.fecha, Venta.fecha_registro, Venta.estado,
+                          Venta.incluida_en_estadisticas, Venta.mes_cierre, db.literal(archivada_en))
+                .where(Venta.id.in_(ids))
+            ))
+            db.session.execute(db.insert(PagoArchivado).from_select(
+                ['id', 'venta_id', 'monto', 'fecha', 'tipo'],
+                db.select(Pago.id, Pago.venta_id, Pago.monto, Pago.fecha, Pago.tipo).where(Pago.venta_id.in_(ids))
+            ))
+            db.session.execute(db.insert(VentaRubroArchivado).from_select(
+                ['id', 'venta_id', 'rubro'],
+                db.select(VentaRubro.id, VentaRubro.venta_id, VentaRubro.rubro).where(VentaRubro.venta_id.in_(ids))
+            ))
+
+            # Borrar de las tablas principales (hijos primero por las llaves foráneas)
+            db.session.execute(db.delete(Pago).where(Pago.venta_id.in_(ids)))
+            db.session.execute(db.delete(VentaRubro).where(VentaRubro.venta_id.in_(ids)))
+            db.session.execute(db.delete(Venta).where(Venta.id.in_(ids)))
+
+            for email in {fila.usuario_email for fila in lote}:
+                incrementar_version_datos(email)
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            log_datos.exception("Error al archivar lote de ventas", extra={'evento': 'archivo_error', 'usuario': usuario_email})
+            raise e
+
+        total_archivadas += len(ids)
+        if al_avanzar:
+            al_avanzar(total_archivadas)
+        if len(ids) < tamano_lote:
+            break
+
+    if total_archivadas:
+        log_datos.info("Ventas archivadas", extra={
+            'evento': 'ventas_archivadas',
+            'usuario': usuario_email,
+            'ventas': total_archivadas,
+            'mes_limite': mes_limite
+        })
+    return total_archivadas
+
+def obtener_ventas_excluidas(usuario_email):
+    """
+    Obtiene las ventas excluidas de estadísticas, tanto de la tabla principal como del archivo
+    Args:
+        usuario_email (str): Email del usuario
+    Returns:
+        list: Ventas excluidas ordenadas por fecha descendente
+    """
+    ventas = [v for v in ventas_usuario(usuario_email) if not v['incluida_en_estadisticas']]
+    ventas += ventas_archivadas_usuario(usuario_email)
+    ventas.sort(key=lambda v: v['fecha'], reverse=True)
+    return ventas
+
+@app.cli.command('archivar-ventas')
+def archivar_ventas_comando():
+    """Archiva las ventas cerradas y excluidas que superan la retención (para un cron)"""
+    total = archivar_ventas()
+    click.echo(f"✅ Archivo completado: {total} ventas movidas")
+
+# ========================================
+# TRABAJOS EN SEGUNDO PLANO
+# ========================================
+# Los procesos largos (cierre mensual, archivo) se encolan en la tabla
+# trabajo y los ejecuta un pool de hilos dentro del mismo proceso, para
+# no bloquear un worker de gunicorn ni chocar con el timeout del proxy.
+# Cada worker reclama los trabajos con un UPDATE atómico, así que un
+# trabajo nunca corre dos veces aunque haya varios workers.
+
+TRABAJOS_HILOS = int(os.environ.get('TRABAJOS_HILOS', 2))
+# Trabajos que un mismo usuario puede tener corriendo a la vez
+TRABAJOS_MAX_POR_USUARIO = int(os.environ.get('TRABAJOS_MAX_POR_USUARIO', 1))
+# Segundos sin latido tras los cuales un trabajo 'En curso' se considera huérfano
+TRABAJOS_LATIDO_MAXIMO = int(os.environ.get('TRABAJOS_LATIDO_MAXIMO', 120))
+TRABAJOS_INTERVALO_LATIDO = 30
+
+pool_trabajos = ThreadPoolExecutor(max_workers=TRABAJOS_HILOS, thread_name_prefix='trabajo')
+
+def _ahora():
+    return datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+def _actualizar_trabajo(trabajo_id, **valores):
+    """Actualiza un trabajo en su propia transacción, sin tocar la sesión del trabajo en curso"""
+    with db.engine.begin() as conexion:
+        conexion.execute(db.update(Trabajo).where(Trabajo.id == trabajo_id).values(**valores))
+
+def trabajo_cierre_mensual(usuario_email, parametros, reportar_progreso):
+    """Ejecuta el cierre mensual como trabajo en segundo plano"""
+    reportar_progreso(10)
+    resumen = cerrar_mes_estadisticas(usuario_email, parametros.get('mes'), parametros.get('año'))
+    return resumen
+
+def trabajo_archivar_ventas(usuario_email, parametros, reportar_progreso):
+    """Mueve al archivo las ventas antiguas del usuario"""
+    # Mismo filtro que archivar_ventas para que el progreso llegue al 100%
+    pendientes = Venta.query.filter(*condiciones_archivo(usuario_email)).count() or 1
+    total = archivar_ventas(
+        usuario_email,
+        al_avanzar=lambda archivadas: reportar_progreso(min(99, archivadas * 100 // pendientes))
+    )
+    return {'ventas_archivadas': total}
+
+# Tipos de trabajo disponibles: nombre -> función(usuario_email, parametros, reportar_progreso)
+TIPOS_TRABAJO = {
+    'cierre_mensual': trabajo_cierre_mensual,
+    'archivar_ventas': trabajo_archivar_ventas,
+}
+
+def encolar_trabajo(usuario_email, tipo, parametros=None, clave_idempotencia=None):
+    """
+    Encola un trabajo y lo despacha al pool
+    Args:
+        usuario_email (str): Dueño del trabajo
+        tipo (str): Uno de TIPOS_TRABAJO
+        parametros (dict): Parámetros para la función del trabajo
+        clave_idempotencia (str): Si ya existe un trabajo con esta clave, se devuelve ese
+    Returns:
+        dict: El trabajo encolado (o el existente con la misma clave)
+    """
+    if tipo not in TIPOS_TRABAJO:
+        raise ValueError(f"Tipo de trabajo no válido: {tipo}")
+    if not clave_idempotencia:
+        clave_idempotencia = secrets.token_hex(16)
+
+    trabajo = Trabajo(
+        usuario_email=usuario_email,
+        tipo=tipo,
+        parametros=json.dumps(parametros or {}),
+        clave_idempotencia=clave_idempotencia[:100],
+        estado='Pendiente',
+        progreso=0,
+        creado_en=_ahora()
+    )
+    try:
+        db.session.add(trabajo)
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        existente = Trabajo.query.filter_by(
+            usuario_email=usuario_email,
+            clave_idempotencia=clave_idempotencia[:100]
+        ).first()
+        log_trabajos.info("Trabajo repetido ignorado", extra={
+            'evento': 'trabajo_repetido',
+            'trabajo_id': existente.id,
+            'tipo': tipo,
+            'clave': clave_idempotencia
+        })
+        return existente.to_dict()
+
+    log_trabajos.info("Trabajo encolado", extra={'evento': 'trabajo_encolado', 'trabajo_id': trabajo.id, 'tipo': tipo})
+    pool_trabajos.submit(ejecutar_trabajo, trabajo.id)
+    return trabajo.to_dict()
+
+def obtener_trabajo(usuario_email, trabajo_id):
+    """
+    Obtiene un trabajo del usuario
+    Returns:
+        dict: El trabajo o None si no existe o no pertenece al usuario
+    """
+    trabajo = Trabajo.query.filter_by(id=trabajo_id, usuario_email=usuario_email).first()
+    if trabajo:
+        return trabajo.to_dict()
+    return None
+
+def reclamar_trabajo(trabajo_id):
+    """
+    Marca un trabajo pendiente como 'En curso' si el usuario no superó su límite
+    Es un UPDATE condicional: si otro worker ya lo tomó, no afecta filas
+    Antes bloquea (FOR UPDATE) los trabajos activos del usuario, así dos workers que
+    reclaman a la vez trabajos del mismo usuario se turnan y el segundo ya cuenta el
+    del primero (con READ COMMITTED cada sentencia ve lo confirmado hasta ese momento).
+    SQLite ignora FOR UPDATE, pero el UPDATE ya corre con la base bloqueada para escritura
+    Returns:
+        bool: True si este hilo se quedó con el trabajo
+    """
+    usuario_email = db.session.query(Trabajo.usuario_email).filter_by(id=trabajo_id).scalar()
+    if usuario_email is None:
+        return False
+    db.session.execute(
+        db.select(Trabajo.id)
+        .where(Trabajo.usuario_email == usuario_email, Trabajo.estado.in_(('Pendiente', 'En curso')))
+        .order_by(Trabajo.id)
+        .with_for_update()
+    ).all()
+    en_curso = db.select(db.func.count(Trabajo.id)).where(
+        Trabajo.usuario_email == usuario_email,
+        Trabajo.estado == 'En curso'
+    ).scalar_subquery()
+    ahora = _ahora()
+    resultado = db.session.execute(
+        db.update(Trabajo)
+        .where(Trabajo.id == trabajo_id, Trabajo.estado == 'Pendiente', en_curso < TRABAJOS_MAX_POR_USUARIO)
+        .values(estado='En curso', iniciado_en=ahora, latido=ahora)
+        .execution_options(synchronize_session=False)
+    )
+    db.session.commit()
+    return resultado.rowcount == 1
+
+def ejecutar_trabajo(trabajo_id):
+    """
+    Corre un trabajo dentro del pool de hilos
+    Args:
+        trabajo_id (int): ID del trabajo a ejecutar
+    """
+    with app.app_context():
+        if not reclamar_trabajo(trabajo_id):
+            return
+
+        trabajo = db.session.get(Trabajo, trabajo_id)
+        usuario_email = trabajo.usuario_email
+        tipo = trabajo.tipo
+        funcion = TIPOS_TRABAJO.get(tipo)
+        parametros = json.loads(trabajo.parametros or '{}')
+
+        # Latido periódico para que otros workers sepan que el trabajo sigue vivo
+        terminado = threading.Event()
+
+        def latir():
+            while not terminado.wait(TRABAJOS_INTERVALO_LATIDO):
+                with app.app_context():
+                    _actualizar_trabajo(trabajo_id, latido=_ahora())
+
+        threading.Thread(target=latir, daemon=True).start()
+
+        def reportar_progreso(porcentaje):
+            _actualizar_trabajo(trabajo_id, progreso=int(porcentaje), latido=_ahora())
+
+        try:
+            if funcion is None:
+                raise ValueError(f"Tipo de trabajo no válido: {tipo}")
+            # Con particiones, las tablas del usuario viven en su propia base
+            with particiones.inquilino(usuario_email):
+                resultado = funcion(usuario_email, parametros, reportar_progreso)
+                db.session.commit()
+            _actualizar_trabajo(
+                trabajo_id,
+                estado='Completado',
+                progreso=100,
+                resultado=json.dumps(resultado, default=str),
+                terminado_en=_ahora()
+            )
+            log_trabajos.info("Trabajo completado", extra={
+                'evento': 'trabajo_completado',
+                'trabajo_id': trabajo_id,
+                'tipo': tipo,
+                'usuario': usuario_email
+            })
+        except Exception as e:
+            db.session.rollback()
+            _actualizar_trabajo(trabajo_id, estado='Error', error=str(e), terminado_en=_ahora())
+            log_trabajos.exception("Error en trabajo", extra={
+                'evento': 'trabajo_error',
+                'trabajo_id': trabajo_id,
+                'tipo': tipo,
+                'usuario': usuario_email
+            })
+        finally:
+            terminado.set()
+            db.session.remove()
+
+        # Liberado el cupo del usuario, despachar lo que tenga en espera
+        despachar_pendientes(usuario_email)
+
+def recuperar_huerfanos():
+    """
+    Devuelve a 'Pendiente' los trabajos 'En curso' sin latido reciente (su worker murió)
+    Returns:
+        int: Número de trabajos recuperados
+    """
+    limite = (datetime.now() - timedelta(seconds=TRABAJOS_LATIDO_MAXIMO)).strftime("%Y-%m-%d %H:%M:%S")
+    huerfanos = Trabajo.query.filter(
+        Trabajo.estado == 'En curso',
+        db.or_(Trabajo.latido == None, Trabajo.latido < limite)  # noqa: E711
+    ).update({Trabajo.estado: 'Pendiente'}, synchronize_session=False)
+    db.session.commit()
+    return huerfanos
+
+def despachar_pendientes(usuario_email=None):
+    """
+    Recupera los trabajos huérfanos y envía al pool los pendientes (de un usuario o de todos)
+    Returns:
+        int: Número de trabajos enviados al pool
+    """
+    huerfanos = recuperar_huerfanos()
+    if huerfanos:
+        log_trabajos.warning("Trabajos huérfanos recuperados", extra={'evento': 'trabajos_huerfanos', 'trabajos': huerfanos})
+    consulta = db.session.query(Trabajo.id).filter(Trabajo.estado == 'Pendiente')
+    if usuario_email:
+        consulta = consulta.filter(Trabajo.usuario_email == usuario_email)
+    ids = [fila.id for fila in consulta.order_by(Trabajo.id).all()]
+    for trabajo_id in ids:
+        pool_trabajos.submit(ejecutar_trabajo, trabajo_id)
+    return len(ids)
+
+def reanudar_trabajos():
+    """
+    Al arrancar un worker: despacha los pendientes y los huérfanos de workers caídos
+    """
+    despachados = despachar_pendientes()
+    if despachados:
+        log_trabajos.info("Trabajos reanudados", extra={'evento': 'trabajos_reanudados', 'trabajos': despachados})
+
+def iniciar_barrido_trabajos():
+    """
+    Hilo que repite despachar_pendientes cada TRABAJOS_INTERVALO_LATIDO segundos
+    Un worker que muere y renace enseguida deja su trabajo con latido reciente, así que
+    al arrancar todavía no es huérfano; el barrido lo recupera cuando el latido envejece
+    """
+    def barrer():
+        while True:
+            time.sleep(TRABAJOS_INTERVALO_LATIDO)
+            with app.app_context():
+                try:
+                    despachar_pendientes()
+                except Exception:
+                    log_trabajos.exception("Error al barrer trabajos", extra={'evento': 'barrido_error'})
+                finally:
+                    db.session.remove()
+
+    threading.Thread(target=barrer, name='barrido-trabajos', daemon=True).start()
+
+def iniciar_trabajos():
+    """
+    Retoma los trabajos a medias y arranca el barrido en este proceso
+    No se llama al importar app.py (lo importan también `flask <comando>`, las
+    herramientas y la API asíncrona): la llama gunicorn.conf.py en cada worker
+    y el bloque principal al ejecutar `python app.py`
+    """
+    global _trabajos_iniciados
+    if _trabajos_iniciados or os.environ.get('TRABAJOS_REANUDAR', '1') == '0':
+        return
+    _trabajos_iniciados = True
+    with app.app_context():
+        try:
+            reanudar_trabajos()
+        except Exception:
+            log_trabajos.exception("Advertencia al reanudar trabajos", extra={'evento': 'reanudar_error'})
+        finally:
+            db.session.remove()
+    iniciar_barrido_trabajos()
+
+_trabajos_iniciados = False
+
+def obtener_estadisticas_por_periodo(usuario_email, fecha_inicio, fecha_fin):
+    """
+    Obtiene estadísticas de ventas en un período específico
+    Args:
+        usuario_email (str): Email del usuario
+        fecha_inicio (str): Fecha de inicio en formato YYYY-MM-DD
+        fecha_fin (str): Fecha de fin en formato YYYY-MM-DD
+    Returns:
+        dict: Estadísticas del período
+    """
+    try:
+        # Validar las fechas antes de consultar
+        datetime.strptime(fecha_inicio, "%Y-%m-%d")
+        datetime.strptime(fecha_fin, "%Y-%m-%d")
+        
+        # Obtener todas las ventas del usuario en el período (incluidas las archivadas)
+        todas_ventas = db.session.execute(consulta_ventas(Venta, usuario_email)).scalars().all()
+        todas_ventas += db.session.execute(
+            consulta_archivadas_periodo(usuario_email, fecha_inicio, fecha_fin)
+        ).scalars().all()
+        return resumir_periodo(todas_ventas, fecha_inicio, fecha_fin)
+        
+    except Exception:
+        log_cierre.exception("Error en estadísticas por período", extra={
+            'evento': 'estadisticas_periodo_error',
+            'fecha_inicio': fecha_inicio,
+            'fecha_fin': fecha_fin
+        })
+        return None
+
+def consulta_archivadas_periodo(usuario_email, fecha_inicio, fecha_fin):
+    """SELECT de las ventas archivadas del usuario con fecha dentro del período"""
+    return consulta_ventas(VentaArchivada, usuario_email).filter(
+        VentaArchivada.fecha >= fecha_inicio,
+        VentaArchivada.fecha <= fecha_fin
+    )
+
+def resumir_periodo(todas_ventas, fecha_inicio, fecha_fin):
+    """
+    Filtra las ventas del período y calcula sus totales, por rubro y por día
+    Args:
+        todas_ventas (list): Objetos Venta/VentaArchivada con rubros y pagos cargados
+        fecha_inicio (str): Fecha de inicio en formato YYYY-MM-DD
+        fecha_fin (str): Fecha de fin en formato YYYY-MM-DD
+    Returns:
+        dict: Estadísticas del período
+    """
+    # Convertir fechas a objetos datetime para comparación
+    inicio = datetime.strptime(fecha_inicio, "%Y-%m-%d")
+    fin = datetime.strptime(fecha_fin, "%Y-%m-%d")
+    
+    # Filtrar ventas en el período
+    ventas_periodo = []
+    for venta in todas_ventas:
+        fecha_venta = datetime.strptime(venta.fecha, "%Y-%m-%d")
+        if inicio <= fecha_venta <= fin:
+            ventas_periodo.append(venta.to_dict())
+    
+    # Calcular estadísticas
+    total_ventas = len(ventas_periodo)
+    total_valor = sum(v['valor_total'] for v in ventas_periodo)
+    total_abonado = sum(v['abono'] for v in ventas_periodo)
+    total_pendiente = sum(v['saldo_pendiente'] for v in ventas_periodo)
+    
+    # Ventas por estado
+    ventas_activas = [v for v in ventas_periodo if v['estado'] == 'Activa']
+    ventas_cerradas = [v for v in ventas_periodo if v['estado'] == 'Cerrada']
+    
+    # Estadísticas por rubro
+    estadisticas_rubros = {}
+    for rubro in RUBROS:
+        ventas_rubro = [v for v in ventas_periodo if rubro in v['rubros']]
+        estadisticas_rubros[rubro] = {
+            'cantidad': len(ventas_rubro),
+            'valor_total': sum(v['valor_total'] for v in ventas_rubro),
+            'abonado': sum(v['abono'] for v in ventas_rubro),
+            'pendiente': sum(v['saldo_pendiente'] for v in ventas_rubro)
+        }
+    
+    # Ventas por día (para gráfica)
+    ventas_por_dia = {}
+    for venta in ventas_periodo:
+        dia = venta['fecha']
+        if dia not in ventas_por_dia:
+            ventas_por_dia[dia] = {
+                'cantidad': 0,
+                'valor_total': 0,
+                'abonado': 0
+            }
+        ventas_por_dia[dia]['cantidad'] += 1
+        ventas_por_dia[dia]['valor_total'] += venta['valor_total']
+        ventas_por_dia[dia]['abonado'] += venta['abono']
+    
+    # Ordenar por fecha
+    ventas_por_dia_ordenado = dict(sorted(ventas_por_dia.items()))
+    
+    return {
+        'fecha_inicio': fecha_inicio,
+        'fecha_fin': fecha_fin,
+        'total_ventas': total_ventas,
+        'total_valor': total_valor,
+        'total_abonado': total_abonado,
+        'total_pendiente': total_pendiente,
+        'ventas_activas': len(ventas_activas),
+        'ventas_cerradas': len(ventas_cerradas),
+        'por_rubro': estadisticas_rubros,
+        'por_dia': ventas_por_dia_ordenado,
+        'ventas_detalle': ventas_periodo
+    }
+
+# Tramos de días del reporte de antigüedad de saldos
+TRAMOS_ANTIGUEDAD = ['0-30', '31-60', '61-90', '90+']
+
+def obtener_antiguedad_saldos(usuario_email, hoy=None):
+    """
+    Reparte el saldo pendiente de las ventas activas en tramos de días,
+    contados desde la fecha de la venta y desde su último pago, por rubro
+    Se calcula en una sola consulta agregada (ix_venta_antiguedad, ix_pago_venta_fecha)
+    Args:
+        usuario_email (str): Email del usuario
+        hoy (date): Fecha de corte. Si es None, usa la fecha actual
+    Returns:
+        dict: Totales por tramo, general y por rubro, para cada referencia
+    """
+    if hoy is None:
+        hoy = datetime.now().date()
+    # Las fechas se guardan como texto YYYY-MM-DD, así que basta comparar con las fechas de corte
+    cortes = [(hoy - timedelta(days=dias)).strftime("%Y-%m-%d") for dias in (30, 60, 90)]
+
+    def tramo(columna):
+        return db.case(
+            (columna >= cortes[0], 0),
+            (columna >= cortes[1], 1),
+            (columna >= cortes[2], 2),
+            else_=3
+        )
+
+    # Sin pagos, el saldo envejece desde la fecha de la venta
+    ultimo_pago = db.select(db.func.max(Pago.fecha)).where(Pago.venta_id == Venta.id).correlate(Venta).scalar_subquery()
+    saldos = db.select(
+        Venta.id.label('venta_id'),
+        Venta.saldo_pendiente.label('saldo'),
+        Venta.fecha.label('fecha'),
+        db.func.coalesce(ultimo_pago, Venta.fecha).label('referencia_pago')
+    ).where(
+        Venta.usuario_email == usuario_email,
+        Venta.estado == 'Activa',
+        Venta.saldo_pendiente > 0
+    ).cte('saldos')
+    # En un paso aparte para que el último pago se busque una sola vez por venta
+    abiertas = db.select(
+        saldos.c.venta_id,
+        saldos.c.saldo,
+        tramo(saldos.c.fecha).label('tramo_fecha'),
+        tramo(saldos.c.referencia_pago).label('tramo_pago')
+    ).cte('abiertas')
+
+    def agrupado(rubro, *uniones):
+        consulta = db.select(
+            rubro.label('rubro'),
+            abiertas.c.tramo_fecha,
+            abiertas.c.tramo_pago,
+            db.func.count().label('cantidad'),
+            db.func.sum(abiertas.c.saldo).label('saldo')
+        ).select_from(abiertas)
+        for tabla, condicion in uniones:
+            consulta = consulta.join(tabla, condicion)
+        columnas = [abiertas.c.tramo_fecha, abiertas.c.tramo_pago]
+        return consulta.group_by(*([rubro] if uniones else []), *columnas)
+
+    # Fila sin rubro = total general (una venta con dos rubros cuenta una sola vez)
+    consulta = db.union_all(
+        agrupado(VentaRubro.rubro, (VentaRubro, VentaRubro.venta_id == abiertas.c.venta_id)),
+        agrupado(db.literal(None, db.String))
+    )
+
+    def vacio():
+        return {nombre: {'cantidad': 0, 'saldo': 0.0} for nombre in TRAMOS_ANTIGUEDAD}
+
+    reporte = {
+        'fecha_corte': hoy.strftime("%Y-%m-%d"),
+        'tramos': TRAMOS_ANTIGUEDAD,
+        'total_ventas': 0,
+        'total_pendiente': 0.0
+    }
+    for referencia in ('por_fecha', 'por_ultimo_pago'):
+        reporte[referencia] = {'total': vacio(), 'por_rubro': {rubro: vacio() for rubro in RUBROS}}
+
+    for fila in db.session.execute(consulta):
+        saldo = float(fila.saldo or 0)
+        if fila.rubro is None:
+            reporte['total_ventas'] += fila.cantidad
+            reporte['total_pendiente'] += saldo
+        for referencia, indice in (('por_fecha', fila.tramo_fecha), ('por_ultimo_pago', fila.tramo_pago)):
+            if fila.rubro is None:
+                destino = reporte[referencia]['total']
+            else:
+                destino = reporte[referencia]['por_rubro'].setdefault(fila.rubro, vacio())
+            celda = destino[TRAMOS_ANTIGUEDAD[indice]]
+            celda['cantidad'] += fila.cantidad
+            celda['saldo'] += saldo
+
+    return reporte
+
+# ========================================
+# PERFILADOR BAJO DEMANDA
+# ========================================
+# Con PERFILADOR=1, un admin (PERFILADOR_ADMINS) puede perfilar una petición
+# enviando `X-Perfilar: 1` o `?perfilar=1`. Sin la variable no se registra
+# ningún hook: el resto de peticiones no paga nada.
+perfilador = None
+if os.environ.get('PERFILADOR', '0') == '1':
+    perfilador = Perfilador(
+        directorio=os.environ.get('PERFILADOR_DIR', os.path.join(tempfile.gettempdir(), 'ventas_perfiles')),
+        admins=os.environ.get('PERFILADOR_ADMINS', '').split(','),
+        max_perfiles=int(os.environ.get('PERFILADOR_MAX', 50)),
+        intervalo_muestreo=int(os.environ.get('PERFILADOR_MUESTREO_MS', 2)) / 1000
+    )
+
+    @app.before_request
+    def iniciar_perfil():
+        if not perfilador.solicitado(request):
+            return
+        if current_user.is_authenticated and perfilador.autorizado(current_user.email):
+            g.captura_perfil = perfilador.iniciar()
+
+    @app.after_request
+    def guardar_perfil(respuesta):
+        captura = g.pop('captura_perfil', None)
+        if captura is None:
+            return respuesta
+        captura.terminar()
+        try:
+            nombre = perfilador.guardar(captura, {
+                'metodo': request.method,
+                'ruta': request.full_path.rstrip('?'),
+                'endpoint': request.endpoint,
+                'usuario': current_user.email,
+                'estado': respuesta.status_code,
+                'memoria_peticion': contexto_datos.resumen_peticion(),
+                'memoria_worker': contexto_datos.estadisticas()
+            })
+            respuesta.headers['X-Perfil'] = nombre
+            log_perfil.info("Perfil guardado", extra={'evento': 'perfil_guardado', 'archivo': nombre})
+        except Exception:
+            log_perfil.exception("Error al guardar el perfil", extra={'evento': 'perfil_error'})
+        return respuesta
+
+    @app.teardown_request
+    def descartar_perfil(exc):
+        # Si la petición falló antes de after_request, soltar cProfile y los listeners
+        captura = g.pop('captura_perfil', None)
+        if captura is not None:
+            captura.terminar()
+
+def es_admin_perfilador():
+    return perfilador is not None and perfilador.autorizado(current_user.email)
+
+@app.route('/api/perfiles')
+@login_required
+def api_perfiles():
+    """
+    Lista los perfiles guardados (ruta, usuario, duración y resumen de SQL)
+    Solo para admins y solo con PERFILADOR=1
+    """
+    if not es_admin_perfilador():
+        abort(404)
+    return jsonify(perfilador.listar())
+
+@app.route('/api/perfiles/<nombre>')
+@login_required
+def api_perfil_archivo(nombre):
+    """
+    Descarga un archivo de perfil: <nombre>.prof (pstats), .folded (flamegraph) o .json
+    """
+    if not es_admin_perfilador():
+        abort(404)
+    ruta = perfilador.ruta_archivo(nombre)
+    if ruta is None:
+        abort(404)
+    return send_file(ruta, as_attachment=True, download_name=nombre)
+
+# ========================================
 # RUTAS DE AUTENTICACIÓN
 # ========================================
 
@@ -600,16 +2205,14 @@ def auth_callback():
             
             # Iniciar sesión
             login_user(user)
-            print(f"✅ Usuario autenticado: {user_info['email']}")
+            log_auth.info("Usuario autenticado", extra={'evento': 'login', 'usuario': user_info['email']})
             return redirect(url_for('index'))
         else:
-            print("❌ Error: No se recibió información del usuario")
+            log_auth.warning("No se recibió información del usuario", extra={'evento': 'login_sin_datos'})
             return redirect(url_for('login'))
             
-    except Exception as e:
-        print(f"❌ Error en autenticación: {e}")
-        import traceback
-        traceback.print_exc()
+    except Exception:
+        log_auth.exception("Error en autenticación", extra={'evento': 'login_error'})
         return redirect(url_for('login'))
 
 @app.route('/logout')
@@ -618,9 +2221,10 @@ def logout():
     """
     Cerrar sesión
     """
+    usuario_email = getattr(current_user, 'email', None)
     logout_user()
     session.pop('user', None)
-    print("👋 Usuario cerró sesión")
+    log_auth.info("Usuario cerró sesión", extra={'evento': 'logout', 'usuario': usuario_email})
     return redirect(url_for('login'))
 
 # ========================================
@@ -629,24 +2233,17 @@ def logout():
 
 @app.route('/')
 @login_required
+@solo_lectura
 def index():
     """
     Página principal con formulario de registro y lista de ventas
     """
     usuario_email = current_user.email
-    estadisticas = obtener_estadisticas(usuario_email)
-    # Obtener ventas activas del usuario desde BD
-    ventas_db = Venta.query.filter_by(
-        usuario_email=usuario_email,
-        estado='Activa'
-    ).order_by(Venta.fecha.desc()).all()
-    ventas_activas = [v.to_dict() for v in ventas_db]
+    # Estadísticas y tabla de ventas activas salen de la caché si los datos no cambiaron
+    fragmentos = renderizar_fragmentos_index(usuario_email)
     return render_template('index.html', 
-                         ventas=ventas_activas, 
+                         fragmentos=fragmentos,
                          rubros=RUBROS,
-                         estadisticas=estadisticas,
-                         formatear_fecha=formatear_fecha,
-                         formatear_moneda=formatear_moneda,
                          datetime=datetime)
 
 @app.route('/agregar', methods=['POST'])
@@ -667,35 +2264,40 @@ def agregar():
         
         # Validaciones
         if not cliente:
-            print("❌ Error: Cliente vacío")
+            log_ventas.warning("Cliente vacío", extra={'evento': 'venta_invalida'})
             return redirect('/')
         
         # Validación obligatoria de rubros
         if not rubros:
-            print("❌ Error: Debe seleccionar al menos un rubro")
+            log_ventas.warning("Debe seleccionar al menos un rubro", extra={'evento': 'venta_invalida'})
             return redirect('/')
         
         try:
             valor_total = float(valor_total) if valor_total else 0
             abono = float(abono) if abono else 0
         except ValueError as e:
-            print(f"❌ Error al convertir valores numéricos: {e}")
+            log_ventas.warning("Valores numéricos inválidos", extra={'evento': 'venta_invalida', 'detalle': str(e)})
             return redirect('/')
         
         if valor_total < 0 or abono < 0:
-            print("❌ Error: Valores negativos no permitidos")
+            log_ventas.warning("Valores negativos no permitidos", extra={'evento': 'venta_invalida'})
             return redirect('/')
         
         if not fecha:
             fecha = datetime.now().strftime("%Y-%m-%d")
         
         nueva_venta = agregar_venta(usuario_email, cliente, valor_total, abono, rubros, fecha)
-        print(f"✅ Venta agregada: ID={nueva_venta['id']}, Cliente='{nueva_venta['cliente']}', Valor=${nueva_venta['valor_total']}, Rubros: {', '.join(rubros)}")
+        log_ventas.info("Venta agregada", extra={
+            'evento': 'venta_agregada',
+            'venta_id': nueva_venta['id'],
+            'valor_total': nueva_venta['valor_total'],
+            'rubros': rubros
+        })
         
         return redirect('/')
         
-    except Exception as e:
-        print(f"❌ Error inesperado en agregar venta: {e}")
+    except Exception:
+        log_ventas.exception("Error inesperado en agregar venta", extra={'evento': 'venta_error'})
         return redirect('/')
 
 @app.route('/eliminar/<int:id>')
@@ -706,14 +2308,15 @@ def eliminar(id):
     """
     usuario_email = current_user.email
     if eliminar_venta(usuario_email, id):
-        print(f"🗑️ Venta {id} eliminada")
+        log_ventas.info("Venta eliminada", extra={'evento': 'venta_eliminada', 'venta_id': id})
     else:
-        print(f"❌ Venta {id} no encontrada")
+        log_ventas.warning("Venta no encontrada al eliminar", extra={'evento': 'venta_no_encontrada', 'venta_id': id})
     
     return redirect('/')
 
 @app.route('/api/estadisticas')
 @login_required
+@solo_lectura
 def api_estadisticas():
     """
     API para obtener estadísticas en formato JSON
@@ -723,14 +2326,112 @@ def api_estadisticas():
 
 @app.route('/api/ventas')
 @login_required
+@solo_lectura
 def api_ventas():
     """
     API para obtener todas las ventas del usuario en formato JSON
     """
     usuario_email = current_user.email
-    ventas_db = Venta.query.filter_by(usuario_email=usuario_email).all()
-    ventas_dict = [v.to_dict() for v in ventas_db]
-    return jsonify(ventas_dict)
+    return jsonify(ventas_usuario(usuario_email) + ventas_archivadas_usuario(usuario_email))
+
+@app.route('/api/ventas/cambios')
+@login_required
+def api_ventas_cambios():
+    """
+    API de sincronización delta: devuelve solo lo que cambió desde el token del cliente
+    Uso: /api/ventas/cambios?desde=<token> (sin 'desde' devuelve todo)
+    """
+    usuario_email = current_user.email
+    desde = request.args.get('desde', '0').strip() or '0'
+    if not desde.isdigit():
+        return jsonify({'error': 'Token inválido'}), 400
+    return jsonify(obtener_cambios(usuario_email, int(desde)))
+
+@app.route('/api/sincronizar', methods=['POST'])
+@login_required
+def api_sincronizar():
+    """
+    Recibe en un solo envío las ventas y pagos que el navegador encoló sin conexión
+    Cuerpo: {"operaciones": [{"clave": "...", "tipo": "agregar" | "pago", "datos": {...}}]}
+    Se aplican en orden; una clave ya aplicada devuelve la respuesta original
+    """
+    usuario_email = current_user.email
+    cuerpo = request.get_json(silent=True) or {}
+    operaciones = cuerpo.get('operaciones')
+    if not isinstance(operaciones, list):
+        return jsonify({'error': 'Se esperaba una lista de operaciones'}), 400
+    if len(operaciones) > SINCRONIZACION_MAX_LOTE:
+        return jsonify({'error': f'Máximo {SINCRONIZACION_MAX_LOTE} operaciones por envío'}), 413
+
+    resultados = [
+        aplicar_operacion(usuario_email, operacion if isinstance(operacion, dict) else {})
+        for operacion in operaciones
+    ]
+    log_ventas.info("Lote sin conexión sincronizado", extra={
+        'evento': 'sincronizacion',
+        'operaciones': len(resultados),
+        'aplicadas': sum(1 for r in resultados if r['estado'] == 'aplicada' and not r['repetida']),
+        'repetidas': sum(1 for r in resultados if r['repetida']),
+        'rechazadas': sum(1 for r in resultados if r['estado'] == 'rechazada')
+    })
+    return jsonify({'resultados': resultados, 'token': obtener_version_datos(usuario_email)})
+
+@app.route('/sw.js')
+def service_worker():
+    """
+    Service worker de la app sin conexión; se sirve desde la raíz para controlar todas las páginas
+    """
+    respuesta = send_file(os.path.join(app.static_folder, 'js', 'sw.js'), mimetype='application/javascript')
+    # El navegador debe ver enseguida una versión nueva del service worker
+    respuesta.headers['Cache-Control'] = 'no-cache'
+    return respuesta
+
+@app.route('/api/eventos')
+@login_required
+def api_eventos():
+    """
+    Flujo Server-Sent Events con los cambios del usuario en vivo
+    Al reconectar, el navegador envía Last-Event-ID y se reenvían los eventos perdidos
+    """
+    usuario_email = current_user.email
+    # Suscribir antes de leer los perdidos: así no se pierde nada entre ambos pasos
+    cola = bus_eventos.suscribir(usuario_email, EVENTOS_MAX_FLUJOS)
+    if cola is None:
+        # Worker lleno: el navegador no reintenta solo tras un 503, lo hace script.js
+        log_eventos.warning("Límite de flujos SSE alcanzado", extra={
+            'evento': 'sse_lleno',
+            'maximo': EVENTOS_MAX_FLUJOS
+        })
+        respuesta = Response(f"retry: {EVENTOS_REINTENTO * 1000}\n\n", status=503, mimetype='text/event-stream')
+        respuesta.headers['Retry-After'] = str(EVENTOS_REINTENTO)
+        return respuesta
+    pendientes = []
+    # Last-Event-ID lo manda EventSource al reconectar; ultimo_id, script.js al crear uno nuevo
+    ultimo_id = (request.headers.get('Last-Event-ID') or request.args.get('ultimo_id', '')).strip()
+    if ultimo_id.isdigit():
+        # Se relee la ventana anterior por si algo se confirmó tarde; los
+        # manejadores de script.js toleran recibir un evento dos veces
+        desde = max(0, int(ultimo_id) - EVENTOS_VENTANA_IDS)
+        pendientes = [(i, tipo, datos) for i, _, tipo, datos in _leer_eventos_desde(desde, usuario_email)]
+
+    respuesta = Response(
+        flujo_sse(bus_eventos, usuario_email, cola, pendientes, EVENTOS_DURACION_MAXIMA),
+        mimetype='text/event-stream'
+    )
+    respuesta.headers['Cache-Control'] = 'no-cache'
+    respuesta.headers['X-Accel-Buffering'] = 'no'
+    return respuesta
+
+@app.route('/api/fragmentos')
+@login_required
+@solo_lectura
+def api_fragmentos():
+    """
+    HTML de los bloques del dashboard para refrescarlos sin recargar la página
+    Sale de la caché de fragmentos, así que varias pestañas pidiéndolo tras un evento no recalculan nada
+    """
+    fragmentos = renderizar_fragmentos_index(current_user.email)
+    return jsonify({nombre: str(html) for nombre, html in fragmentos.items()})
 
 @app.route('/pago/<int:venta_id>', methods=['GET', 'POST'])
 @login_required
@@ -749,21 +2450,25 @@ def gestionar_pago(venta_id):
             tipo_pago = request.form.get('tipo_pago', 'Abono')
             
             if monto_pago <= 0:
-                print("❌ Error: Monto de pago inválido")
+                log_pagos.warning("Monto de pago inválido", extra={'evento': 'pago_invalido', 'venta_id': venta_id})
                 return redirect(f'/pago/{venta_id}')
             
             venta_actualizada = registrar_pago(usuario_email, venta_id, monto_pago, tipo_pago)
             if venta_actualizada:
-                print(f"✅ Pago registrado: Venta {venta_id}, Monto: ${monto_pago}")
-                if venta_actualizada['estado'] == 'Cerrada':
-                    print(f"🎉 Venta {venta_id} cerrada completamente")
+                log_pagos.info("Pago registrado", extra={
+                    'evento': 'pago_registrado',
+                    'venta_id': venta_id,
+                    'monto': monto_pago,
+                    'tipo_pago': tipo_pago,
+                    'estado_venta': venta_actualizada['estado']
+                })
             else:
-                print(f"❌ Error al registrar pago en venta {venta_id}")
+                log_pagos.warning("Venta no encontrada al registrar pago", extra={'evento': 'pago_error', 'venta_id': venta_id})
                 
         except ValueError as e:
-            print(f"❌ Error de validación: {e}")
-        except Exception as e:
-            print(f"❌ Error inesperado: {e}")
+            log_pagos.warning("Error de validación", extra={'evento': 'pago_invalido', 'venta_id': venta_id, 'detalle': str(e)})
+        except Exception:
+            log_pagos.exception("Error inesperado al registrar pago", extra={'evento': 'pago_error', 'venta_id': venta_id})
         
         return redirect('/')
     
@@ -772,6 +2477,7 @@ def gestionar_pago(venta_id):
 
 @app.route('/historial/<int:venta_id>')
 @login_required
+@solo_lectura
 def ver_historial(venta_id):
     """
     Ruta para ver el historial de pagos de una venta
@@ -785,6 +2491,7 @@ def ver_historial(venta_id):
 
 @app.route('/buscar')
 @login_required
+@solo_lectura
 def buscar_ventas():
     """
     Ruta para buscar ventas por nombre de cliente
@@ -792,27 +2499,20 @@ def buscar_ventas():
     usuario_email = current_user.email
     query = request.args.get('q', '').strip().lower()
     
-    # Obtener ventas activas del usuario desde BD
-    ventas_query = Venta.query.filter_by(
-        usuario_email=usuario_email,
-        estado='Activa'
-    )
-    
+    # Ventas activas cuyo cliente contiene la búsqueda (filtrado en SQL)
+    consulta = consulta_ventas(Venta, usuario_email).filter(Venta.estado == 'Activa')
     if query:
-        # Filtrar por nombre de cliente que contenga la búsqueda
-        ventas_query = ventas_query.filter(Venta.cliente.ilike(f'%{query}%'))
-    
-    ventas_db = ventas_query.order_by(Venta.fecha.desc()).all()
+        consulta = consulta.filter(Venta.cliente.ilike(f'%{query}%'))
+    ventas_db = db.session.execute(consulta.order_by(Venta.fecha.desc())).scalars().all()
     ventas_filtradas = [v.to_dict() for v in ventas_db]
     
-    estadisticas = obtener_estadisticas(usuario_email)
+    # La tabla depende de la búsqueda; las estadísticas pueden venir de la caché
+    fragmentos = renderizar_fragmentos_index(usuario_email, ventas=ventas_filtradas)
     
     return render_template('index.html', 
                          ventas=ventas_filtradas, 
+                         fragmentos=fragmentos,
                          rubros=RUBROS,
-                         estadisticas=estadisticas,
-                         formatear_fecha=formatear_fecha,
-                         formatear_moneda=formatear_moneda,
                          datetime=datetime,
                          busqueda=query)
 
@@ -828,40 +2528,76 @@ def cierre_mensual():
         try:
             mes = int(request.form.get('mes', datetime.now().month))
             año = int(request.form.get('año', datetime.now().year))
-            
-            resumen = cerrar_mes_estadisticas(usuario_email, mes, año)
-            print(f"✅ Cierre mensual realizado: {resumen['ventas_excluidas']} ventas excluidas")
-            
-            return redirect('/')
-            
-        except Exception as e:
-            print(f"❌ Error en cierre mensual: {e}")
+            # La clave viene del formulario: un doble clic reutiliza el mismo trabajo
+            clave = request.form.get('clave_idempotencia') or f"cierre-{año}-{mes:02d}-{datetime.now():%Y%m%d%H%M}"
+
+            trabajo = encolar_trabajo(usuario_email, 'cierre_mensual', {'mes': mes, 'año': año}, clave)
+            return redirect(url_for('cierre_mensual', trabajo=trabajo['id']))
+
+        except Exception:
+            log_cierre.exception("Error al encolar el cierre mensual", extra={'evento': 'cierre_error'})
             return redirect('/')
-    
-    # GET: Mostrar formulario de cierre mensual
+
+    # GET: Mostrar formulario de cierre mensual (y el estado del trabajo si se acaba de enviar)
+    trabajo = None
+    trabajo_id = request.args.get('trabajo', type=int)
+    if trabajo_id:
+        trabajo = obtener_trabajo(usuario_email, trabajo_id)
+
     ventas_pendientes = obtener_ventas_cerradas_pendientes(usuario_email)
     estadisticas = obtener_estadisticas(usuario_email)
-    
-    return render_template('cierre_mensual.html', 
+
+    return render_template('cierre_mensual.html',
                          ventas_pendientes=ventas_pendientes,
                          estadisticas=estadisticas,
+                         trabajo=trabajo,
+                         clave_idempotencia=secrets.token_hex(16),
                          formatear_fecha=formatear_fecha,
                          formatear_moneda=formatear_moneda,
                          datetime=datetime)
 
+@app.route('/api/trabajos', methods=['GET', 'POST'])
+@login_required
+def api_trabajos():
+    """
+    GET: últimos trabajos del usuario
+    POST: encola un trabajo. JSON: {"tipo": ..., "parametros": {...}, "clave_idempotencia": ...}
+    """
+    usuario_email = current_user.email
+
+    if request.method == 'POST':
+        datos = request.get_json(silent=True) or {}
+        clave = datos.get('clave_idempotencia') or request.headers.get('Idempotency-Key')
+        try:
+            trabajo = encolar_trabajo(usuario_email, datos.get('tipo', ''), datos.get('parametros') or {}, clave)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        return jsonify(trabajo), 202
+
+    trabajos = Trabajo.query.filter_by(usuario_email=usuario_email).order_by(Trabajo.id.desc()).limit(20).all()
+    return jsonify([t.to_dict() for t in trabajos])
+
+@app.route('/api/trabajos/<int:trabajo_id>')
+@login_required
+def api_trabajo(trabajo_id):
+    """
+    API para consultar estado, progreso y resultado de un trabajo
+    """
+    trabajo = obtener_trabajo(current_user.email, trabajo_id)
+    if not trabajo:
+        return jsonify({'error': 'Trabajo no encontrado'}), 404
+    return jsonify(trabajo)
+
 @app.route('/ventas-excluidas')
 @login_required
+@solo_lectura
 def ventas_excluidas():
     """
     Ruta para ver las ventas excluidas de estadísticas
     """
     usuario_email = current_user.email
-    ventas_excluidas_db = Venta.query.filter_by(
-        usuario_email=usuario_email,
-        incluida_en_estadisticas=False
-    ).order_by(Venta.fecha.desc()).all()
-    
-    ventas_excluidas = [v.to_dict() for v in ventas_excluidas_db]
+    # Incluye las ventas que ya se movieron al archivo
+    ventas_excluidas = obtener_ventas_excluidas(usuario_email)
     estadisticas = obtener_estadisticas(usuario_email)
     
     return render_template('ventas_excluidas.html', 
@@ -873,6 +2609,7 @@ def ventas_excluidas():
 
 @app.route('/estadisticas-periodo', methods=['GET', 'POST'])
 @login_required
+@solo_lectura
 def estadisticas_periodo():
     """
     Ruta para ver estadísticas por período de tiempo
@@ -893,7 +2630,11 @@ def estadisticas_periodo():
                                      datetime=datetime,
                                      rubros=RUBROS)
             else:
-                print("❌ Error al obtener estadísticas del período")
+                log_cierre.warning("No se pudieron obtener las estadísticas del período", extra={
+                    'evento': 'estadisticas_periodo_error',
+                    'fecha_inicio': fecha_inicio,
+                    'fecha_fin': fecha_fin
+                })
                 return redirect('/estadisticas-periodo')
     
     # GET: Mostrar formulario de selección de período
@@ -910,6 +2651,7 @@ def estadisticas_periodo():
 
 @app.route('/api/estadisticas-periodo')
 @login_required
+@solo_lectura
 def api_estadisticas_periodo():
     """
     API para obtener estadísticas por período en formato JSON
@@ -925,19 +2667,240 @@ def api_estadisticas_periodo():
     
     return jsonify({'error': 'Fechas requeridas'}), 400
 
+@app.route('/antiguedad-saldos')
+@login_required
+@solo_lectura
+def antiguedad_saldos():
+    """
+    Ruta para ver quién debe y desde hace cuánto (saldo por tramos de días y rubro)
+    """
+    reporte = obtener_antiguedad_saldos(current_user.email)
+    return render_template('antiguedad_saldos.html',
+                         reporte=reporte,
+                         formatear_fecha=formatear_fecha,
+                         formatear_moneda=formatear_moneda,
+                         datetime=datetime)
+
+@app.route('/api/antiguedad-saldos')
+@login_required
+@solo_lectura
+def api_antiguedad_saldos():
+    """
+    API con el reporte de antigüedad de saldos en formato JSON
+    Acepta ?fecha=YYYY-MM-DD para calcularlo a otra fecha de corte
+    """
+    fecha = request.args.get('fecha', '')
+    hoy = None
+    if fecha:
+        try:
+            hoy = datetime.strptime(fecha, "%Y-%m-%d").date()
+        except ValueError:
+            return jsonify({'error': 'Fecha inválida, usa YYYY-MM-DD'}), 400
+    return jsonify(obtener_antiguedad_saldos(current_user.email, hoy))
+
+@app.route('/api/clientes/deudores')
+@login_required
+@solo_lectura
+def api_clientes_deudores():
+    """
+    API con los clientes que más deben, leídos de los totales acumulados (ix_cliente_usuario_saldo)
+    Acepta ?limite=N (máximo 100)
+    """
+    limite = min(max(request.args.get('limite', 20, type=int), 1), 100)
+    clientes = Cliente.query.filter(
+        Cliente.usuario_email == current_user.email,
+        Cliente.saldo_pendiente > 0
+    ).order_by(Cliente.saldo_pendiente.desc()).limit(limite).all()
+    return jsonify([cliente.to_dict() for cliente in clientes])
+
+@app.route('/cliente/<int:cliente_id>')
+@login_required
+@solo_lectura
+def ver_cliente(cliente_id):
+    """
+    Ruta para ver el detalle de un cliente: sus totales y todas sus ventas
+    """
+    usuario_email = current_user.email
+    cliente = Cliente.query.filter_by(id=cliente_id, usuario_email=usuario_email).first()
+    if not cliente:
+        return redirect('/')
+    
+    # Sus ventas, incluidas las archivadas (índice por cliente_id)
+    ventas_db = Venta.query.options(*con_detalle(Venta)).filter_by(
+        usuario_email=usuario_email, cliente_id=cliente_id
+    ).all()
+    ventas_db += VentaArchivada.query.options(*con_detalle(VentaArchivada)).filter_by(
+        usuario_email=usuario_email, cliente_id=cliente_id
+    ).all()
+    ventas = sorted((v.to_dict() for v in ventas_db), key=lambda v: (v['fecha'], v['id']), reverse=True)
+    
+    return render_template('cliente.html',
+                         cliente=cliente.to_dict(),
+                         ventas=ventas,
+                         formatear_fecha=formatear_fecha,
+                         formatear_moneda=formatear_moneda,
+                         datetime=datetime)
+
 @app.route('/privacy')
 def privacy():
     """
     Política de privacidad - Requerida para publicar la app en Google
     """
-    return render_template('privacy.html')
+    return render_template('privacy.html', datetime=datetime)
 
 @app.route('/terms')
 def terms():
     """
     Términos de servicio - Requerido para publicar la app en Google
     """
-    return render_template('terms.html')
+    return render_template('terms.html', datetime=datetime)
+
+# ========================================
+# PARTICIONES POR USUARIO
+# ========================================
+# Con PARTICIONES=1 cada usuario tiene su propia base para las tablas de
+# abajo; trabajos, eventos y el registro de inquilinos quedan en la
+# principal. Antes de activarlo en una base con datos hay que migrarlos:
+#     flask particionar-inquilinos
+TABLAS_INQUILINO = (
+    'version_datos', 'cliente', 'venta', 'venta_rubro', 'pago', 'venta_eliminada', 'operacion_sincronizada',
+    'venta_archivada', 'venta_rubro_archivado', 'pago_archivado'
+)
+
+def preparar_inquilino(usuario_email, engine):
+    """
+    Crea las tablas en la base de un inquilino nuevo y lo registra en la principal
+    Args:
+        usuario_email (str): Email del usuario
+        engine: Engine de la base del inquilino
+    """
+    tablas = [db.metadata.tables[nombre] for nombre in TABLAS_INQUILINO]
+    db.metadata.create_all(engine, tables=tablas)
+    asegurar_columnas(engine, tablas)
+    asegurar_indices(engine, tablas)
+    asegurar_autoincremento(engine)
+    try:
+        with db.engine.begin() as conexion:
+            existe = conexion.execute(db.select(Inquilino.usuario_email).where(Inquilino.usuario_email == usuario_email)).first()
+            if not existe:
+                conexion.execute(db.insert(Inquilino).values(usuario_email=usuario_email, creado_en=_ahora()))
+    except IntegrityError:
+        pass  # Otro worker lo registró al mismo tiempo
+
+def listar_inquilinos():
+    """Emails de los usuarios que ya tienen base propia"""
+    with db.engine.connect() as conexion:
+        return [fila[0] for fila in conexion.execute(db.select(Inquilino.usuario_email).order_by(Inquilino.usuario_email))]
+
+if os.environ.get('PARTICIONES', '0') == '1':
+    particiones.configurar(
+        # Cualquier URL con {inquilino}; por defecto un archivo SQLite por usuario
+        os.environ.get('PARTICIONES_URL') or url_sqlite_por_defecto(
+            os.environ.get('PARTICIONES_DIR', os.path.join(app.instance_path, 'inquilinos'))
+        ),
+        TABLAS_INQUILINO,
+        preparar=preparar_inquilino,
+        max_engines=int(os.environ.get('PARTICIONES_MAX_ABIERTAS', 128))
+    )
+
+    @app.before_request
+    def fijar_inquilino():
+        if current_user.is_authenticated:
+            g.token_inquilino = particiones.fijar(current_user.email)
+
+    @app.teardown_request
+    def soltar_inquilino(exc):
+        token = g.pop('token_inquilino', None)
+        if token is not None:
+            particiones.restablecer(token)
+
+def _consultas_inquilino(usuario_email):
+    """
+    Filas de un usuario en las tablas particionadas, padres antes que hijos
+    Returns:
+        list: (tabla, select) por cada tabla de TABLAS_INQUILINO
+    """
+    ventas = db.select(Venta.id).where(Venta.usuario_email == usuario_email)
+    archivadas = db.select(VentaArchivada.id).where(VentaArchivada.usuario_email == usuario_email)
+    return [
+        (VersionDatos.__table__, db.select(VersionDatos.__table__).where(VersionDatos.usuario_email == usuario_email)),
+        (Cliente.__table__, db.select(Cliente.__table__).where(Cliente.usuario_email == usuario_email)),
+        (Venta.__table__, db.select(Venta.__table__).where(Venta.usuario_email == usuario_email)),
+        (VentaRubro.__table__, db.select(VentaRubro.__table__).where(VentaRubro.venta_id.in_(ventas))),
+        (Pago.__table__, db.select(Pago.__table__).where(Pago.venta_id.in_(ventas))),
+        (VentaEliminada.__table__, db.select(VentaEliminada.__table__).where(VentaEliminada.usuario_email == usuario_email)),
+        (OperacionSincronizada.__table__, db.select(OperacionSincronizada.__table__).where(OperacionSincronizada.usuario_email == usuario_email)),
+        (VentaArchivada.__table__, db.select(VentaArchivada.__table__).where(VentaArchivada.usuario_email == usuario_email)),
+        (VentaRubroArchivado.__table__, db.select(VentaRubroArchivado.__table__).where(VentaRubroArchivado.venta_id.in_(archivadas))),
+        (PagoArchivado.__table__, db.select(PagoArchivado.__table__).where(PagoArchivado.venta_id.in_(archivadas))),
+    ]
+
+def migrar_a_particiones(borrar_origen=False, tamano_lote=1000):
+    """
+    Copia los datos de cada usuario desde las tablas compartidas a su base propia
+    Los usuarios cuya base ya tiene datos se saltan, así que se puede repetir sin duplicar
+    Args:
+        borrar_origen (bool): Borrar de la base principal lo que se copió
+        tamano_lote (int): Filas por INSERT
+    Returns:
+        dict: usuario_email -> filas copiadas (None si se saltó)
+    """
+    if not particiones.activa:
+        raise RuntimeError("Activa PARTICIONES=1 antes de migrar")
+
+    with db.engine.connect() as origen:
+        emails = sorted({
+            fila[0]
+            for modelo in (VersionDatos, Venta, VentaArchivada, VentaEliminada)
+            for fila in origen.execute(db.select(modelo.usuario_email).distinct())
+        })
+
+    resumen = {}
+    for usuario_email in emails:
+        consultas = _consultas_inquilino(usuario_email)
+        destino_engine = particiones.engine_para(usuario_email)
+        with db.engine.connect() as origen, destino_engine.begin() as destino:
+            tiene_datos = any(
+                destino.execute(db.select(db.func.count()).select_from(tabla)).scalar()
+                for tabla in (VersionDatos.__table__, Venta.__table__, VentaArchivada.__table__)
+            )
+            if tiene_datos:
+                resumen[usuario_email] = None
+                log_datos.info("El inquilino ya tiene datos en su base, se salta", extra={
+                    'evento': 'particion_saltada',
+                    'usuario': usuario_email
+                })
+                continue
+
+            filas = 0
+            for tabla, consulta in consultas:
+                resultado = origen.execution_options(stream_results=True).execute(consulta)
+                for lote in resultado.mappings().partitions(tamano_lote):
+                    destino.execute(tabla.insert(), [dict(fila) for fila in lote])
+                    filas += len(lote)
+        # Los IDs archivados copiados pueden superar a los vivos
+        asegurar_autoincremento(destino_engine)
+        resumen[usuario_email] = filas
+
+        if borrar_origen:
+            # Hijos primero: las subconsultas de ventas todavía encuentran a sus padres
+            with db.engine.begin() as origen:
+                for tabla, consulta in reversed(consultas):
+                    origen.execute(tabla.delete().where(consulta.whereclause))
+        log_datos.info("Filas copiadas a la base del inquilino", extra={
+            'evento': 'particion_migrada',
+            'usuario': usuario_email,
+            'filas': filas
+        })
+    return resumen
+
+@app.cli.command('particionar-inquilinos')
+@click.option('--borrar-origen', is_flag=True, help='Borrar de la base principal las filas ya copiadas')
+def particionar_inquilinos_comando(borrar_origen):
+    """Separa las tablas compartidas en una base por usuario (requiere PARTICIONES=1)"""
+    resumen = migrar_a_particiones(borrar_origen=borrar_origen)
+    migrados = sum(1 for filas in resumen.values() if filas is not None)
+    click.echo(f"✅ Migración completada: {migrados} de {len(resumen)} usuarios")
 
 # ========================================
 # INICIALIZACIÓN DE BASE DE DATOS
@@ -948,15 +2911,122 @@ def init_db():
     """
     with app.app_context():
         db.create_all()
-        print("✅ Base de datos inicializada correctamente")
+        asegurar_columnas()
+        asegurar_indices()
+        asegurar_autoincremento()
+        log_datos.info("Base de datos inicializada", extra={'evento': 'bd_inicializada'})
+
+def asegurar_columnas(engine=None, tablas=None):
+    """
+    Agrega a las tablas existentes las columnas nuevas (siempre opcionales)
+    create_all no modifica tablas que ya existen
+    Args:
+        engine: Base a revisar. Si es None, la principal
+        tablas (list): Tablas a revisar. Si es None, todas
+    """
+    engine = engine or db.engine
+    inspector = db.inspect(engine)
+    tablas_existentes = set(inspector.get_table_names())
+    with engine.begin() as conexion:
+        for tabla in tablas or db.metadata.sorted_tables:
+            if tabla.name not in tablas_existentes:
+                continue
+            columnas_existentes = {c['name'] for c in inspector.get_columns(tabla.name)}
+            for columna in tabla.columns:
+                if columna.name in columnas_existentes or not columna.nullable:
+                    continue
+                tipo = columna.type.compile(dialect=engine.dialect)
+                conexion.execute(db.text(f'ALTER TABLE {tabla.name} ADD COLUMN {columna.name} {tipo}'))
+                log_datos.info("Columna agregada", extra={'evento': 'columna_agregada', 'tabla': tabla.name, 'columna': columna.name})
+
+def asegurar_indices(engine=None, tablas=None):
+    """
+    Crea los índices nuevos en bases ya existentes
+    (create_all solo crea índices al crear la tabla por primera vez)
+    """
+    for tabla in tablas or db.metadata.sorted_tables:
+        for indice in tabla.indexes:
+            indice.create(engine or db.engine, checkfirst=True)
+
+# Tablas cuyos IDs pasan al archivo: un ID ya entregado no debe volver a salir
+TABLAS_CON_ARCHIVO = {'venta': 'venta_archivada', 'pago': 'pago_archivado', 'venta_rubro': 'venta_rubro_archivado'}
+
+def asegurar_autoincremento(engine=None):
+    """
+    En SQLite, reconstruye con AUTOINCREMENT las tablas creadas sin él y deja
+    sqlite_sequence por encima del mayor ID vivo o archivado
+    Sin AUTOINCREMENT, SQLite reutiliza el ID más alto si esa fila se borra (o
+    se archiva), y la venta nueva chocaría con la archivada al volver a archivar
+    Args:
+        engine: Base a revisar. Si es None, la principal
+    """
+    engine = engine or db.engine
+    if engine.dialect.name != 'sqlite':
+        return
+    tablas_existentes = set(db.inspect(engine).get_table_names())
+    conexion = engine.raw_connection()
+    sqlite = conexion.driver_connection
+    nivel_aislamiento = sqlite.isolation_level
+    # Transacción explícita: pysqlite no abre una por sí solo antes de CREATE/DROP
+    sqlite.isolation_level = None
+    try:
+        cursor = sqlite.cursor()
+        # DROP TABLE con claves foráneas activas borraría en cascada pagos y rubros
+        cursor.execute('PRAGMA foreign_keys = OFF')
+        cursor.execute('BEGIN IMMEDIATE')
+        try:
+            for nombre, nombre_archivo in TABLAS_CON_ARCHIVO.items():
+                if nombre not in tablas_existentes:
+                    continue
+                tabla = db.metadata.tables[nombre]
+                sql = cursor.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = ?", (nombre,)).fetchone()[0]
+                if 'AUTOINCREMENT' not in sql.upper():
+                    # Reconstrucción recomendada por SQLite: tabla nueva, copiar, borrar y renombrar
+                    columnas_existentes = {fila[1] for fila in cursor.execute(f'PRAGMA table_info({nombre})')}
+                    columnas = ', '.join(c.name for c in tabla.columns if c.name in columnas_existentes)
+                    crear = str(CreateTable(tabla).compile(dialect=engine.dialect))
+                    cursor.execute(crear.replace(f'CREATE TABLE {nombre} (', f'CREATE TABLE {nombre}__nuevo (', 1))
+                    cursor.execute(f'INSERT INTO {nombre}__nuevo ({columnas}) SELECT {columnas} FROM {nombre}')
+                    cursor.execute(f'DROP TABLE {nombre}')
+                    cursor.execute(f'ALTER TABLE {nombre}__nuevo RENAME TO {nombre}')
+                    for indice in tabla.indexes:
+                        cursor.execute(str(CreateIndex(indice).compile(dialect=engine.dialect)))
+                    log_datos.info("Tabla reconstruida con AUTOINCREMENT", extra={'evento': 'tabla_reconstruida', 'tabla': nombre})
+
+                maximo = cursor.execute(f'SELECT MAX(id) FROM {nombre}').fetchone()[0] or 0
+                if nombre_archivo in tablas_existentes:
+                    maximo = max(maximo, cursor.execute(f'SELECT MAX(id) FROM {nombre_archivo}').fetchone()[0] or 0)
+                secuencia = cursor.execute('SELECT seq FROM sqlite_sequence WHERE name = ?', (nombre,)).fetchone()
+                if secuencia is None:
+                    cursor.execute('INSERT INTO sqlite_sequence (name, seq) VALUES (?, ?)', (nombre, maximo))
+                elif secuencia[0] < maximo:
+                    cursor.execute('UPDATE sqlite_sequence SET seq = ? WHERE name = ?', (maximo, nombre))
+            cursor.execute('COMMIT')
+        except Exception:
+            cursor.execute('ROLLBACK')
+            raise
+    finally:
+        sqlite.isolation_level = nivel_aislamiento
+        conexion.close()
 
 # Inicializar base de datos al cargar la aplicación (para producción con gunicorn)
 with app.app_context():
     try:
         db.create_all()
-        print("✅ Base de datos verificada/inicializada")
-    except Exception as e:
-        print(f"⚠️ Advertencia al inicializar BD: {e}")
+        asegurar_columnas()
+        asegurar_indices()
+        asegurar_autoincremento()
+        log_datos.info("Base de datos verificada", extra={'evento': 'bd_verificada'})
+    except Exception:
+        log_datos.exception("Advertencia al inicializar la base de datos", extra={'evento': 'bd_error'})
+
+    # Vincular con su cliente las ventas registradas antes de la tabla cliente
+    try:
+        vinculados = vincular_clientes_pendientes()
+        if vinculados:
+            log_datos.info("Clientes vinculados a sus ventas", extra={'evento': 'clientes_vinculados', 'clientes': vinculados})
+    except Exception:
+        log_datos.exception("Advertencia al vincular clientes", extra={'evento': 'clientes_error'})
 
 # ========================================
 # EJECUCIÓN PRINCIPAL
@@ -1026,4 +3096,7 @@ if __name__ == '__main__':
         
         # Modo debug solo en desarrollo local
         debug_mode = os.environ.get('FLASK_DEBUG', 'False').lower() == 'true'
+        # Con el recargador de debug solo el proceso hijo atiende peticiones
+        if not debug_mode or os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+            iniciar_trabajos()
         app.run(debug=debug_mode, host='0.0.0.0', port=port)
@@ -0,0 +1,73 @@
+# ========================================
+# CACHÉ DE FRAGMENTOS - Carloszerpav
+# ========================================
+# Guarda el HTML ya renderizado de los bloques pesados del dashboard
+# (tarjetas de estadísticas, tabla de ventas, estadísticas por rubro).
+#
+# Cada entrada está ligada a la versión de datos del usuario: cuando
+# el usuario agrega, paga, elimina o cierra el mes, su versión sube y
+# los fragmentos viejos dejan de servirse. La versión vive en la base
+# de datos, así que funciona igual con varios workers de gunicorn.
+
+from collections import OrderedDict
+import threading
+
+
+class CacheFragmentos:
+    """
+    Caché LRU en memoria de fragmentos HTML por usuario
+    Args:
+        max_usuarios (int): Usuarios que se conservan antes de descartar el más antiguo
+    """
+
+    def __init__(self, max_usuarios=256):
+        self.max_usuarios = max_usuarios
+        self.activa = True
+        self.aciertos = 0
+        self.fallos = 0
+        self._entradas = OrderedDict()
+        self._lock = threading.Lock()
+
+    def obtener(self, usuario_email, version, nombre):
+        """
+        Busca un fragmento renderizado
+        Args:
+            usuario_email (str): Dueño de los datos
+            version (int): Versión actual de los datos del usuario
+            nombre (str): Nombre del fragmento ('estadisticas', 'tabla', ...)
+        Returns:
+            str: El HTML guardado o None si no existe o está desactualizado
+        """
+        if not self.activa:
+            return None
+        with self._lock:
+            entrada = self._entradas.get(usuario_email)
+            if entrada is None or entrada['version'] != version or nombre not in entrada['fragmentos']:
+                self.fallos += 1
+                return None
+            self._entradas.move_to_end(usuario_email)
+            self.aciertos += 1
+            return entrada['fragmentos'][nombre]
+
+    def guardar(self, usuario_email, version, nombre, html):
+        """
+        Guarda un fragmento; descarta los de versiones anteriores del mismo usuario
+        """
+        if not self.activa:
+            return
+        with self._lock:
+            entrada = self._entradas.get(usuario_email)
+            if entrada is None or entrada['version'] != version:
+                entrada = {'version': version, 'fragmentos': {}}
+                self._entradas[usuario_email] = entrada
+            entrada['fragmentos'][nombre] = html
+            self._entradas.move_to_end(usuario_email)
+            while len(self._entradas) > self.max_usuarios:
+                self._entradas.popitem(last=False)
+
+    def limpiar(self):
+        """Vacía la caché y reinicia los contadores"""
+        with self._lock:
+            self._entradas.clear()
+            self.aciertos = 0
+            self.fallos = 0
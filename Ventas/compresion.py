@@ -0,0 +1,327 @@
+# ========================================
+# COMPRESIÓN DE RESPUESTAS - Carloszerpav
+# ========================================
+# Middleware WSGI que comprime el HTML y el JSON antes de que salgan
+# por el proxy de Railway. Negocia gzip, brotli o zstd según el
+# encabezado Accept-Encoding del navegador.
+#
+# gzip siempre está disponible (zlib viene con Python).
+# brotli y zstd se activan solo si están instalados los paquetes
+# opcionales `Brotli` y `zstandard`.
+
+import zlib
+
+try:
+    import brotli
+except ImportError:  # Paquete opcional
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:  # Paquete opcional
+    zstandard = None
+
+# Tipos de contenido que vale la pena comprimir
+TIPOS_COMPRIMIBLES = (
+    'text/html',
+    'text/css',
+    'text/plain',
+    'text/csv',
+    'text/javascript',
+    'application/javascript',
+    'application/json',
+    'application/xml',
+    'image/svg+xml',
+)
+
+# Los eventos SSE deben llegar al instante, nunca se retienen en un buffer
+TIPOS_EXCLUIDOS = ('text/event-stream',)
+
+# Niveles por defecto: buen equilibrio entre tamaño y CPU por petición
+NIVELES_POR_DEFECTO = {
+    'gzip': 6,
+    'br': 5,
+    'zstd': 3,
+}
+
+# Orden de preferencia cuando el navegador acepta varias con la misma calidad
+PREFERENCIA = ('br', 'zstd', 'gzip')
+
+
+def codificaciones_disponibles():
+    """
+    Devuelve las codificaciones que este servidor puede producir
+    Returns:
+        tuple: Codificaciones en orden de preferencia
+    """
+    disponibles = []
+    for codificacion in PREFERENCIA:
+        if codificacion == 'br' and brotli is None:
+            continue
+        if codificacion == 'zstd' and zstandard is None:
+            continue
+        disponibles.append(codificacion)
+    return tuple(disponibles)
+
+
+def elegir_codificacion(accept_encoding, disponibles=None):
+    """
+    Elige la mejor codificación según el encabezado Accept-Encoding
+    Args:
+        accept_encoding (str): Valor del encabezado enviado por el cliente
+        disponibles (tuple): Codificaciones soportadas por el servidor
+    Returns:
+        str: 'br', 'zstd', 'gzip' o None si no se debe comprimir
+    """
+    if not accept_encoding:
+        return None
+    if disponibles is None:
+        disponibles = codificaciones_disponibles()
+
+    calidades = {}
+    for parte in accept_encoding.split(','):
+        parte = parte.strip()
+        if not parte:
+            continue
+        nombre, _, parametros = parte.partition(';')
+        nombre = nombre.strip().lower()
+        calidad = 1.0
+        parametros = parametros.strip()
+        if parametros.startswith('q='):
+            try:
+                calidad = float(parametros[2:])
+            except ValueError:
+                calidad = 0.0
+        calidades[nombre] = calidad
+
+    comodin = calidades.get('*')
+    mejor = None
+    mejor_calidad = 0.0
+    for codificacion in disponibles:
+        calidad = calidades.get(codificacion, comodin)
+        if calidad is None or calidad <= 0:
+            continue
+        # Las codificaciones vienen ordenadas por preferencia: en empate gana la primera
+        if calidad > mejor_calidad:
+            mejor = codificacion
+            mejor_calidad = calidad
+    return mejor
+
+
+class _Compresor:
+    """Interfaz común sobre zlib, brotli y zstandard"""
+
+    def __init__(self, codificacion, nivel):
+        self.codificacion = codificacion
+        if codificacion == 'gzip':
+            # wbits=31 produce el formato gzip (cabecera + CRC)
+            self._obj = zlib.compressobj(nivel, zlib.DEFLATED, 31)
+        elif codificacion == 'br':
+            self._obj = brotli.Compressor(quality=nivel)
+        elif codificacion == 'zstd':
+            self._obj = zstandard.ZstdCompressor(level=nivel).compressobj()
+        else:
+            raise ValueError(f"Codificación no soportada: {codificacion}")
+
+    def comprimir(self, datos):
+        if self.codificacion == 'br':
+            return self._obj.process(datos)
+        return self._obj.compress(datos)
+
+    def vaciar(self):
+        """Entrega lo acumulado sin cerrar el flujo (para respuestas en streaming)"""
+        if self.codificacion == 'gzip':
+            return self._obj.flush(zlib.Z_SYNC_FLUSH)
+        if self.codificacion == 'br':
+            return self._obj.flush()
+        return self._obj.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+
+    def terminar(self):
+        if self.codificacion == 'br':
+            return self._obj.finish()
+        return self._obj.flush()
+
+
+def comprimir(datos, codificacion, nivel=None):
+    """
+    Comprime un bloque completo de bytes
+    Args:
+        datos (bytes): Contenido a comprimir
+        codificacion (str): 'gzip', 'br' o 'zstd'
+        nivel (int): Nivel de compresión. Si es None, usa el nivel por defecto
+    Returns:
+        bytes: Contenido comprimido
+    """
+    if nivel is None:
+        nivel = NIVELES_POR_DEFECTO[codificacion]
+    compresor = _Compresor(codificacion, nivel)
+    return compresor.comprimir(datos) + compresor.terminar()
+
+
+class CompresionMiddleware:
+    """
+    Middleware WSGI que comprime las respuestas según Accept-Encoding
+    Args:
+        app: Aplicación WSGI a envolver
+        tamano_minimo (int): Bytes mínimos para comprimir; por debajo no compensa
+        niveles (dict): Nivel por codificación, p. ej. {'gzip': 6, 'br': 5}
+    """
+
+    def __init__(self, app, tamano_minimo=500, niveles=None):
+        self.app = app
+        self.tamano_minimo = tamano_minimo
+        self.niveles = dict(NIVELES_POR_DEFECTO)
+        if niveles:
+            self.niveles.update(niveles)
+        self.disponibles = codificaciones_disponibles()
+
+    def __call__(self, environ, start_response):
+        codificacion = elegir_codificacion(environ.get('HTTP_ACCEPT_ENCODING', ''), self.disponibles)
+        if codificacion is None or environ.get('REQUEST_METHOD') == 'HEAD':
+            return self.app(environ, start_response)
+
+        respuesta = {}
+
+        def capturar_inicio(status, headers, exc_info=None):
+            respuesta['status'] = status
+            respuesta['headers'] = headers
+            respuesta['exc_info'] = exc_info
+            # El cuerpo se entrega siempre a través del iterable, no con write()
+            return _escritura_no_soportada
+
+        cuerpo = self.app(environ, capturar_inicio)
+        return _RespuestaComprimida(self, cuerpo, respuesta, start_response, codificacion)
+
+    def debe_comprimir(self, status, headers):
+        """
+        Decide si una respuesta se comprime a partir de su estado y encabezados
+        Returns:
+            bool: True si la respuesta es candidata a compresión
+        """
+        codigo = int(status.split(' ', 1)[0])
+        if codigo < 200 or codigo in (204, 206, 304):
+            return False
+        tipo = ''
+        for nombre, valor in headers:
+            nombre = nombre.lower()
+            if nombre == 'content-encoding':
+                return False
+            if nombre == 'cache-control' and 'no-transform' in valor.lower():
+                return False
+            if nombre == 'content-type':
+                tipo = valor.split(';', 1)[0].strip().lower()
+            if nombre == 'content-length':
+                try:
+                    if int(valor) < self.tamano_minimo:
+                        return False
+                except ValueError:
+                    return False
+        if tipo in TIPOS_EXCLUIDOS:
+            return False
+        return tipo in TIPOS_COMPRIMIBLES
+
+
+def _escritura_no_soportada(datos):
+    raise RuntimeError("CompresionMiddleware no soporta el callable write() de WSGI")
+
+
+def _agregar_vary(headers):
+    for i, (nombre, valor) in enumerate(headers):
+        if nombre.lower() == 'vary':
+            if 'accept-encoding' not in valor.lower():
+                headers[i] = (nombre, f"{valor}, Accept-Encoding")
+            return
+    headers.append(('Vary', 'Accept-Encoding'))
+
+
+def _debilitar_etag(headers):
+    # El ETag fuerte identifica los bytes sin comprimir; el cuerpo comprimido es otro
+    for i, (nombre, valor) in enumerate(headers):
+        if nombre.lower() == 'etag' and not valor.startswith('W/'):
+            headers[i] = (nombre, f"W/{valor}")
+
+
+class _RespuestaComprimida:
+    """
+    Iterable WSGI que comprime el cuerpo de la aplicación envuelta
+
+    - Respuestas con Content-Length: se comprimen de una vez.
+    - Respuestas en streaming (generadores): se acumulan hasta el tamaño
+      mínimo y luego se comprimen trozo a trozo, vaciando el compresor en
+      cada trozo para que el cliente reciba los datos sin esperar al final.
+    """
+
+    def __init__(self, middleware, cuerpo, respuesta, start_response, codificacion):
+        self.middleware = middleware
+        self.cuerpo = cuerpo
+        self.respuesta = respuesta
+        self.start_response = start_response
+        self.codificacion = codificacion
+
+    def close(self):
+        if hasattr(self.cuerpo, 'close'):
+            self.cuerpo.close()
+
+    def __iter__(self):
+        iterador = iter(self.cuerpo)
+        # La aplicación llama a start_response a más tardar con el primer trozo
+        pendientes = []
+        if 'status' not in self.respuesta:
+            for trozo in iterador:
+                if trozo:
+                    pendientes.append(trozo)
+                    break
+                if 'status' in self.respuesta:
+                    break
+
+        status = self.respuesta['status']
+        headers = list(self.respuesta['headers'])
+        exc_info = self.respuesta.get('exc_info')
+
+        if not self.middleware.debe_comprimir(status, headers):
+            self.start_response(status, headers, exc_info)
+            yield from pendientes
+            yield from iterador
+            return
+
+        tiene_longitud = any(nombre.lower() == 'content-length' for nombre, _ in headers)
+        nivel = self.middleware.niveles[self.codificacion]
+
+        if tiene_longitud:
+            datos = b''.join(pendientes) + b''.join(iterador)
+            comprimido = comprimir(datos, self.codificacion, nivel)
+            headers = [(n, v) for n, v in headers if n.lower() != 'content-length']
+            headers.append(('Content-Encoding', self.codificacion))
+            headers.append(('Content-Length', str(len(comprimido))))
+            _agregar_vary(headers)
+            _debilitar_etag(headers)
+            self.start_response(status, headers, exc_info)
+            yield comprimido
+            return
+
+        # Streaming: acumular hasta el mínimo antes de decidir
+        acumulado = sum(len(t) for t in pendientes)
+        terminado = True
+        for trozo in iterador:
+            pendientes.append(trozo)
+            acumulado += len(trozo)
+            if acumulado >= self.middleware.tamano_minimo:
+                terminado = False
+                break
+
+        if terminado and acumulado < self.middleware.tamano_minimo:
+            self.start_response(status, headers, exc_info)
+            yield b''.join(pendientes)
+            return
+
+        headers.append(('Content-Encoding', self.codificacion))
+        _agregar_vary(headers)
+        _debilitar_etag(headers)
+        self.start_response(status, headers, exc_info)
+
+        compresor = _Compresor(self.codificacion, nivel)
+        yield compresor.comprimir(b''.join(pendientes)) + compresor.vaciar()
+        for trozo in iterador:
+            if trozo:
+                yield compresor.comprimir(trozo) + compresor.vaciar()
+        yield compresor.terminar()
@@ -0,0 +1,111 @@
+# ========================================
+# CONTEXTO DE DATOS POR PETICIÓN - Carloszerpav
+# ========================================
+# Varias páginas piden los mismos datos dos veces en una misma petición
+# (el cierre mensual carga las ventas cerradas y luego las estadísticas
+# vuelven a cargar todas; el pago busca la venta y registrar_pago la
+# vuelve a buscar). Las funciones marcadas con @contexto_datos.memorizar
+# cargan una sola vez por petición y las siguientes llamadas con los
+# mismos argumentos reciben el mismo resultado.
+#
+# - Solo dentro de una petición: en trabajos en segundo plano y comandos
+#   se carga siempre de la base.
+# - Cualquier escritura debe llamar a invalidar() (lo hace
+#   incrementar_version_datos en app.py) para no servir datos viejos.
+# - Los resultados se comparten: quien los reciba no debe quitarles
+#   elementos ni cambiar sus valores.
+
+import threading
+from functools import wraps
+
+from flask import g, has_request_context
+
+# Atributo de flask.g donde vive la memoria de la petición
+ATRIBUTO = '_contexto_datos'
+
+
+class ContextoDatos:
+    """
+    Memoria de una petición con contadores de aciertos y fallos
+    Los contadores globales son del worker; los de cada petición van al log de acceso
+    """
+
+    def __init__(self):
+        self.activo = True
+        self.aciertos = 0
+        self.fallos = 0
+        self._lock = threading.Lock()
+
+    def _memoria(self):
+        if not self.activo or not has_request_context():
+            return None
+        memoria = g.get(ATRIBUTO)
+        if memoria is None:
+            memoria = {'valores': {}, 'aciertos': 0, 'fallos': 0}
+            setattr(g, ATRIBUTO, memoria)
+        return memoria
+
+    def obtener(self, clave, cargar):
+        """
+        Devuelve el valor guardado para la clave o lo carga y lo guarda
+        Args:
+            clave (tuple): Identifica los datos (función y argumentos)
+            cargar (callable): Carga los datos si no están en memoria
+        """
+        memoria = self._memoria()
+        if memoria is None:
+            return cargar()
+        if clave in memoria['valores']:
+            memoria['aciertos'] += 1
+            with self._lock:
+                self.aciertos += 1
+            return memoria['valores'][clave]
+        memoria['fallos'] += 1
+        with self._lock:
+            self.fallos += 1
+        valor = cargar()
+        memoria['valores'][clave] = valor
+        return valor
+
+    def memorizar(self, funcion):
+        """Decorador: la función se ejecuta una vez por petición y por combinación de argumentos"""
+        @wraps(funcion)
+        def envoltura(*args, **kwargs):
+            clave = (funcion.__name__, args, tuple(sorted(kwargs.items())))
+            return self.obtener(clave, lambda: funcion(*args, **kwargs))
+        return envoltura
+
+    def invalidar(self):
+        """Olvida lo cargado en la petición actual (después de una escritura)"""
+        memoria = g.get(ATRIBUTO) if has_request_context() else None
+        if memoria is not None:
+            memoria['valores'].clear()
+
+    def resumen_peticion(self):
+        """
+        Aciertos y fallos de la petición actual
+        Returns:
+            dict: {'aciertos': n, 'fallos': n} o None si no se usó la memoria
+        """
+        memoria = g.get(ATRIBUTO) if has_request_context() else None
+        if memoria is None:
+            return None
+        return {'aciertos': memoria['aciertos'], 'fallos': memoria['fallos']}
+
+    def estadisticas(self):
+        """
+        Totales del worker desde que arrancó
+        Returns:
+            dict: Aciertos, fallos y tasa de aciertos (0.0 a 1.0)
+        """
+        with self._lock:
+            total = self.aciertos + self.fallos
+            return {
+                'aciertos': self.aciertos,
+                'fallos': self.fallos,
+                'tasa_aciertos': round(self.aciertos / total, 4) if total else 0.0
+            }
+
+
+# Instancia única; app.py decora con ella sus funciones de carga
+contexto_datos = ContextoDatos()
@@ -0,0 +1,172 @@
+# ========================================
+# EVENTOS EN VIVO (SSE) - Carloszerpav
+# ========================================
+# Reparte a las pestañas abiertas los eventos de cambio (venta agregada,
+# pago registrado, venta cerrada, mes cerrado...).
+#
+# Los eventos se guardan en la tabla `evento` dentro de la misma
+# transacción que la escritura. Cada worker de gunicorn tiene un único
+# hilo que consulta esa tabla y reparte lo nuevo a sus suscriptores
+# locales, así un pago registrado en un worker llega a las pestañas
+# conectadas a cualquier otro.
+#
+# Con PARTICIONES=1 la escritura se confirma en la base del inquilino y
+# el evento vive en la principal: no hay transacción común, así que el
+# evento se inserta después del commit del inquilino. Si ese commit
+# falla no se publica nada; si falla la inserción del evento, se pierde
+# y las pestañas se ponen al día con la sincronización delta al recargar.
+#
+# Los IDs de PostgreSQL salen de una secuencia y no se confirman en orden:
+# una transacción lenta puede confirmar el ID 41 después de que otra ya
+# confirmó el 42. Por eso cada consulta vuelve a leer una ventana de IDs
+# recientes y descarta por ID lo que ya se repartió, en lugar de avanzar
+# un cursor que saltaría ese 41.
+#
+# Cada flujo SSE ocupa un hilo del worker mientras está abierto, así que
+# cada proceso admite un número limitado; el resto recibe 503 y reintenta.
+
+import json
+import logging
+import queue
+import threading
+import time
+
+log_eventos = logging.getLogger('ventas.eventos')
+
+
+class BusEventos:
+    """
+    Fan-out de eventos a suscriptores locales a partir de una fuente compartida
+    Args:
+        leer_desde (callable): leer_desde(ultimo_id) -> lista de (id, usuario_email, tipo, datos)
+        ids_recientes (callable): ids_recientes(cantidad) -> IDs de los últimos eventos, al arrancar
+        intervalo (float): Segundos entre consultas mientras haya suscriptores
+        limpiar (callable): Se llama de vez en cuando para borrar eventos viejos
+        ventana (int): IDs por debajo del último que se vuelven a leer en cada consulta
+    """
+
+    def __init__(self, leer_desde, ids_recientes, intervalo=1.0, limpiar=None, ventana=200):
+        self.leer_desde = leer_desde
+        self.ids_recientes = ids_recientes
+        self.intervalo = intervalo
+        self.limpiar = limpiar
+        self.ventana = ventana
+        self._suscriptores = {}
+        self._lock = threading.Lock()
+        self._hilo = None
+        self._ultimo = None
+        self._publicados = set()
+
+    def suscribir(self, usuario_email, maximo=None):
+        """
+        Registra una cola para recibir los eventos de un usuario
+        Args:
+            maximo (int): Suscriptores que admite este proceso (None: sin límite)
+        Returns:
+            queue.Queue: Cola donde llegarán tuplas (id, tipo, datos), o None si está lleno
+        """
+        cola = queue.Queue(maxsize=1000)
+        with self._lock:
+            if maximo is not None and sum(len(colas) for colas in self._suscriptores.values()) >= maximo:
+                return None
+            if not self._suscriptores:
+                # Sin nadie escuchando no se sondea: retomar desde el evento más reciente
+                # y dar por repartido lo que ya está dentro de la ventana (una sola consulta)
+                recientes = self.ids_recientes(self.ventana)
+                self._ultimo = max(recientes, default=0)
+                self._publicados = set(recientes)
+            self._suscriptores.setdefault(usuario_email, set()).add(cola)
+            if self._hilo is None:
+                self._hilo = threading.Thread(target=self._sondear, name='bus-eventos', daemon=True)
+                self._hilo.start()
+        return cola
+
+    def desuscribir(self, usuario_email, cola):
+        with self._lock:
+            colas = self._suscriptores.get(usuario_email)
+            if colas:
+                colas.discard(cola)
+                if not colas:
+                    del self._suscriptores[usuario_email]
+
+    def total_suscriptores(self):
+        with self._lock:
+            return sum(len(colas) for colas in self._suscriptores.values())
+
+    def publicar_local(self, evento_id, usuario_email, tipo, datos):
+        """Entrega un evento a las colas de este proceso"""
+        with self._lock:
+            colas = list(self._suscriptores.get(usuario_email, ()))
+        for cola in colas:
+            try:
+                cola.put_nowait((evento_id, tipo, datos))
+            except queue.Full:
+                # Cliente demasiado lento: descartamos; al reconectar recupera con Last-Event-ID
+                pass
+
+    def _sondear(self):
+        vueltas = 0
+        while True:
+            time.sleep(self.intervalo)
+            if not self.total_suscriptores():
+                continue
+            try:
+                for evento_id, usuario_email, tipo, datos in self.leer_desde(max(0, self._ultimo - self.ventana)):
+                    if evento_id in self._publicados:
+                        continue
+                    self._publicados.add(evento_id)
+                    self._ultimo = max(self._ultimo, evento_id)
+                    self.publicar_local(evento_id, usuario_email, tipo, datos)
+                limite = self._ultimo - self.ventana
+                self._publicados = {evento_id for evento_id in self._publicados if evento_id > limite}
+                vueltas += 1
+                if self.limpiar and vueltas % 600 == 0:
+                    self.limpiar()
+            except Exception:
+                log_eventos.exception("Error en el bus de eventos", extra={'evento': 'bus_error'})
+
+
+def formatear_sse(evento_id, tipo, datos):
+    """
+    Convierte un evento al formato de texto de Server-Sent Events
+    Returns:
+        str: Bloque 'id/event/data' terminado en línea en blanco
+    """
+    return f"id: {evento_id}\nevent: {tipo}\ndata: {json.dumps(datos, separators=(',', ':'))}\n\n"
+
+
+def flujo_sse(bus, usuario_email, cola, pendientes=(), duracion_maxima=300, intervalo_ping=15):
+    """
+    Generador del cuerpo de la respuesta SSE
+    Args:
+        bus (BusEventos): Bus del que se desuscribe al terminar
+        usuario_email (str): Dueño de la cola
+        cola (queue.Queue): Cola ya suscrita
+        pendientes (list): Eventos perdidos a reenviar primero (id, tipo, datos)
+        duracion_maxima (int): Segundos antes de cerrar; el navegador reconecta solo
+        intervalo_ping (int): Segundos entre comentarios para mantener viva la conexión
+    """
+    try:
+        yield "retry: 3000\n\n"
+        # Por ID y no por "mayor que el último": un evento confirmado tarde
+        # puede llegar con un ID menor que otro ya enviado
+        enviados = set()
+        for evento_id, tipo, datos in pendientes:
+            enviados.add(evento_id)
+            yield formatear_sse(evento_id, tipo, datos)
+
+        fin = time.monotonic() + duracion_maxima
+        while time.monotonic() < fin:
+            try:
+                evento_id, tipo, datos = cola.get(timeout=intervalo_ping)
+            except queue.Empty:
+                yield ": ping\n\n"
+                continue
+            if evento_id in enviados:
+                continue
+            enviados.add(evento_id)
+            if len(enviados) > 2000:
+                enviados = set(sorted(enviados)[-1000:])
+            yield formatear_sse(evento_id, tipo, datos)
+    finally:
+        bus.desuscribir(usuario_email, cola)
@@ -0,0 +1,14 @@
+# ========================================
+# CONFIGURACIÓN DE GUNICORN - Carloszerpav
+# ========================================
+# gunicorn carga este archivo solo al arrancar desde esta carpeta.
+# Los trabajos en segundo plano (cierre mensual, archivo) se retoman aquí,
+# en cada worker ya cargado, y no al importar app.py: así `flask <comando>`,
+# las herramientas y la API asíncrona no arrancan hilos de trabajos.
+
+
+def post_worker_init(worker):
+    """Retoma los trabajos pendientes y arranca el barrido en el worker"""
+    import app
+
+    app.iniciar_trabajos()
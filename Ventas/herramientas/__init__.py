@@ -0,0 +1 @@
+# Herramientas de desarrollo: datos de prueba, benchmarks y verificaciones
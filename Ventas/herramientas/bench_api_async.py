@@ -0,0 +1,233 @@
+# ========================================
+# BENCHMARK API ASÍNCRONA VS WORKERS SÍNCRONOS - Carloszerpav
+# ========================================
+# Levanta la app con gunicorn (gthread, como en el Procfile) y la API de
+# api_async.py con uvicorn, cada una fijada a los mismos núcleos, y les
+# manda la misma carga: muchas conexiones keep-alive pidiendo
+# /api/estadisticas, /api/ventas y /api/estadisticas-periodo.
+# Muestra peticiones por segundo, p50 y p99 de cada servidor.
+#
+# Con --latencia-ms cada sentencia SQL espera esos milisegundos antes de
+# ejecutarse (en el hilo que la ejecuta), para simular una base en otra
+# máquina como PostgreSQL en Railway. Sin eso, SQLite local responde al
+# instante y se mide sobre todo CPU.
+#
+# Uso (desde la carpeta Ventas; requiere gunicorn, uvicorn y aiosqlite):
+#     python -m herramientas.bench_api_async [--ventas 300] [--conexiones 64]
+#         [--segundos 10] [--latencia-ms 0] [--cpus 0] [--procesos 1] [--pool 10]
+
+import argparse
+import asyncio
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+from herramientas.datos_prueba import cargar_app, sembrar_ventas, cookie_sesion, USUARIO_PRUEBA
+
+RUTAS = [
+    '/api/estadisticas',
+    '/api/ventas',
+    '/api/estadisticas-periodo?fecha_inicio=2025-01-01&fecha_fin=2025-12-31',
+]
+
+# Arranque de cada servidor: si BENCH_LATENCIA_MS está definida, cada conexión SQLite
+# duerme antes de cada sentencia en el hilo que la ejecuta (el de la petición con
+# gunicorn, el de aiosqlite con uvicorn), como si la base estuviera lejos.
+ARRANQUE = r'''
+import os, sqlite3, sqlite3.dbapi2, sys, time
+latencia = float(os.environ.get('BENCH_LATENCIA_MS', 0)) / 1000
+if latencia:
+    conectar = sqlite3.connect
+    def conectar_lento(*args, **kwargs):
+        conexion = conectar(*args, **kwargs)
+        conexion.set_trace_callback(lambda sentencia: time.sleep(latencia))
+        return conexion
+    # SQLAlchemy (pysqlite) usa sqlite3.dbapi2.connect; aiosqlite, sqlite3.connect
+    sqlite3.connect = sqlite3.dbapi2.connect = conectar_lento
+servidor = sys.argv[1]
+sys.argv = sys.argv[1:]
+if servidor == 'gunicorn':
+    from gunicorn.app.wsgiapp import run
+else:
+    from uvicorn.main import main as run
+sys.exit(run())
+'''
+
+
+def puerto_libre():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def comando_servidor(tipo, puerto, procesos):
+    if tipo == 'sync':
+        return ['gunicorn', '--worker-class', 'gthread', '--threads', '8', '--workers', str(procesos),
+                '--bind', f'127.0.0.1:{puerto}', '--log-level', 'warning', 'app:app']
+    return ['uvicorn', 'api_async:app', '--workers', str(procesos), '--host', '127.0.0.1',
+            '--port', str(puerto), '--log-level', 'warning', '--no-access-log']
+
+
+def arrancar(tipo, puerto, entorno, cpus, procesos):
+    """Lanza el servidor fijado a los núcleos indicados y espera a que acepte conexiones"""
+    carpeta_app = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    proceso = subprocess.Popen(
+        [sys.executable, '-c', ARRANQUE] + comando_servidor(tipo, puerto, procesos),
+        cwd=carpeta_app,
+        env=entorno,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+        preexec_fn=lambda: os.sched_setaffinity(0, cpus)
+    )
+    limite = time.monotonic() + 60
+    while time.monotonic() < limite:
+        if proceso.poll() is not None:
+            raise RuntimeError(f"El servidor {tipo} terminó al arrancar (código {proceso.returncode})")
+        try:
+            socket.create_connection(('127.0.0.1', puerto), timeout=0.5).close()
+            return proceso
+        except OSError:
+            time.sleep(0.2)
+    proceso.kill()
+    raise RuntimeError(f"El servidor {tipo} no arrancó en 60 s")
+
+
+async def pedir(lector, escritor, ruta, cookie):
+    """
+    Una petición GET HTTP/1.1 sobre una conexión keep-alive
+    Returns:
+        tuple: (código de estado, True si el servidor cerró la conexión)
+    """
+    escritor.write(f"GET {ruta} HTTP/1.1\r\nHost: 127.0.0.1\r\nCookie: session={cookie}\r\n"
+                   f"Accept-Encoding: identity\r\n\r\n".encode('latin-1'))
+    await escritor.drain()
+    linea = await lector.readline()
+    if not linea:
+        return None, True
+    estado = int(linea.split()[1])
+    largo, cerrar = 0, False
+    while True:
+        linea = await lector.readline()
+        if linea in (b'\r\n', b''):
+            break
+        nombre, _, valor = linea.decode('latin-1').partition(':')
+        nombre = nombre.strip().lower()
+        if nombre == 'content-length':
+            largo = int(valor)
+        elif nombre == 'connection' and 'close' in valor.lower():
+            cerrar = True
+    await lector.readexactly(largo)
+    return estado, cerrar
+
+
+async def conexion_de_carga(puerto, cookie, hasta, desfase, latencias, estados):
+    """Repite las rutas sin pausa por una conexión (reconecta si el servidor la cierra)"""
+    lector = escritor = None
+    i = desfase
+    while time.monotonic() < hasta:
+        if escritor is None:
+            lector, escritor = await asyncio.open_connection('127.0.0.1', puerto)
+        ruta = RUTAS[i % len(RUTAS)]
+        i += 1
+        inicio = time.perf_counter()
+        try:
+            estado, cerrar = await pedir(lector, escritor, ruta, cookie)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            estado, cerrar = None, True
+        if estado is not None:
+            latencias.append((ruta, (time.perf_counter() - inicio) * 1000))
+        estados[estado] = estados.get(estado, 0) + 1
+        if cerrar:
+            escritor.close()
+            escritor = None
+    if escritor is not None:
+        escritor.close()
+
+
+async def generar_carga(puerto, cookie, conexiones, segundos):
+    latencias, estados = [], {}
+    # Calentamiento: conexiones abiertas y primeras consultas fuera de la medición
+    await conexion_de_carga(puerto, cookie, time.monotonic() + 1, 0, [], {})
+    hasta = time.monotonic() + segundos
+    await asyncio.gather(*[
+        conexion_de_carga(puerto, cookie, hasta, i, latencias, estados) for i in range(conexiones)
+    ])
+    return latencias, estados
+
+
+def percentil(valores, p):
+    if not valores:
+        return 0.0
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, int(len(ordenados) * p / 100))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='API asíncrona vs workers síncronos')
+    parser.add_argument('--ventas', type=int, default=300, help='Ventas sembradas para el usuario')
+    parser.add_argument('--conexiones', type=int, default=64, help='Clientes simultáneos')
+    parser.add_argument('--segundos', type=float, default=10, help='Duración de cada medición')
+    parser.add_argument('--latencia-ms', type=float, default=0, help='Espera por sentencia SQL')
+    parser.add_argument('--cpus', default='0', help='Núcleos para el servidor, p. ej. 0 o 0,1')
+    parser.add_argument('--procesos', type=int, default=1, help='Workers de gunicorn / uvicorn')
+    parser.add_argument('--pool', type=int, default=10, help='API_ASYNC_POOL de la API asíncrona (gunicorn usa 8 hilos)')
+    args = parser.parse_args()
+
+    cpus = {int(c) for c in args.cpus.split(',')}
+    descriptor, ruta_db = tempfile.mkstemp(suffix='.db', prefix='ventas_bench_')
+    os.close(descriptor)
+    modulo_app = cargar_app(ruta_db)
+    sembrar_ventas(modulo_app, args.ventas)
+    with modulo_app.app.app_context():
+        # Parte de las ventas en el archivo, como en una cuenta con historia
+        modulo_app.cerrar_mes_estadisticas(USUARIO_PRUEBA, 1, 2025)
+    cookie = cookie_sesion(modulo_app)
+
+    entorno = dict(os.environ,
+                   DATABASE_URL=f'sqlite:///{ruta_db}',
+                   SECRET_KEY=modulo_app.app.secret_key,
+                   LOG_MUESTREO='ventas.peticiones=0',
+                   API_ASYNC_POOL=str(args.pool),
+                   BENCH_LATENCIA_MS=str(args.latencia_ms))
+    entorno.pop('PORT', None)
+
+    # El generador de carga usa los núcleos que no tiene el servidor (si los hay)
+    resto = set(os.sched_getaffinity(0)) - cpus
+    if resto:
+        os.sched_setaffinity(0, resto)
+    else:
+        print("⚠️ El generador de carga comparte núcleo con el servidor: compara, no tomes los valores absolutos")
+
+    print(f"Ventas: {args.ventas} | conexiones: {args.conexiones} | {args.segundos:.0f} s por servidor | "
+          f"latencia SQL: {args.latencia_ms:.0f} ms | núcleos del servidor: {sorted(cpus)} | procesos: {args.procesos} | "
+          f"pool async: {args.pool}")
+    resultados = {}
+    for tipo in ('sync', 'async'):
+        puerto = puerto_libre()
+        proceso = arrancar(tipo, puerto, entorno, cpus, args.procesos)
+        try:
+            resultados[tipo] = asyncio.run(generar_carga(puerto, cookie, args.conexiones, args.segundos))
+        finally:
+            proceso.terminate()
+            proceso.wait(timeout=30)
+
+    nombres = {'sync': 'gunicorn gthread', 'async': 'uvicorn asyncio'}
+    print(f"\n{'Servidor':<18} {'pet/s':>8} {'p50 ms':>8} {'p99 ms':>8} {'errores':>8}")
+    for tipo, (latencias, estados) in resultados.items():
+        tiempos = [ms for _, ms in latencias]
+        errores = sum(n for estado, n in estados.items() if estado != 200)
+        print(f"{nombres[tipo]:<18} {len(tiempos) / args.segundos:>8.1f} {percentil(tiempos, 50):>8.1f} "
+              f"{percentil(tiempos, 99):>8.1f} {errores:>8}")
+        for ruta in RUTAS:
+            por_ruta = [ms for r, ms in latencias if r == ruta]
+            print(f"   {ruta.split('?')[0]:<28} p50 {percentil(por_ruta, 50):>7.1f}  p99 {percentil(por_ruta, 99):>7.1f}")
+        if errores:
+            print(f"   códigos: {dict(sorted(estados.items(), key=lambda e: str(e[0])))}")
+    os.remove(ruta_db)
+
+
+if __name__ == '__main__':
+    main()
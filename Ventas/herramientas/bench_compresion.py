@@ -0,0 +1,61 @@
+# ========================================
+# BENCHMARK DE COMPRESIÓN - Carloszerpav
+# ========================================
+# Mide bytes en la red y CPU de compresión por endpoint.
+#
+# Uso (desde la carpeta Ventas):
+#     python -m herramientas.bench_compresion [cantidad_ventas]
+
+import sys
+import time
+
+from herramientas.datos_prueba import cargar_app, sembrar_ventas, cliente_autenticado
+
+ENDPOINTS = [
+    ('GET', '/', None),
+    ('GET', '/ventas-excluidas', None),
+    ('POST', '/estadisticas-periodo', {'fecha_inicio': '2025-01-01', 'fecha_fin': '2025-12-31'}),
+    ('GET', '/api/ventas', None),
+    ('GET', '/api/estadisticas', None),
+    ('GET', '/api/estadisticas-periodo?fecha_inicio=2025-01-01&fecha_fin=2025-12-31', None),
+    ('GET', '/static/css/style.css', None),
+]
+
+REPETICIONES = 20
+
+
+def medir(compresion, cuerpo, codificacion, nivel):
+    """Devuelve (bytes comprimidos, ms de CPU por compresión)"""
+    inicio = time.process_time()
+    for _ in range(REPETICIONES):
+        comprimido = compresion.comprimir(cuerpo, codificacion, nivel)
+    cpu_ms = (time.process_time() - inicio) * 1000 / REPETICIONES
+    return len(comprimido), cpu_ms
+
+
+def main():
+    cantidad = int(sys.argv[1]) if len(sys.argv) > 1 else 300
+    modulo_app = cargar_app()
+    sembrar_ventas(modulo_app, cantidad)
+    cliente = cliente_autenticado(modulo_app)
+
+    import compresion
+    codificaciones = compresion.codificaciones_disponibles()
+    print(f"Ventas sembradas: {cantidad} | Codificaciones disponibles: {', '.join(codificaciones)}")
+    print(f"{'Endpoint':<40} {'Original':>10} " + ' '.join(f"{c + ' bytes':>11} {c + ' ms':>8}" for c in codificaciones))
+
+    for metodo, ruta, datos in ENDPOINTS:
+        respuesta = cliente.open(ruta, method=metodo, data=datos, headers={'Accept-Encoding': 'identity'})
+        cuerpo = respuesta.get_data()
+        columnas = []
+        for codificacion in codificaciones:
+            # Comprobar la negociación real a través del middleware
+            comprimida = cliente.open(ruta, method=metodo, data=datos, headers={'Accept-Encoding': codificacion})
+            assert comprimida.headers.get('Content-Encoding') in (codificacion, None)
+            tamano, cpu_ms = medir(compresion, cuerpo, codificacion, compresion.NIVELES_POR_DEFECTO[codificacion])
+            columnas.append(f"{tamano:>11} {cpu_ms:>8.2f}")
+        print(f"{metodo + ' ' + ruta[:35]:<40} {len(cuerpo):>10} " + ' '.join(columnas))
+
+
+if __name__ == '__main__':
+    main()
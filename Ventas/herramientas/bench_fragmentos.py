@@ -0,0 +1,49 @@
+# ========================================
+# BENCHMARK DE CACHÉ DE FRAGMENTOS - Carloszerpav
+# ========================================
+# Compara el tiempo de GET / (consultas + Jinja) sin caché y con la
+# caché de fragmentos caliente.
+#
+# Uso (desde la carpeta Ventas):
+#     python -m herramientas.bench_fragmentos [cantidad_ventas]
+
+import sys
+import time
+
+from herramientas.datos_prueba import cargar_app, sembrar_ventas, cliente_autenticado
+
+REPETICIONES = 30
+
+
+def medir_index(cliente):
+    """Devuelve los milisegundos promedio de GET /"""
+    inicio = time.perf_counter()
+    for _ in range(REPETICIONES):
+        respuesta = cliente.get('/', headers={'Accept-Encoding': 'identity'})
+        assert respuesta.status_code == 200
+    return (time.perf_counter() - inicio) * 1000 / REPETICIONES
+
+
+def main():
+    cantidad = int(sys.argv[1]) if len(sys.argv) > 1 else 300
+    modulo_app = cargar_app()
+    sembrar_ventas(modulo_app, cantidad)
+    cliente = cliente_autenticado(modulo_app)
+    cache = modulo_app.cache_fragmentos
+
+    cache.activa = False
+    sin_cache = medir_index(cliente)
+
+    cache.activa = True
+    cache.limpiar()
+    cliente.get('/')  # Calentar la caché
+    con_cache = medir_index(cliente)
+
+    print(f"Ventas sembradas: {cantidad}")
+    print(f"GET / sin caché:         {sin_cache:8.2f} ms")
+    print(f"GET / con caché caliente: {con_cache:8.2f} ms ({sin_cache / con_cache:.1f}x)")
+    print(f"Aciertos/fallos de caché: {cache.aciertos}/{cache.fallos}")
+
+
+if __name__ == '__main__':
+    main()
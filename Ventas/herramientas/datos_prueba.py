@@ -0,0 +1,94 @@
+# ========================================
+# DATOS DE PRUEBA - Carloszerpav
+# ========================================
+# Utilidades compartidas por los benchmarks y verificaciones:
+# levantan la app contra una base SQLite temporal, siembran ventas
+# y devuelven un cliente de pruebas ya autenticado.
+
+import os
+import random
+import sys
+import tempfile
+
+USUARIO_PRUEBA = 'prueba@ventas.local'
+
+
+def cargar_app(ruta_db=None):
+    """
+    Importa app.py apuntando a una base SQLite temporal
+    Args:
+        ruta_db (str): Ruta del archivo SQLite. Si es None, se crea uno temporal
+    Returns:
+        module: El módulo app ya inicializado
+    """
+    if ruta_db is None:
+        descriptor, ruta_db = tempfile.mkstemp(suffix='.db', prefix='ventas_')
+        os.close(descriptor)
+    os.environ['DATABASE_URL'] = f'sqlite:///{ruta_db}'
+    os.environ.setdefault('SECRET_KEY', 'clave-de-pruebas')
+
+    carpeta_app = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    if carpeta_app not in sys.path:
+        sys.path.insert(0, carpeta_app)
+
+    import app as modulo_app
+    modulo_app.app.config['TESTING'] = True
+    return modulo_app
+
+
+def sembrar_ventas(modulo_app, cantidad, usuario_email=USUARIO_PRUEBA, semilla=42):
+    """
+    Crea ventas con rubros y pagos variados para un usuario
+    Args:
+        modulo_app (module): Módulo app devuelto por cargar_app
+        cantidad (int): Número de ventas a crear
+        usuario_email (str): Dueño de las ventas
+        semilla (int): Semilla para que el dataset sea reproducible
+    """
+    aleatorio = random.Random(semilla)
+    with modulo_app.app.app_context():
+        for i in range(cantidad):
+            valor = aleatorio.choice([50000, 80000, 120000, 250000])
+            abono = aleatorio.choice([0, 10000, 20000, valor])
+            rubros = aleatorio.sample(modulo_app.RUBROS, aleatorio.randint(1, 2))
+            fecha = f"2025-{aleatorio.randint(1, 12):02d}-{aleatorio.randint(1, 28):02d}"
+            venta = modulo_app.agregar_venta(usuario_email, f"Cliente {i % 40}", valor, abono, rubros, fecha)
+            if venta['estado'] == 'Activa' and aleatorio.random() < 0.5:
+                modulo_app.registrar_pago(usuario_email, venta['id'], 5000, 'Abono')
+
+
+def cliente_autenticado(modulo_app, usuario_email=USUARIO_PRUEBA):
+    """
+    Devuelve un cliente de pruebas de Flask con la sesión iniciada
+    Args:
+        modulo_app (module): Módulo app devuelto por cargar_app
+        usuario_email (str): Email del usuario a simular
+    Returns:
+        FlaskClient: Cliente listo para hacer peticiones
+    """
+    cliente = modulo_app.app.test_client()
+    with cliente.session_transaction() as sesion:
+        sesion['user'] = {
+            'id': usuario_email,
+            'email': usuario_email,
+            'name': 'Usuario de Prueba',
+            'picture': ''
+        }
+        sesion['_user_id'] = usuario_email
+        sesion['_fresh'] = True
+    return cliente
+
+
+def cookie_sesion(modulo_app, usuario_email=USUARIO_PRUEBA):
+    """
+    Valor firmado de la cookie de sesión de Flask con el usuario ya autenticado
+    Sirve para pedirle a un servidor real (gunicorn, uvicorn) como ese usuario
+    Returns:
+        str: Valor para la cookie SESSION_COOKIE_NAME
+    """
+    serializador = modulo_app.app.session_interface.get_signing_serializer(modulo_app.app)
+    return serializador.dumps({
+        'user': {'id': usuario_email, 'email': usuario_email, 'name': 'Usuario de Prueba', 'picture': ''},
+        '_user_id': usuario_email,
+        '_fresh': True
+    })
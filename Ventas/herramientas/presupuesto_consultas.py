@@ -0,0 +1,199 @@
+# ========================================
+# PRESUPUESTO DE CONSULTAS SQL - Carloszerpav
+# ========================================
+# Llama a cada ruta de app.py con un usuario autenticado y cuenta las
+# sentencias SQL que emite. Cada ruta tiene un presupuesto fijo que no
+# debe depender de cuántas ventas tenga el usuario: si un cambio en una
+# plantilla o en to_dict() vuelve a consultar por cada fila, falla y
+# muestra las consultas culpables.
+#
+# Se mide dos veces, con un dataset chico y otro grande; además del
+# presupuesto, el número de consultas tiene que ser el mismo en ambos.
+#
+# Uso (desde la carpeta Ventas):
+#     python -m herramientas.presupuesto_consultas
+#
+# Devuelve código de salida 1 si alguna ruta se pasa (sirve para CI).
+
+import sys
+import threading
+
+from sqlalchemy import event
+
+from herramientas.datos_prueba import USUARIO_PRUEBA, cargar_app, sembrar_ventas, cliente_autenticado
+
+# Tamaños del dataset. selectinload parte los IN en bloques de 500 IDs,
+# así que el grande se queda por debajo para que la cuenta sea exacta.
+TAMANOS = (30, 300)
+
+# Método, ruta y presupuesto de sentencias SQL por petición (caché de fragmentos desactivada).
+# {venta} es una venta activa, {cerrada} una cerrada, {cliente} el cliente de {cerrada}
+# y {trabajo} un trabajo del usuario.
+PRESUPUESTOS = [
+    ('GET', '/', 5),
+    # La búsqueda filtra en SQL (ilike) y las estadísticas cargan todas las ventas aparte
+    ('GET', '/buscar?q=cliente', 8),
+    ('GET', '/pago/{venta}', 3),
+    ('GET', '/historial/{venta}', 3),
+    ('GET', '/historial/{cerrada}', 4),
+    ('GET', '/cierre-mensual', 4),
+    ('GET', '/ventas-excluidas', 7),
+    ('GET', '/estadisticas-periodo', 0),
+    ('POST', '/estadisticas-periodo', 6),
+    ('GET', '/api/estadisticas', 4),
+    ('GET', '/api/ventas', 6),
+    ('GET', '/api/ventas/cambios', 5),
+    ('GET', '/api/ventas/cambios?desde=1', 6),
+    ('GET', '/api/eventos', 1),
+    ('GET', '/api/fragmentos', 5),
+    ('GET', '/api/estadisticas-periodo?fecha_inicio=2025-01-01&fecha_fin=2025-12-31', 6),
+    ('GET', '/antiguedad-saldos', 1),
+    ('GET', '/api/antiguedad-saldos', 1),
+    ('GET', '/api/clientes/deudores', 1),
+    ('GET', '/cliente/{cliente}', 7),
+    ('GET', '/api/trabajos', 1),
+    ('GET', '/api/trabajos/{trabajo}', 1),
+    ('POST', '/agregar', 14),
+    ('POST', '/pago/{venta}', 12),
+    ('GET', '/eliminar/{venta}', 11),
+    ('GET', '/privacy', 0),
+    ('GET', '/terms', 0),
+]
+
+# Cuerpo de los formularios POST
+FORMULARIOS = {
+    '/estadisticas-periodo': {'fecha_inicio': '2025-01-01', 'fecha_fin': '2025-12-31'},
+    # Cliente ya existente, para no contar su alta
+    '/agregar': {'cliente': 'Cliente 1', 'valor_total': '90000', 'abono': '10000',
+                 'rubros': ['Zapatos', 'Accesorios'], 'fecha': '2025-06-15'},
+    '/pago/{venta}': {'monto_pago': '1000', 'tipo_pago': 'Abono'},
+}
+
+
+class ContadorConsultas:
+    """
+    Registra las sentencias SQL que emite el hilo actual
+    Los trabajos en segundo plano y el bus de eventos corren en otros hilos y no cuentan
+    """
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.sentencias = []
+        self._hilo = None
+
+    def _registrar(self, conexion, cursor, sentencia, parametros, contexto, executemany):
+        if threading.get_ident() == self._hilo:
+            self.sentencias.append(sentencia)
+
+    def __enter__(self):
+        self.sentencias = []
+        self._hilo = threading.get_ident()
+        event.listen(self.engine, 'before_cursor_execute', self._registrar)
+        return self
+
+    def __exit__(self, *exc):
+        event.remove(self.engine, 'before_cursor_execute', self._registrar)
+
+
+def preparar_datos(modulo_app, cantidad, semilla):
+    """
+    Siembra ventas, cierra y archiva un mes y deja ventas cerradas pendientes de cierre
+    """
+    sembrar_ventas(modulo_app, cantidad * 4 // 5, semilla=semilla)
+    with modulo_app.app.app_context():
+        # Cierre antiguo: excluye las cerradas y las manda al archivo
+        modulo_app.cerrar_mes_estadisticas(USUARIO_PRUEBA, 1, 2025)
+    sembrar_ventas(modulo_app, cantidad - cantidad * 4 // 5, semilla=semilla + 1)
+
+
+def crear_trabajo(modulo_app):
+    """Deja un trabajo terminado para medir /api/trabajos/<id> sin lanzar nada en segundo plano"""
+    with modulo_app.app.app_context():
+        trabajo = modulo_app.Trabajo(
+            usuario_email=USUARIO_PRUEBA,
+            tipo='cierre_mensual',
+            parametros='{}',
+            clave_idempotencia=modulo_app.secrets.token_hex(16),
+            estado='Completado',
+            progreso=100,
+            creado_en=modulo_app._ahora()
+        )
+        modulo_app.db.session.add(trabajo)
+        modulo_app.db.session.commit()
+        return trabajo.id
+
+
+def ids_ventas(modulo_app):
+    """Una venta activa y una archivada reales para completar las rutas"""
+    with modulo_app.app.app_context():
+        Venta = modulo_app.Venta
+        venta = Venta.query.filter_by(usuario_email=USUARIO_PRUEBA, estado='Activa').order_by(Venta.id).first()
+        cerrada = modulo_app.VentaArchivada.query.filter_by(usuario_email=USUARIO_PRUEBA).first()
+        # El cliente de una venta archivada también tiene ventas activas: se miden ambas tablas
+        return {'venta': venta.id, 'cerrada': cerrada.id if cerrada else venta.id,
+                'cliente': cerrada.cliente_id if cerrada else venta.cliente_id}
+
+
+def medir_rutas(modulo_app, cliente, contador):
+    """
+    Ejecuta todas las rutas del presupuesto
+    Returns:
+        dict: (método, ruta) -> lista de sentencias SQL
+    """
+    resultados = {}
+    trabajo = crear_trabajo(modulo_app)
+    for metodo, plantilla, _ in PRESUPUESTOS:
+        # Después de /eliminar la venta ya no existe: se buscan los IDs antes de cada ruta
+        ruta = plantilla.format(trabajo=trabajo, **ids_ventas(modulo_app))
+        datos = FORMULARIOS.get(plantilla)
+        with contador:
+            if metodo == 'POST':
+                respuesta = cliente.post(ruta, data=datos)
+            else:
+                respuesta = cliente.get(ruta, buffered=plantilla != '/api/eventos')
+            respuesta.close()
+        if respuesta.status_code >= 400:
+            raise RuntimeError(f"{metodo} {ruta} respondió {respuesta.status_code}")
+        resultados[(metodo, plantilla)] = list(contador.sentencias)
+    return resultados
+
+
+def main():
+    modulo_app = cargar_app()
+    # Se mide el peor caso: sin fragmentos en caché
+    modulo_app.cache_fragmentos.activa = False
+    cliente = cliente_autenticado(modulo_app)
+    with modulo_app.app.app_context():
+        contador = ContadorConsultas(modulo_app.db.engine)
+
+    mediciones = []
+    sembradas = 0
+    for i, tamano in enumerate(TAMANOS):
+        preparar_datos(modulo_app, tamano - sembradas, semilla=42 + i * 10)
+        sembradas = tamano
+        mediciones.append(medir_rutas(modulo_app, cliente, contador))
+
+    fallos = 0
+    print(f"{'Ruta':<67} " + ' '.join(f"{t:>6}" for t in TAMANOS) + "  Presupuesto")
+    for metodo, plantilla, presupuesto in PRESUPUESTOS:
+        clave = (metodo, plantilla)
+        cuentas = [len(m[clave]) for m in mediciones]
+        excedido = max(cuentas) > presupuesto
+        crece = len(set(cuentas)) > 1
+        marca = '❌' if excedido or crece else '✅'
+        print(f"{marca} {metodo:<4} {plantilla:<60}" + ' '.join(f"{c:>6}" for c in cuentas) + f"  {presupuesto:>6}")
+        if excedido or crece:
+            fallos += 1
+            motivo = 'supera el presupuesto' if excedido else 'crece con el número de ventas'
+            print(f"   {motivo}; consultas con {TAMANOS[-1]} ventas:")
+            for sentencia in mediciones[-1][clave]:
+                print(f"     - {' '.join(sentencia.split())[:200]}")
+
+    if fallos:
+        print(f"\n❌ {fallos} ruta(s) fuera de presupuesto")
+        sys.exit(1)
+    print(f"\n✅ Todas las rutas dentro del presupuesto ({len(PRESUPUESTOS)} comprobadas)")
+
+
+if __name__ == '__main__':
+    main()
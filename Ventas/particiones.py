@@ -0,0 +1,161 @@
+# ========================================
+# PARTICIONES POR USUARIO - Carloszerpav
+# ========================================
+# Modo opcional (PARTICIONES=1) en el que cada usuario tiene su propia
+# base de datos para sus ventas, pagos, rubros, archivo y versión de
+# datos. Así los recorridos de una cuenta grande no frenan a las demás.
+#
+# La base se resuelve a partir del usuario en curso:
+#   - en una petición, el usuario que inició sesión
+#   - en un trabajo en segundo plano, el dueño del trabajo
+#   - en código propio, con `with particiones.inquilino(email):`
+#
+# Las tablas compartidas (trabajos, eventos, registro de inquilinos)
+# siguen en la base principal. Por defecto cada inquilino es un archivo
+# SQLite en PARTICIONES_DIR; con PARTICIONES_URL se puede usar cualquier
+# URL con `{inquilino}`, p. ej. una base de PostgreSQL por usuario.
+
+import hashlib
+import os
+import re
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from sqlalchemy import create_engine, inspect as sa_inspect
+from sqlalchemy.sql.util import find_tables
+
+_inquilino_actual = ContextVar('inquilino_actual', default=None)
+
+
+def nombre_inquilino(usuario_email):
+    """
+    Nombre seguro para archivos/bases a partir del email
+    Ej.: 'ana.perez@gmail.com' -> 'ana_perez_gmail_com_3f2a9c1b0d'
+    """
+    email = usuario_email.strip().lower()
+    legible = re.sub(r'[^a-z0-9]+', '_', email).strip('_')[:40]
+    resumen = hashlib.sha1(email.encode('utf-8')).hexdigest()[:10]
+    return f"{legible}_{resumen}"
+
+
+class Particiones:
+    """
+    Enrutador de inquilinos: una base de datos por usuario para las tablas particionadas
+    Se configura desde app.py; mientras no se active, no cambia nada
+    """
+
+    def __init__(self):
+        self.activa = False
+        self.tablas = frozenset()
+        self.url_plantilla = None
+        self.max_engines = 128
+        self._preparar = None
+        self._engines = OrderedDict()
+        self._lock = threading.Lock()
+
+    def configurar(self, url_plantilla, tablas, preparar=None, max_engines=128):
+        """
+        Args:
+            url_plantilla (str): URL con '{inquilino}', p. ej. 'sqlite:////datos/ventas_{inquilino}.db'
+            tablas (iterable): Nombres de las tablas que viven en la base de cada inquilino
+            preparar (callable): preparar(usuario_email, engine) al abrir una base por primera vez
+            max_engines (int): Engines abiertos a la vez; los menos usados se cierran
+        """
+        self.activa = True
+        self.url_plantilla = url_plantilla
+        self.tablas = frozenset(tablas)
+        self._preparar = preparar
+        self.max_engines = max_engines
+
+    # ----- Inquilino en curso -----
+
+    def actual(self):
+        return _inquilino_actual.get()
+
+    def fijar(self, usuario_email):
+        """Fija el inquilino del contexto actual; devuelve el token para restablecer"""
+        return _inquilino_actual.set(usuario_email.strip().lower() if usuario_email else None)
+
+    def restablecer(self, token):
+        _inquilino_actual.reset(token)
+
+    @contextmanager
+    def inquilino(self, usuario_email):
+        """Ejecuta un bloque con las tablas particionadas apuntando a la base del usuario"""
+        token = self.fijar(usuario_email)
+        try:
+            yield
+        finally:
+            self.restablecer(token)
+
+    # ----- Engines por inquilino -----
+
+    def url_para(self, usuario_email):
+        return self.url_plantilla.format(inquilino=nombre_inquilino(usuario_email))
+
+    def engine_para(self, usuario_email):
+        """
+        Engine de la base del usuario; la crea y prepara la primera vez
+        Returns:
+            Engine: Engine de SQLAlchemy
+        """
+        email = usuario_email.strip().lower()
+        with self._lock:
+            engine = self._engines.get(email)
+            if engine is not None:
+                self._engines.move_to_end(email)
+                return engine
+
+        engine = create_engine(self.url_para(email))
+        if self._preparar:
+            self._preparar(email, engine)
+
+        with self._lock:
+            # Otro hilo pudo abrirla mientras la preparábamos
+            existente = self._engines.get(email)
+            if existente is not None:
+                engine.dispose()
+                return existente
+            self._engines[email] = engine
+            while len(self._engines) > self.max_engines:
+                _, viejo = self._engines.popitem(last=False)
+                viejo.dispose()
+        return engine
+
+    def engine_actual(self, mapper=None, clause=None):
+        """
+        Engine del inquilino en curso si la consulta toca tablas particionadas
+        Returns:
+            Engine: Engine del inquilino o None para usar el enrutado normal
+        """
+        email = _inquilino_actual.get()
+        if not self.activa or email is None:
+            return None
+        if mapper is not None:
+            tablas = [sa_inspect(mapper).local_table]
+        elif clause is not None:
+            tablas = find_tables(clause, include_crud=True)
+        else:
+            return None
+        if any(getattr(tabla, 'name', None) in self.tablas for tabla in tablas):
+            return self.engine_para(email)
+        return None
+
+    def cerrar(self):
+        """Cierra todos los engines de inquilinos (pruebas, apagado)"""
+        with self._lock:
+            for engine in self._engines.values():
+                engine.dispose()
+            self._engines.clear()
+
+
+# Instancia única; app.py la activa con PARTICIONES=1
+particiones = Particiones()
+
+
+def url_sqlite_por_defecto(directorio):
+    """Plantilla de URL para un archivo SQLite por inquilino dentro de un directorio"""
+    os.makedirs(directorio, exist_ok=True)
+    return f"sqlite:///{os.path.abspath(directorio)}/ventas_{{inquilino}}.db"
@@ -0,0 +1,210 @@
+# ========================================
+# PERFILADOR BAJO DEMANDA - Carloszerpav
+# ========================================
+# Cuando una cuenta va lenta en producción no siempre se puede
+# reproducir en local. Con PERFILADOR=1 un administrador puede pedir
+# que se perfile UNA petición (encabezado `X-Perfilar: 1` o `?perfilar=1`)
+# y se guardan:
+#
+#   <nombre>.prof    estadísticas de cProfile (pstats, snakeviz...)
+#   <nombre>.folded  pilas muestreadas en formato "a;b;c cantidad"
+#                    (flamegraph.pl, speedscope, inferno)
+#   <nombre>.json    ruta, usuario, duración y tiempos de SQL
+#
+# Las peticiones que no lo piden no pasan por cProfile, ni por el hilo
+# de muestreo, ni por los listeners de SQLAlchemy.
+
+import cProfile
+import json
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# Extensiones que genera cada perfil
+EXTENSIONES = ('.prof', '.folded', '.json')
+
+
+class CapturaPerfil:
+    """
+    Perfil de una petición: cProfile determinista, muestreo de pilas y tiempos de SQL
+    Se cronometran las consultas de todos los engines (principal, réplicas e inquilinos)
+    Args:
+        intervalo_muestreo (float): Segundos entre muestras de la pila
+    """
+
+    def __init__(self, intervalo_muestreo=0.002):
+        self.intervalo_muestreo = intervalo_muestreo
+        self.perfil = cProfile.Profile()
+        self.muestras = Counter()
+        self.consultas = []  # (sentencia, milisegundos, base)
+        self.duracion_ms = 0.0
+        self._hilo = threading.get_ident()
+        self._parar = threading.Event()
+        self._muestreador = None
+        self._inicio = 0.0
+        self._inicio_sql = None
+
+    def iniciar(self):
+        # Listeners en la clase Engine (todas las bases); filtran por hilo: solo cuentan
+        # las consultas de esta petición
+        event.listen(Engine, 'before_cursor_execute', self._antes_sql)
+        event.listen(Engine, 'after_cursor_execute', self._despues_sql)
+        self._muestreador = threading.Thread(target=self._muestrear, name='perfilador', daemon=True)
+        self._muestreador.start()
+        self._inicio = time.perf_counter()
+        self.perfil.enable()
+        return self
+
+    def terminar(self):
+        self.perfil.disable()
+        self.duracion_ms = (time.perf_counter() - self._inicio) * 1000
+        self._parar.set()
+        self._muestreador.join()
+        event.remove(Engine, 'before_cursor_execute', self._antes_sql)
+        event.remove(Engine, 'after_cursor_execute', self._despues_sql)
+
+    def _antes_sql(self, conexion, cursor, sentencia, parametros, contexto, executemany):
+        if threading.get_ident() == self._hilo:
+            self._inicio_sql = time.perf_counter()
+
+    def _despues_sql(self, conexion, cursor, sentencia, parametros, contexto, executemany):
+        if threading.get_ident() == self._hilo and self._inicio_sql is not None:
+            base = conexion.engine.url.database or conexion.engine.url.host
+            self.consultas.append((sentencia, (time.perf_counter() - self._inicio_sql) * 1000, base))
+            self._inicio_sql = None
+
+    def _muestrear(self):
+        while not self._parar.wait(self.intervalo_muestreo):
+            marco = sys._current_frames().get(self._hilo)
+            pila = []
+            while marco is not None:
+                codigo = marco.f_code
+                pila.append(f"{os.path.basename(codigo.co_filename)}:{codigo.co_name}")
+                marco = marco.f_back
+            if pila:
+                self.muestras[';'.join(reversed(pila))] += 1
+
+    def resumen_sql(self, mas_lentas=10):
+        """
+        Totales de SQL de la petición
+        Returns:
+            dict: Cantidad de consultas, tiempo total y las más lentas
+        """
+        ordenadas = sorted(self.consultas, key=lambda c: c[1], reverse=True)
+        por_base = Counter(base for _, _, base in self.consultas)
+        return {
+            'consultas': len(self.consultas),
+            'tiempo_ms': round(sum(ms for _, ms, _ in self.consultas), 2),
+            'por_base': dict(por_base),
+            'mas_lentas': [
+                {'sql': ' '.join(sentencia.split())[:500], 'ms': round(ms, 2), 'base': base}
+                for sentencia, ms, base in ordenadas[:mas_lentas]
+            ]
+        }
+
+
+class Perfilador:
+    """
+    Decide qué peticiones se perfilan y guarda los resultados en disco
+    Args:
+        directorio (str): Carpeta donde se guardan los perfiles
+        admins (set): Emails autorizados a pedir un perfil
+        max_perfiles (int): Perfiles que se conservan; los más viejos se borran
+        intervalo_muestreo (float): Segundos entre muestras de la pila
+    """
+
+    def __init__(self, directorio, admins, max_perfiles=50, intervalo_muestreo=0.002):
+        self.directorio = directorio
+        self.admins = {email.strip().lower() for email in admins if email.strip()}
+        self.max_perfiles = max_perfiles
+        self.intervalo_muestreo = intervalo_muestreo
+        os.makedirs(directorio, exist_ok=True)
+
+    @staticmethod
+    def solicitado(request):
+        """True si la petición pide ser perfilada (encabezado o parámetro)"""
+        return request.headers.get('X-Perfilar') == '1' or request.args.get('perfilar') == '1'
+
+    def autorizado(self, usuario_email):
+        return bool(usuario_email) and usuario_email.lower() in self.admins
+
+    def iniciar(self):
+        return CapturaPerfil(self.intervalo_muestreo).iniciar()
+
+    def guardar(self, captura, metadatos):
+        """
+        Escribe los tres archivos del perfil
+        Args:
+            captura (CapturaPerfil): Captura ya terminada
+            metadatos (dict): Ruta, método, usuario, estado...
+        Returns:
+            str: Nombre base del perfil (sin extensión)
+        """
+        ahora = datetime.now()
+        nombre = f"{ahora:%Y%m%d-%H%M%S}-{ahora.microsecond:06d}-{metadatos.get('endpoint') or 'ruta'}"
+        base = os.path.join(self.directorio, nombre)
+
+        captura.perfil.dump_stats(base + '.prof')
+        with open(base + '.folded', 'w', encoding='utf-8') as archivo:
+            for pila, cantidad in captura.muestras.most_common():
+                archivo.write(f"{pila} {cantidad}\n")
+
+        datos = dict(metadatos)
+        datos.update({
+            'nombre': nombre,
+            'fecha': ahora.strftime("%Y-%m-%d %H:%M:%S"),
+            'duracion_ms': round(captura.duracion_ms, 2),
+            'muestras': sum(captura.muestras.values()),
+            'sql': captura.resumen_sql(),
+        })
+        with open(base + '.json', 'w', encoding='utf-8') as archivo:
+            json.dump(datos, archivo, ensure_ascii=False, indent=2)
+
+        self._podar()
+        return nombre
+
+    def listar(self):
+        """
+        Metadatos de los perfiles guardados, del más reciente al más viejo
+        Returns:
+            list: Un dict por perfil
+        """
+        perfiles = []
+        for archivo in sorted(os.listdir(self.directorio), reverse=True):
+            if not archivo.endswith('.json'):
+                continue
+            try:
+                with open(os.path.join(self.directorio, archivo), encoding='utf-8') as f:
+                    perfiles.append(json.load(f))
+            except (OSError, ValueError):
+                continue
+        return perfiles
+
+    def ruta_archivo(self, nombre):
+        """
+        Ruta de un archivo del perfil si existe ('<nombre>.prof', '.folded' o '.json')
+        Returns:
+            str: Ruta absoluta o None si el nombre no es válido
+        """
+        extension = os.path.splitext(nombre)[1]
+        if extension not in EXTENSIONES or os.path.basename(nombre) != nombre:
+            return None
+        ruta = os.path.join(self.directorio, nombre)
+        return ruta if os.path.isfile(ruta) else None
+
+    def _podar(self):
+        if not self.max_perfiles:
+            return
+        nombres = sorted(a[:-5] for a in os.listdir(self.directorio) if a.endswith('.json'))
+        for nombre in nombres[:-self.max_perfiles]:
+            for extension in EXTENSIONES:
+                try:
+                    os.remove(os.path.join(self.directorio, nombre + extension))
+                except OSError:
+                    pass
@@ -0,0 +1,175 @@
+# ========================================
+# REGISTRO ESTRUCTURADO (LOGS) - Carloszerpav
+# ========================================
+# Reemplaza los print() de las rutas más usadas por logs en JSON, una
+# línea por evento, que Railway puede filtrar y buscar.
+#
+# Los hilos de las peticiones solo meten el registro en una cola
+# (QueueHandler); un único hilo (QueueListener) lo formatea y escribe en
+# stdout, así una escritura lenta nunca frena una petición.
+#
+# Cada registro lleva el id de petición, usuario, ruta y duración
+# cuando se emite dentro de una petición. Se puede fijar el nivel por
+# módulo y muestrear los eventos de mucho volumen.
+
+import atexit
+import copy
+import json
+import logging
+import logging.handlers
+import queue
+import random
+import sys
+import time
+from datetime import datetime
+
+from flask import g, has_request_context, request
+
+# Logger raíz de la aplicación; los módulos cuelgan de él (ventas.pagos, ventas.auth...)
+RAIZ = 'ventas'
+
+# Atributos estándar de LogRecord: todo lo demás se considera un campo extra
+_ATRIBUTOS_ESTANDAR = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime', 'taskName'}
+
+_escucha = None
+
+
+class FiltroContexto(logging.Filter):
+    """
+    Agrega al registro los datos de la petición en curso
+    Corre en el hilo de la petición, antes de que el registro entre a la cola
+    """
+
+    def filter(self, registro):
+        if has_request_context():
+            registro.id_peticion = getattr(g, 'id_peticion', None)
+            registro.ruta = request.path
+            registro.metodo = request.method
+            if not hasattr(registro, 'usuario'):
+                registro.usuario = _usuario_actual()
+            inicio = getattr(g, 'inicio_peticion', None)
+            if inicio is not None and not hasattr(registro, 'duracion_ms'):
+                registro.duracion_ms = round((time.perf_counter() - inicio) * 1000, 2)
+        return True
+
+
+class FiltroMuestreo(logging.Filter):
+    """
+    Deja pasar solo una fracción de los registros de ciertos loggers
+    Los WARNING o más graves pasan siempre
+    Args:
+        tasas (dict): Nombre de logger -> fracción que se conserva (0.0 a 1.0)
+    """
+
+    def __init__(self, tasas):
+        super().__init__()
+        self.tasas = tasas
+
+    def filter(self, registro):
+        if registro.levelno >= logging.WARNING or not self.tasas:
+            return True
+        nombre = registro.name
+        while nombre:
+            if nombre in self.tasas:
+                return random.random() < self.tasas[nombre]
+            nombre = nombre.rpartition('.')[0]
+        return True
+
+
+class ManejadorCola(logging.handlers.QueueHandler):
+    """
+    QueueHandler que deja el mensaje resuelto y la traza como texto
+    (el original mezcla la traza dentro del mensaje)
+    """
+
+    def prepare(self, registro):
+        registro = copy.copy(registro)
+        registro.msg = registro.getMessage()
+        registro.args = None
+        if registro.exc_info:
+            registro.excepcion = logging.Formatter().formatException(registro.exc_info)
+            registro.exc_info = None
+            registro.exc_text = None
+        return registro
+
+
+class FormateadorJSON(logging.Formatter):
+    """Una línea JSON por registro, con los campos extra al mismo nivel"""
+
+    def format(self, registro):
+        datos = {
+            'ts': datetime.fromtimestamp(registro.created).strftime("%Y-%m-%d %H:%M:%S.%f")[:-3],
+            'nivel': registro.levelname,
+            'logger': registro.name,
+            'mensaje': registro.getMessage(),
+        }
+        for clave, valor in vars(registro).items():
+            if clave not in _ATRIBUTOS_ESTANDAR and valor is not None:
+                datos[clave] = valor
+        if registro.exc_info:
+            datos['excepcion'] = self.formatException(registro.exc_info)
+        return json.dumps(datos, ensure_ascii=False, default=str)
+
+
+def _usuario_actual():
+    # Importación diferida: el registro también se usa fuera de Flask-Login
+    from flask_login import current_user
+    try:
+        return current_user.email if current_user.is_authenticated else None
+    except Exception:
+        return None
+
+
+def _leer_pares(texto, convertir):
+    """Convierte 'a=1,b=2' en {'a': convertir('1'), 'b': convertir('2')}"""
+    pares = {}
+    for parte in (texto or '').split(','):
+        nombre, _, valor = parte.partition('=')
+        if nombre.strip() and valor.strip():
+            pares[nombre.strip()] = convertir(valor.strip())
+    return pares
+
+
+def configurar_registro(nivel='INFO', niveles_modulo='', muestreo='', salida=None):
+    """
+    Configura el logger 'ventas' con cola, JSON, niveles por módulo y muestreo
+    Args:
+        nivel (str): Nivel general (DEBUG, INFO, WARNING...)
+        niveles_modulo (str): Niveles por logger, p. ej. 'ventas.auth=DEBUG,ventas.peticiones=WARNING'
+        muestreo (str): Fracción que se conserva por logger, p. ej. 'ventas.peticiones=0.1'
+        salida: Stream donde se escribe (stdout por defecto)
+    Returns:
+        logging.Logger: El logger raíz de la aplicación
+    """
+    global _escucha
+    raiz = logging.getLogger(RAIZ)
+    if _escucha is not None:
+        _escucha.stop()
+        for manejador in list(raiz.handlers):
+            raiz.removeHandler(manejador)
+
+    raiz.setLevel(nivel.upper())
+    raiz.propagate = False
+    for nombre, nivel_modulo in _leer_pares(niveles_modulo, str.upper).items():
+        logging.getLogger(nombre).setLevel(nivel_modulo)
+
+    cola = queue.SimpleQueue()
+    manejador_cola = ManejadorCola(cola)
+    manejador_cola.addFilter(FiltroMuestreo(_leer_pares(muestreo, float)))
+    manejador_cola.addFilter(FiltroContexto())
+    raiz.addHandler(manejador_cola)
+
+    manejador_salida = logging.StreamHandler(salida or sys.stdout)
+    manejador_salida.setFormatter(FormateadorJSON())
+    _escucha = logging.handlers.QueueListener(cola, manejador_salida, respect_handler_level=True)
+    _escucha.start()
+    return raiz
+
+
+@atexit.register
+def detener_registro():
+    """Vacía la cola antes de salir para no perder los últimos registros"""
+    global _escucha
+    if _escucha is not None:
+        _escucha.stop()
+        _escucha = None
@@ -0,0 +1,172 @@
+# ========================================
+# RÉPLICAS DE LECTURA - Carloszerpav
+# ========================================
+# Las escrituras (agregar venta, registrar pago, cierre...) van siempre
+# a la base principal. Las rutas marcadas con @solo_lectura mandan sus
+# SELECT a una réplica, así los recorridos pesados de estadísticas no
+# compiten con las escrituras.
+#
+# - Leer lo propio: si el usuario escribió hace menos de la ventana
+#   configurada, sus lecturas siguen en la principal (la réplica puede
+#   ir unos segundos atrasada).
+# - Réplica caída: se comprueba cada pocos segundos; si no responde, las
+#   lecturas vuelven a la principal hasta que se recupere. La comprobación
+#   tiene tiempo máximo y la hace un solo hilo; los demás siguen con el
+#   último estado conocido en vez de esperar a una réplica colgada.
+
+import logging
+import random
+import threading
+import time
+from functools import wraps
+
+from flask import g, has_request_context, session
+from flask_sqlalchemy.session import Session
+from sqlalchemy import text
+from sqlalchemy.sql import Select
+
+from particiones import particiones
+
+log_replicas = logging.getLogger('ventas.replicas')
+
+# Clave en la cookie de sesión con la hora de la última escritura del usuario
+CLAVE_ULTIMA_ESCRITURA = 'ultima_escritura'
+
+
+class EnrutadorLecturas:
+    """
+    Elige la réplica para cada petición de solo lectura
+    Args:
+        replicas (list): Bind keys de SQLALCHEMY_BINDS que son réplicas
+        ventana_escritura (float): Segundos que un usuario lee de la principal tras escribir
+        intervalo_salud (float): Segundos entre comprobaciones de cada réplica
+        consulta_salud (str): SELECT que debe responder una réplica sana
+        tiempo_maximo_salud (float): Segundos que puede tardar la consulta de salud (PostgreSQL)
+    """
+
+    def __init__(self, replicas=(), ventana_escritura=5.0, intervalo_salud=10.0, consulta_salud='SELECT 1',
+                 tiempo_maximo_salud=2.0):
+        self.configurar(replicas, ventana_escritura, intervalo_salud, consulta_salud, tiempo_maximo_salud)
+        self._lock = threading.Lock()
+
+    def configurar(self, replicas, ventana_escritura=5.0, intervalo_salud=10.0, consulta_salud='SELECT 1',
+                   tiempo_maximo_salud=2.0):
+        self.replicas = list(replicas)
+        self.ventana_escritura = ventana_escritura
+        self.intervalo_salud = intervalo_salud
+        self.consulta_salud = consulta_salud
+        self.tiempo_maximo_salud = tiempo_maximo_salud
+        self.lecturas_replica = 0
+        self.lecturas_principal = 0
+        self._salud = {}  # bind key -> (sana, hora de la comprobación)
+        self._revisando = set()  # bind keys con una comprobación en curso
+
+    def disponible(self, nombre, engine):
+        """
+        True si la réplica respondió en la última comprobación (se repite cada intervalo_salud)
+        Mientras un hilo comprueba, los demás usan el último resultado (o la principal si no hay)
+        """
+        ahora = time.monotonic()
+        with self._lock:
+            sana, revisada = self._salud.get(nombre, (None, 0.0))
+            if sana is not None and ahora - revisada < self.intervalo_salud:
+                return sana
+            if nombre in self._revisando:
+                return bool(sana)
+            self._revisando.add(nombre)
+        anterior, sana = sana, False
+        try:
+            sana = self._comprobar(engine)
+        except Exception as e:
+            if anterior is not False:
+                log_replicas.warning("Réplica no disponible, leyendo de la principal",
+                                     extra={'evento': 'replica_caida', 'replica': nombre, 'detalle': str(e)})
+        finally:
+            with self._lock:
+                self._salud[nombre] = (sana, time.monotonic())
+                self._revisando.discard(nombre)
+        return sana
+
+    def _comprobar(self, engine):
+        # El tiempo de conexión lo limita connect_timeout (ver SQLALCHEMY_BINDS en app.py)
+        with engine.connect() as conexion:
+            if engine.dialect.name == 'postgresql':
+                conexion.execute(text(f"SET LOCAL statement_timeout = {int(self.tiempo_maximo_salud * 1000)}"))
+            conexion.execute(text(self.consulta_salud))
+        return True
+
+    def contar_lectura(self, replica):
+        """Suma una lectura servida por una réplica (True) o por la principal (False)"""
+        # Varios hilos leen a la vez: += sin lock puede perder cuentas
+        with self._lock:
+            if replica:
+                self.lecturas_replica += 1
+            else:
+                self.lecturas_principal += 1
+
+    def elegir(self, engines):
+        """
+        Réplica para la petición en curso
+        Returns:
+            str: Bind key de una réplica sana, o None para usar la principal
+        """
+        sanas = [n for n in self.replicas if n in engines and self.disponible(n, engines[n])]
+        return random.choice(sanas) if sanas else None
+
+
+# Instancia única; app.py la configura con las URLs de DATABASE_REPLICA_URLS
+enrutador = EnrutadorLecturas()
+
+
+def solo_lectura(vista):
+    """Decorador para rutas que solo leen: sus SELECT pueden ir a una réplica"""
+    @wraps(vista)
+    def envoltura(*args, **kwargs):
+        g.lectura_replica = True
+        return vista(*args, **kwargs)
+    return envoltura
+
+
+def escribio_recientemente():
+    ultima = session.get(CLAVE_ULTIMA_ESCRITURA)
+    return ultima is not None and time.time() - ultima < enrutador.ventana_escritura
+
+
+def marcar_escritura():
+    """Guarda en la sesión del usuario la hora de su última escritura (ver after_request en app.py)"""
+    session[CLAVE_ULTIMA_ESCRITURA] = time.time()
+
+
+class SesionEnrutada(Session):
+    """
+    Sesión de Flask-SQLAlchemy que manda los SELECT de rutas @solo_lectura a una réplica
+    Todo lo demás (flush, UPDATE, DELETE, trabajos en segundo plano) usa la principal
+    Con PARTICIONES=1, las tablas de cada usuario van primero a la base de su inquilino
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and particiones.activa:
+            engine = particiones.engine_actual(mapper, clause)
+            if engine is not None:
+                if has_request_context() and not isinstance(clause, Select):
+                    g.hubo_escritura = True
+                return engine
+        if bind is None and has_request_context():
+            if isinstance(clause, Select):
+                replica = self._replica_de_la_peticion()
+                if replica is not None:
+                    enrutador.contar_lectura(True)
+                    return self._db.engines[replica]
+                enrutador.contar_lectura(False)
+            else:
+                # flush o sentencia de escritura: el usuario debe leer lo suyo desde la principal
+                g.hubo_escritura = True
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+    def _replica_de_la_peticion(self):
+        if not enrutador.replicas or not g.get('lectura_replica') or g.get('hubo_escritura'):
+            return None
+        if 'replica' not in g:
+            # Una sola réplica por petición para que todas las lecturas vean el mismo estado
+            g.replica = None if escribio_recientemente() else enrutador.elegir(self._db.engines)
+        return g.replica
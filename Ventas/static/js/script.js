@@ -22,6 +22,9 @@ document.addEventListener('DOMContentLoaded', function() {
     
     // Inicializar header colapsable
     initCollapsibleHeader();
+    
+    // Inicializar actualizaciones en vivo
+    initEventosEnVivo();
 });
 
 // ========================================
@@ -766,3 +769,516 @@ function initMobileKeyboardOptimizations() {
 document.addEventListener('DOMContentLoaded', function() {
     initMobileKeyboardOptimizations();
 });
+
+// ========================================
+// ACTUALIZACIONES EN VIVO - Carloszerpav
+// ========================================
+// Si registro un pago desde el celular, el portátil lo ve sin recargar.
+// El servidor manda eventos por /api/eventos (Server-Sent Events) y aquí
+// parcheo la tabla al momento; las tarjetas y los rubros se piden ya
+// renderizados a /api/fragmentos (salen de la caché del servidor).
+
+function initEventosEnVivo() {
+    // Solo en el dashboard y si el navegador soporta SSE
+    if (!document.querySelector('.stats-section') || !window.EventSource) return;
+    
+    const enBusqueda = window.location.pathname === '/buscar';
+    let fuente;
+    let ultimoEventoId = '';
+    let refrescoTimeout;
+    let refrescarTabla = false;
+    
+    // Varios eventos seguidos (p. ej. cierre de mes) se agrupan en un solo pedido
+    function programarRefresco(incluirTabla) {
+        refrescarTabla = refrescarTabla || incluirTabla;
+        clearTimeout(refrescoTimeout);
+        refrescoTimeout = setTimeout(() => {
+            const conTabla = refrescarTabla && !enBusqueda;
+            refrescarTabla = false;
+            refrescarFragmentos(conTabla);
+        }, 300);
+    }
+    
+    function conectar() {
+        const url = ultimoEventoId ? `/api/eventos?ultimo_id=${ultimoEventoId}` : '/api/eventos';
+        fuente = new EventSource(url);
+        
+        fuente.addEventListener('venta_agregada', function(e) {
+            ultimoEventoId = e.lastEventId;
+            const datos = JSON.parse(e.data);
+            if (!document.querySelector(`tr[data-venta-id="${datos.venta.id}"]`)) {
+                programarRefresco(true);
+            }
+        });
+        
+        fuente.addEventListener('pago_registrado', function(e) {
+            ultimoEventoId = e.lastEventId;
+            const datos = JSON.parse(e.data);
+            actualizarFilaVenta(datos.venta);
+            programarRefresco(false);
+        });
+        
+        fuente.addEventListener('venta_cerrada', function(e) {
+            ultimoEventoId = e.lastEventId;
+            quitarFilaVenta(JSON.parse(e.data).venta_id);
+            programarRefresco(false);
+        });
+        
+        fuente.addEventListener('venta_eliminada', function(e) {
+            ultimoEventoId = e.lastEventId;
+            quitarFilaVenta(JSON.parse(e.data).venta_id);
+            programarRefresco(false);
+        });
+        
+        fuente.addEventListener('mes_cerrado', function(e) {
+            ultimoEventoId = e.lastEventId;
+            programarRefresco(false);
+        });
+        
+        // Si la conexión se corta, EventSource reconecta solo y recupera lo perdido con Last-Event-ID.
+        // Si el servidor responde 503 (worker con demasiados flujos) EventSource se rinde: reintentar aquí
+        fuente.onerror = function() {
+            if (fuente.readyState === EventSource.CLOSED) {
+                setTimeout(conectar, 15000 + Math.random() * 5000);
+            }
+        };
+    }
+    
+    conectar();
+    window.addEventListener('beforeunload', () => fuente.close());
+}
+
+function actualizarFilaVenta(venta) {
+    const fila = document.querySelector(`tr[data-venta-id="${venta.id}"]`);
+    if (!fila) return;
+    
+    const abono = fila.querySelector('[data-campo="abono"]');
+    const pendiente = fila.querySelector('[data-campo="saldo_pendiente"]');
+    const pagos = fila.querySelector('[data-campo="total_pagos"]');
+    
+    if (abono) abono.textContent = formatearMonto(venta.abono);
+    if (pendiente) {
+        pendiente.textContent = formatearMonto(venta.saldo_pendiente);
+        pendiente.classList.toggle('pending', venta.saldo_pendiente > 0);
+    }
+    if (pagos) pagos.textContent = venta.total_pagos;
+    
+    // Resaltar brevemente la fila actualizada
+    fila.style.transition = 'background-color 0.6s ease';
+    fila.style.backgroundColor = 'rgba(102, 126, 234, 0.15)';
+    setTimeout(() => {
+        fila.style.backgroundColor = '';
+    }, 1200);
+}
+
+function quitarFilaVenta(ventaId) {
+    const fila = document.querySelector(`tr[data-venta-id="${ventaId}"]`);
+    if (!fila) return;
+    fila.style.transition = 'opacity 0.4s ease';
+    fila.style.opacity = '0';
+    setTimeout(() => fila.remove(), 400);
+}
+
+function refrescarFragmentos(conTabla) {
+    fetch('/api/fragmentos', { headers: { 'Accept': 'application/json' } })
+        .then(respuesta => respuesta.ok ? respuesta.json() : null)
+        .then(fragmentos => {
+            if (!fragmentos) return;
+            const estadisticas = document.querySelector('.stats-section');
+            const rubros = document.querySelector('.rubros-stats');
+            const tabla = document.getElementById('tabla-ventas');
+            if (estadisticas) estadisticas.innerHTML = fragmentos.estadisticas;
+            if (rubros) rubros.innerHTML = fragmentos.rubros;
+            if (conTabla && tabla) tabla.innerHTML = fragmentos.tabla;
+        })
+        .catch(error => console.error('Error al refrescar el dashboard:', error));
+}
+
+// Mismo formato que formatear_moneda en app.py ($1,234.56)
+function formatearMonto(valor) {
+    return '$' + Number(valor).toLocaleString('en-US', {
+        minimumFractionDigits: 2,
+        maximumFractionDigits: 2
+    });
+}
+
+// ========================================
+// MODO SIN CONEXIÓN - Carloszerpav
+// ========================================
+// En ferias y mercados la señal va y viene. El service worker (/sw.js)
+// guarda la app para que abra sin red; aquí guardo las ventas activas en
+// IndexedDB y, si no hay conexión, las ventas y pagos nuevos quedan en
+// una cola. Al volver la red se mandan todos juntos a /api/sincronizar;
+// cada operación lleva una clave única para que nunca se aplique dos veces.
+// Con la señal a medias navigator.onLine sigue en true: los formularios se
+// mandan con fetch y, si no contesta a tiempo, la operación va a la cola.
+
+const BASE_SIN_CONEXION = 'ventas-sin-conexion';
+const MAX_LOTE_SINCRONIZACION = 100;  // Igual que SINCRONIZACION_MAX_LOTE en app.py
+const TIEMPO_MAXIMO_ENVIO = 10000;    // ms que se espera al servidor antes de encolar
+const REINTENTO_COLA = 30000;         // ms para reintentar la cola si se encoló con conexión
+let enviandoCola = false;
+
+function initModoSinConexion() {
+    if (!('serviceWorker' in navigator) || !window.indexedDB) return;
+    
+    navigator.serviceWorker.register('/sw.js')
+        .catch(error => console.error('No se pudo registrar el service worker:', error));
+    
+    interceptarFormularios();
+    
+    // Al cerrar sesión se borran los datos guardados en este navegador
+    document.querySelectorAll('a[href="/logout"]').forEach(enlace => {
+        enlace.addEventListener('click', function(e) {
+            e.preventDefault();
+            cerrarSesionSinConexion(this.href);
+        });
+    });
+    
+    window.addEventListener('online', function() {
+        showNotification('Conexión recuperada, sincronizando...', 'info');
+        enviarCola();
+    });
+    window.addEventListener('offline', function() {
+        showNotification('Sin conexión: las ventas y pagos se guardarán en este dispositivo', 'warning');
+    });
+    
+    if (navigator.onLine) {
+        enviarCola().then(() => sincronizarVentasLocales());
+    } else {
+        pintarTablaSinConexion();
+    }
+}
+
+// ----- IndexedDB -----
+
+function abrirBaseLocal() {
+    return new Promise((resolve, reject) => {
+        const pedido = indexedDB.open(BASE_SIN_CONEXION, 1);
+        pedido.onupgradeneeded = function() {
+            const base = pedido.result;
+            base.createObjectStore('ventas', { keyPath: 'id' });   // Ventas activas del usuario
+            base.createObjectStore('cola', { keyPath: 'clave' });  // Operaciones sin enviar
+            base.createObjectStore('meta');                        // Token de sincronización
+        };
+        pedido.onsuccess = () => resolve(pedido.result);
+        pedido.onerror = () => reject(pedido.error);
+    });
+}
+
+// Ejecuta trabajo(almacenes) en una transacción y resuelve cuando termina
+function conAlmacenes(nombres, modo, trabajo) {
+    return abrirBaseLocal().then(base => new Promise((resolve, reject) => {
+        const transaccion = base.transaction(nombres, modo);
+        const almacenes = {};
+        nombres.forEach(nombre => { almacenes[nombre] = transaccion.objectStore(nombre); });
+        let resultado;
+        Promise.resolve(trabajo(almacenes)).then(valor => { resultado = valor; });
+        transaccion.oncomplete = () => { base.close(); resolve(resultado); };
+        transaccion.onerror = () => { base.close(); reject(transaccion.error); };
+    }));
+}
+
+function leerTodo(almacen) {
+    return new Promise((resolve, reject) => {
+        const pedido = almacen.getAll();
+        pedido.onsuccess = () => resolve(pedido.result);
+        pedido.onerror = () => reject(pedido.error);
+    });
+}
+
+function leerUno(almacen, clave) {
+    return new Promise((resolve, reject) => {
+        const pedido = almacen.get(clave);
+        pedido.onsuccess = () => resolve(pedido.result);
+        pedido.onerror = () => reject(pedido.error);
+    });
+}
+
+// ----- Ventas guardadas en el dispositivo -----
+
+function sincronizarVentasLocales() {
+    return conAlmacenes(['meta'], 'readonly', almacenes => leerUno(almacenes.meta, 'token'))
+        .then(token => fetch(`/api/ventas/cambios?desde=${token || 0}`, { headers: { 'Accept': 'application/json' } }))
+        .then(respuesta => respuesta.ok ? respuesta.json() : null)
+        .then(cambios => {
+            if (!cambios) return;
+            return conAlmacenes(['ventas', 'meta'], 'readwrite', almacenes => {
+                if (cambios.completo) almacenes.ventas.clear();
+                cambios.ventas.forEach(venta => {
+                    // Solo se guardan las activas: son las que pueden recibir pagos
+                    if (venta.estado === 'Activa') {
+                        almacenes.ventas.put(venta);
+                    } else {
+                        almacenes.ventas.delete(venta.id);
+                    }
+                });
+                cambios.eliminadas.forEach(id => almacenes.ventas.delete(id));
+                almacenes.meta.put(cambios.token, 'token');
+            });
+        })
+        .catch(error => console.error('Error al guardar las ventas en el dispositivo:', error));
+}
+
+// ----- Cola de operaciones -----
+
+function nuevaClave() {
+    if (window.crypto && crypto.randomUUID) return crypto.randomUUID();
+    return `${Date.now()}-${Math.random().toString(16).slice(2)}`;
+}
+
+function encolarOperacion(tipo, datos, clave) {
+    const operacion = { clave: clave || nuevaClave(), tipo: tipo, datos: datos, creada: new Date().toISOString() };
+    return conAlmacenes(['cola'], 'readwrite', almacenes => {
+        almacenes.cola.put(operacion);
+    }).then(() => operacion);
+}
+
+function enviarCola() {
+    if (enviandoCola || !navigator.onLine) return Promise.resolve();
+    enviandoCola = true;
+    
+    return conAlmacenes(['cola'], 'readonly', almacenes => leerTodo(almacenes.cola))
+        .then(cola => {
+            if (!cola.length) return null;
+            // En el orden en que se hicieron: un pago puede depender de la venta anterior
+            cola.sort((a, b) => a.creada.localeCompare(b.creada));
+            const lote = cola.slice(0, MAX_LOTE_SINCRONIZACION).map(op => ({ clave: op.clave, tipo: op.tipo, datos: op.datos }));
+            return fetch('/api/sincronizar', {
+                method: 'POST',
+                headers: { 'Content-Type': 'application/json', 'Accept': 'application/json' },
+                body: JSON.stringify({ operaciones: lote })
+            })
+                .then(respuesta => respuesta.ok ? respuesta.json() : null)
+                .then(respuesta => {
+                    if (!respuesta) return null;
+                    // Solo se quitan las que el servidor contestó; el resto se reintenta
+                    return conAlmacenes(['cola'], 'readwrite', almacenes => {
+                        respuesta.resultados.forEach(resultado => {
+                            if (resultado.clave) almacenes.cola.delete(resultado.clave);
+                        });
+                    }).then(() => ({ respuesta: respuesta, quedan: cola.length - lote.length }));
+                });
+        })
+        .then(envio => {
+            if (!envio) return;
+            const resultados = envio.respuesta.resultados;
+            const aplicadas = resultados.filter(r => r.estado === 'aplicada').length;
+            const rechazadas = resultados.filter(r => r.estado === 'rechazada');
+            if (aplicadas) {
+                showNotification(`${aplicadas} operación(es) hechas sin conexión sincronizadas`, 'success');
+            }
+            rechazadas.forEach(r => showNotification(`Operación no aplicada: ${r.error}`, 'error'));
+            refrescarFragmentos(true);
+            enviandoCola = false;
+            return envio.quedan > 0 ? enviarCola() : sincronizarVentasLocales();
+        })
+        .catch(error => console.error('Error al sincronizar la cola:', error))
+        .finally(() => { enviandoCola = false; });
+}
+
+// ----- Formularios sin conexión -----
+
+function interceptarFormularios() {
+    const formVenta = document.querySelector('.venta-form');
+    const formPago = document.querySelector('.pago-form');
+    
+    if (formVenta) {
+        formVenta.addEventListener('submit', function(e) {
+            // Si otra validación ya frenó el envío, no hacer nada
+            if (e.defaultPrevented) return;
+            e.preventDefault();
+            const datos = new FormData(formVenta);
+            const venta = {
+                cliente: datos.get('cliente'),
+                valor_total: datos.get('valor_total'),
+                abono: datos.get('abono'),
+                fecha: datos.get('fecha'),
+                rubros: datos.getAll('rubros')
+            };
+            enviarOperacion('agregar', venta, clave => encolarOperacion('agregar', venta, clave).then(() => {
+                showNotification('Venta guardada en el dispositivo; se enviará al volver la conexión', 'warning');
+                formVenta.reset();
+                pintarTablaSinConexion();
+                return true;
+            }));
+        });
+    }
+    
+    if (formPago) {
+        formPago.addEventListener('submit', function(e) {
+            if (e.defaultPrevented) return;
+            e.preventDefault();
+            const ventaId = parseInt(formPago.getAttribute('action').split('/').pop(), 10);
+            const datos = new FormData(formPago);
+            const pago = { venta_id: ventaId, monto_pago: datos.get('monto_pago'), tipo_pago: datos.get('tipo_pago') || 'Abono' };
+            enviarOperacion('pago', pago, clave => encolarPago(ventaId, pago.monto_pago, pago.tipo_pago, clave)
+                .then(encolado => { if (encolado) window.location.href = '/'; return encolado; }));
+        });
+    }
+}
+
+// Manda una operación a /api/sincronizar. Sin red, si la red falla o si el
+// servidor no contesta en TIEMPO_MAXIMO_ENVIO se llama a encolar con la misma
+// clave: si el primer envío sí llegó, el servidor no la aplica otra vez
+function enviarOperacion(tipo, datos, encolar) {
+    const clave = nuevaClave();
+    const encolarYReintentar = () => encolar(clave).then(encolado => {
+        if (encolado && navigator.onLine) setTimeout(enviarCola, REINTENTO_COLA);
+    });
+    if (!navigator.onLine) return encolar(clave);
+    
+    const control = new AbortController();
+    const espera = setTimeout(() => control.abort(), TIEMPO_MAXIMO_ENVIO);
+    return fetch('/api/sincronizar', {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json', 'Accept': 'application/json' },
+        body: JSON.stringify({ operaciones: [{ clave: clave, tipo: tipo, datos: datos }] }),
+        signal: control.signal
+    })
+        .then(respuesta => {
+            if (!respuesta.ok) throw new Error(`HTTP ${respuesta.status}`);
+            return respuesta.json();
+        })
+        .then(respuesta => {
+            const resultado = respuesta.resultados[0];
+            if (resultado.estado === 'rechazada') {
+                showNotification(`Operación no aplicada: ${resultado.error}`, 'error');
+                return;
+            }
+            window.location.href = '/';
+        }, error => {
+            console.error('Envío fallido, se guarda en el dispositivo:', error);
+            return encolarYReintentar();
+        })
+        .finally(() => clearTimeout(espera));
+}
+
+function encolarPago(ventaId, monto, tipoPago, clave) {
+    const valor = parseFloat(monto);
+    return conAlmacenes(['ventas'], 'readonly', almacenes => leerUno(almacenes.ventas, ventaId))
+        .then(venta => {
+            if (!(valor > 0)) {
+                showNotification('El monto del pago debe ser mayor a 0', 'error');
+                return false;
+            }
+            if (venta && valor > venta.saldo_pendiente) {
+                showNotification('El monto del pago no puede ser mayor al saldo pendiente', 'error');
+                return false;
+            }
+            return encolarOperacion('pago', { venta_id: ventaId, monto_pago: monto, tipo_pago: tipoPago || 'Abono' }, clave)
+                .then(() => {
+                    showNotification('Pago guardado en el dispositivo; se enviará al volver la conexión', 'warning');
+                    return true;
+                });
+        });
+}
+
+// ----- Dashboard sin conexión -----
+
+function escaparHtml(texto) {
+    const div = document.createElement('div');
+    div.textContent = texto == null ? '' : String(texto);
+    return div.innerHTML;
+}
+
+function pintarTablaSinConexion() {
+    const tabla = document.getElementById('tabla-ventas');
+    if (!tabla || window.location.pathname !== '/') return;
+    
+    conAlmacenes(['ventas', 'cola'], 'readonly', almacenes =>
+        Promise.all([leerTodo(almacenes.ventas), leerTodo(almacenes.cola)])
+    ).then(([ventas, cola]) => {
+        // Los pagos encolados se descuentan ya del saldo mostrado
+        const pagosPendientes = {};
+        cola.filter(op => op.tipo === 'pago').forEach(op => {
+            pagosPendientes[op.datos.venta_id] = (pagosPendientes[op.datos.venta_id] || 0) + parseFloat(op.datos.monto_pago);
+        });
+        
+        const filasPendientes = cola.filter(op => op.tipo === 'agregar').map(op => {
+            const total = parseFloat(op.datos.valor_total) || 0;
+            const abono = parseFloat(op.datos.abono) || 0;
+            return filaSinConexion({
+                id: null, cliente: op.datos.cliente, valor_total: total, abono: abono,
+                saldo_pendiente: Math.max(total - abono, 0), total_pagos: abono > 0 ? 1 : 0,
+                rubros: op.datos.rubros, fecha: op.datos.fecha
+            }, true);
+        });
+        
+        const filas = ventas.sort((a, b) => b.id - a.id).map(venta => {
+            const pendiente = pagosPendientes[venta.id] || 0;
+            return filaSinConexion(Object.assign({}, venta, {
+                abono: venta.abono + pendiente,
+                saldo_pendiente: Math.max(venta.saldo_pendiente - pendiente, 0)
+            }), pendiente > 0);
+        });
+        
+        tabla.innerHTML = `
+            <div class="table-container">
+                <table class="ventas-table">
+                    <thead>
+                        <tr>
+                            <th>ID</th><th>Cliente</th><th>Valor Total</th><th>Abonado</th>
+                            <th>Pendiente</th><th>Pagos</th><th>Rubros</th><th>Fecha</th><th>Acciones</th>
+                        </tr>
+                    </thead>
+                    <tbody>${filasPendientes.concat(filas).join('')}</tbody>
+                </table>
+            </div>`;
+        
+        tabla.querySelectorAll('.btn-pay[data-venta-id]').forEach(boton => {
+            boton.addEventListener('click', function(e) {
+                e.preventDefault();
+                const monto = prompt('Monto del pago:');
+                if (monto === null) return;
+                encolarPago(parseInt(this.dataset.ventaId, 10), monto, 'Abono')
+                    .then(encolado => { if (encolado) pintarTablaSinConexion(); });
+            });
+        });
+    }).catch(error => console.error('Error al leer las ventas del dispositivo:', error));
+}
+
+function filaSinConexion(venta, pendienteDeEnvio) {
+    const rubros = (venta.rubros || []).map(rubro => `<span class="tag">${escaparHtml(rubro)}</span>`).join('');
+    const estilo = pendienteDeEnvio ? ' style="opacity: 0.7;" title="Pendiente de sincronizar"' : '';
+    const pagar = venta.id && venta.saldo_pendiente > 0
+        ? `<a href="/pago/${venta.id}" class="btn-pay" data-venta-id="${venta.id}" title="Registrar pago"><i class="fas fa-credit-card"></i></a>`
+        : '';
+    return `
+        <tr class="venta-row"${venta.id ? ` data-venta-id="${venta.id}"` : ''}${estilo}>
+            <td>${venta.id ? '#' + venta.id : '<i class="fas fa-clock"></i>'}</td>
+            <td>${escaparHtml(venta.cliente)}</td>
+            <td class="amount">${formatearMonto(venta.valor_total)}</td>
+            <td class="amount">${formatearMonto(venta.abono)}</td>
+            <td class="amount ${venta.saldo_pendiente > 0 ? 'pending' : ''}">${formatearMonto(venta.saldo_pendiente)}</td>
+            <td><span class="pagos-count">${venta.total_pagos || 0}</span></td>
+            <td><div class="rubros-tags">${rubros}</div></td>
+            <td>${escaparHtml(venta.fecha)}</td>
+            <td><div class="action-buttons">${pagar}</div></td>
+        </tr>`;
+}
+
+// ----- Cierre de sesión -----
+
+function cerrarSesionSinConexion(destino) {
+    conAlmacenes(['cola'], 'readonly', almacenes => leerTodo(almacenes.cola))
+        .then(cola => {
+            if (cola.length && !confirm(`Hay ${cola.length} operación(es) sin sincronizar que se perderán. ¿Cerrar sesión igual?`)) {
+                return false;
+            }
+            if (navigator.serviceWorker.controller) {
+                navigator.serviceWorker.controller.postMessage('limpiar');
+            }
+            return new Promise(resolve => {
+                const pedido = indexedDB.deleteDatabase(BASE_SIN_CONEXION);
+                pedido.onsuccess = pedido.onerror = pedido.onblocked = () => resolve(true);
+            });
+        })
+        .catch(() => true)
+        .then(salir => { if (salir) window.location.href = destino; });
+}
+
+// Inicializar modo sin conexión (después de las validaciones del formulario)
+document.addEventListener('DOMContentLoaded', function() {
+    initModoSinConexion();
+});
@@ -0,0 +1,101 @@
+// ========================================
+// SERVICE WORKER - Carloszerpav
+// ========================================
+// Hace que la app abra aunque no haya señal (ferias, mercados):
+// - Estilos, scripts, íconos y fuentes: se sirven de la caché y se
+//   actualizan por detrás para la próxima visita.
+// - Páginas (dashboard, pago): primero la red; sin red, la última copia.
+// - Las escrituras (ventas y pagos) no pasan por aquí: script.js las
+//   encola en IndexedDB y las envía juntas a /api/sincronizar.
+// Al cambiar algo de este archivo, subir VERSION para descartar cachés viejas.
+
+const VERSION = 'ventas-v1';
+const CACHE_ESTATICOS = `${VERSION}-estaticos`;
+const CACHE_PAGINAS = `${VERSION}-paginas`;
+
+// Esqueleto de la app que se guarda al instalar
+const ARCHIVOS_BASE = [
+    '/static/css/style.css',
+    '/static/js/script.js',
+    '/static/manifest.webmanifest',
+    '/static/img/icono.svg'
+];
+
+// Rutas que nunca se guardan en caché (datos en vivo, sesión, el propio service worker)
+const SIN_CACHE = ['/api/', '/auth/', '/login', '/logout', '/sw.js', '/eliminar/'];
+
+self.addEventListener('install', evento => {
+    evento.waitUntil(
+        caches.open(CACHE_ESTATICOS)
+            .then(cache => cache.addAll(ARCHIVOS_BASE))
+            .then(() => self.skipWaiting())
+    );
+});
+
+self.addEventListener('activate', evento => {
+    evento.waitUntil(
+        caches.keys()
+            .then(nombres => Promise.all(
+                nombres.filter(nombre => !nombre.startsWith(VERSION)).map(nombre => caches.delete(nombre))
+            ))
+            .then(() => self.clients.claim())
+    );
+});
+
+self.addEventListener('fetch', evento => {
+    const pedido = evento.request;
+    if (pedido.method !== 'GET') return;
+
+    const url = new URL(pedido.url);
+    const mismoOrigen = url.origin === self.location.origin;
+    if (mismoOrigen && SIN_CACHE.some(ruta => url.pathname.startsWith(ruta))) return;
+
+    if (pedido.mode === 'navigate') {
+        evento.respondWith(paginaRedPrimero(pedido));
+    } else if (!mismoOrigen || url.pathname.startsWith('/static/')) {
+        evento.respondWith(cacheConActualizacion(pedido));
+    }
+});
+
+// Al cerrar sesión, script.js pide borrar las páginas guardadas (tienen datos del usuario)
+self.addEventListener('message', evento => {
+    if (evento.data === 'limpiar') {
+        evento.waitUntil(caches.delete(CACHE_PAGINAS));
+    }
+});
+
+function paginaRedPrimero(pedido) {
+    return fetch(pedido)
+        .then(respuesta => {
+            // No guardar redirecciones al login ni errores
+            if (respuesta.ok && !respuesta.redirected) {
+                const copia = respuesta.clone();
+                caches.open(CACHE_PAGINAS).then(cache => cache.put(pedido, copia));
+            }
+            return respuesta;
+        })
+        .catch(() => caches.open(CACHE_PAGINAS).then(cache =>
+            // Sin copia de esa página, el dashboard (pinta las ventas desde IndexedDB)
+            cache.match(pedido, { ignoreSearch: true }).then(guardada => guardada || cache.match('/'))
+        ))
+        .then(respuesta => respuesta || new Response(
+            '<h1>Sin conexión</h1><p>Abre la app una vez con internet para usarla sin conexión.</p>',
+            { status: 503, headers: { 'Content-Type': 'text/html; charset=utf-8' } }
+        ));
+}
+
+function cacheConActualizacion(pedido) {
+    return caches.open(CACHE_ESTATICOS).then(cache =>
+        cache.match(pedido).then(guardada => {
+            const deRed = fetch(pedido)
+                .then(respuesta => {
+                    if (respuesta.ok || respuesta.type === 'opaque') {
+                        cache.put(pedido, respuesta.clone());
+                    }
+                    return respuesta;
+                })
+                .catch(() => guardada);
+            return guardada || deRed;
+        })
+    );
+}